@@ -13,14 +13,11 @@ from dash.exceptions import PreventUpdate
 from dash.long_callback import DiskcacheLongCallbackManager
 import dash_bootstrap_components as dbc
 from DB_validation import *
+from DB_customers import load_customers, customer_options
 
 # Reading excel file and creating a list of options for dropdown menu
-cust_details = pd.read_excel('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
-options_c = []
-for cust in cust_details.customer:
-    label = cust_details.loc[cust_details.customer == cust, "customer"].item()
-    value = cust_details.loc[cust_details.customer == cust, "short_name"].item()
-    options_c.append({'label': label, 'value': value})
+cust_details = load_customers('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
+options_c = customer_options(cust_details)
 
 ## Diskcache
 cache = diskcache.Cache("./cache")
@@ -8,11 +8,8 @@ import dash_html_components as html
 import dash_table as dt
 import dash_bootstrap_components as dbc
 import pandas as pd
-from sklearn import tree
-import xlsxwriter
 from datetime import datetime
 from datetime import timedelta
-from scipy import stats
 import plotly.graph_objs as go
 import os
 import numpy as np
@@ -24,14 +21,11 @@ import datetime
 import io
 from datetime import date
 from DB_validation import *
+from DB_customers import load_customers, customer_options
 
 # Reading excel file and creating a list of options for dropdown menu
-cust_details = pd.read_excel('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
-options_c = []
-for cust in cust_details.customer:
-    label = cust_details.loc[cust_details.customer == cust, "customer"].item()
-    value = cust_details.loc[cust_details.customer == cust, "short_name"].item()
-    options_c.append({'label': label, 'value': value})
+cust_details = load_customers('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
+options_c = customer_options(cust_details)
 
 
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
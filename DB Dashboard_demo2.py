@@ -1,7 +1,6 @@
 from platform import node
 from tabnanny import check
 from xml.dom import WRONG_DOCUMENT_ERR
-from dataclasses_json import Undefined
 import plotly
 import dash
 from dash import no_update, dcc, html
@@ -11,11 +10,8 @@ from dash.exceptions import PreventUpdate
 from dash.long_callback import DiskcacheLongCallbackManager
 import dash_bootstrap_components as dbc
 import pandas as pd
-from sklearn import tree
-import xlsxwriter
 from datetime import datetime
 from datetime import timedelta
-from scipy import stats
 import plotly.graph_objs as go
 import os
 import numpy as np
@@ -27,15 +23,12 @@ import datetime
 import io
 from datetime import date
 from DB_validation import *
+from DB_customers import load_customers, customer_options
 
 
 # Reading excel file and creating a list of options for dropdown menu
-cust_details = pd.read_excel('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
-options_c = []
-for cust in cust_details.customer:
-    label = cust_details.loc[cust_details.customer == cust, "customer"].item()
-    value = cust_details.loc[cust_details.customer == cust, "short_name"].item()
-    options_c.append({'label': label, 'value': value})
+cust_details = load_customers('C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Customers DB validation/cust_details.xlsx')
+options_c = customer_options(cust_details)
 
 
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
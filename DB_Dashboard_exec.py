@@ -1,3 +1,6 @@
+import time
+#Start of the application, initialization time is printed before the server is started
+startup_start = time.perf_counter()
 import os
 import numpy as np
 import pandas as pd
@@ -10,21 +13,18 @@ from dash.dependencies import Input, Output
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from DB_validation import *
+from DB_customers import load_customers, customer_options
 
 import logging
 import json
 import os
-import requests
 import re
-import time
 from datetime import datetime
 import pandas as pd
 import numpy as np
 from getpass import getpass
 #from progress.bar import IncrementalBar
-from tqdm import tqdm
-import numba
-from numba import jit
+# requests is imported only by the functions of Analyst API, so the dashboard starts without it
 
 
 # SPecial function for token retrieving, or saving in case it's valid
@@ -45,6 +45,7 @@ def retrieveTokenAnalyst(username = 'user1',
                          password = 'password',
                          API = 'measurements',
                          logger_name = ''): 
+    import requests
     # Setting proper logger
     logger = logging.getLogger(logger_name)
     
@@ -90,6 +91,7 @@ def getListOfPointsAnalyst(customer = 'customer',
                            pageSize = 5000, 
                            pageNumber = 1,
                            logger_name = ''):
+    import requests
     # Setting proper logger
     logger = logging.getLogger(logger_name)
     
@@ -141,14 +143,16 @@ path_dir = os.path.dirname(sys.executable)
 path_dir = path_dir.replace(os.sep, '/')
 path_data = path_dir + '/data/'
 # Reading excel file and creating a list of options for dropdown menu
-cust_details = pd.read_excel(path_data + 'cust_details.xlsx')
-options_c = []
-for cust in cust_details.customer:
-    label = cust_details.loc[cust_details.customer == cust, "customer"].item()
-    value = cust_details.loc[cust_details.customer == cust, "short_name"].item()
-    options_c.append({'label': label, 'value': value})
+cust_details = load_customers(path_data + 'cust_details.xlsx')
+options_c = customer_options(cust_details)
 
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+
+#Lightweight route for the launcher: server answers it as soon as it accepts requests
+@app.server.route('/health')
+def health():
+    return 'OK'
+
 app.layout = html.Div([
     dcc.Store(id='db-data-memory', data = None),
     dcc.Store(id='issues_memory', data = None),
@@ -996,4 +1000,6 @@ def filter_table(table_data, switcher):
 
 
 if __name__ == '__main__':
+    #Time until the server answers is measured by the launcher polling /health
+    print(f'Dashboard is initialized in {time.perf_counter() - startup_start:.2f} s')
     app.run_server(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# diskcache is optional. It's needed only when several worker processes of the server share the cache
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+# psutil is optional, it's used to find locks of killed processes on Windows
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Figures and layout fragments of the Stat tab per customer. Key contains version of the
+# data file, so changed data is never taken from the cache. Least recently used customers
+# are evicted when total size is above DB_FIGURE_CACHE_MB megabytes.
+FIGURE_CACHE_MB = float(os.environ.get('DB_FIGURE_CACHE_MB', '64'))
+# Worker processes of production server (gunicorn/waitress) don't share memory. When
+# DB_SHARED_CACHE_DIR is set parsed hierarchies, figures and issue tables are kept in the disk
+# cache in this folder, so any worker can use results computed by another one. Least recently
+# used entries are evicted when the cache is above DB_SHARED_CACHE_MB megabytes.
+SHARED_CACHE_DIR = os.environ.get('DB_SHARED_CACHE_DIR', '')
+SHARED_CACHE_MB = float(os.environ.get('DB_SHARED_CACHE_MB', '2048'))
+# Concurrent requests of the same computation (same customer and version of the data) wait
+# for the first one and get its result. Results are kept DB_FLIGHT_RESULT_TTL seconds.
+# Only DB_MAX_HEAVY heavy computations (audits) are done at once, the others wait in a queue.
+# Locks of crashed or cancelled computations expire after DB_FLIGHT_TIMEOUT seconds.
+MAX_HEAVY = int(os.environ.get('DB_MAX_HEAVY', '2'))
+FLIGHT_RESULT_TTL = float(os.environ.get('DB_FLIGHT_RESULT_TTL', '600'))
+FLIGHT_TIMEOUT = float(os.environ.get('DB_FLIGHT_TIMEOUT', '1800'))
+
+_lock = threading.Lock()
+_fragments = OrderedDict()
+_sizes = {}
+_total = 0
+_shared = None
+# Computations in progress in this process: {key: {'event': Event, 'done': bool, 'result': result}}
+_flights = {}
+_heavy = threading.BoundedSemaphore(MAX_HEAVY)
+
+def shared_cache():
+    #Disk cache shared by the worker processes. None when it's not configured.
+    #Cache is opened on first use, so it's never inherited by forked workers
+    global _shared
+    with _lock:
+        if _shared is None and SHARED_CACHE_DIR and diskcache is not None:
+            _shared = diskcache.Cache(SHARED_CACHE_DIR,
+                                      size_limit = int(SHARED_CACHE_MB*1024*1024),
+                                      eviction_policy = 'least-recently-used')
+        return _shared
+
+def configure_shared(directory = ''):
+    #Folder of the shared cache when it's not set by DB_SHARED_CACHE_DIR
+    global SHARED_CACHE_DIR
+    if not SHARED_CACHE_DIR:
+        SHARED_CACHE_DIR = directory
+
+def get_shared(key = None):
+    #Value from the shared cache or None if it's missing or cache is not configured
+    cache = shared_cache()
+    if cache is None:
+        return None
+    return cache.get(key)
+
+def set_shared(key = None, value = None, expire = None):
+    cache = shared_cache()
+    if cache is not None:
+        cache.set(key, value, expire = expire)
+
+def _alive(pid):
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name == 'nt':
+        #os.kill terminates the process on Windows, so without psutil the owner is expected to be alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _acquire(cache, keys = []):
+    #Taking one of the lock keys in the shared cache. Value of the key is (process id, token),
+    #so locks of processes killed during the computation (cancelled jobs) are taken over at once.
+    #Returns (key, token) for _release
+    token = (os.getpid(), uuid.uuid4().hex)
+    while True:
+        for key in keys:
+            if cache.add(key, token, expire = FLIGHT_TIMEOUT):
+                return key, token
+            owner = cache.get(key)
+            if owner is not None and not _alive(owner[0]):
+                _release(cache, key, owner)
+        time.sleep(0.05)
+
+def _release(cache, key = None, token = None):
+    with cache.transact():
+        if cache.get(key) == token:
+            cache.delete(key)
+
+def compute_heavy(compute = None):
+    #Limiting number of heavy computations in all processes (shared cache) or in this process
+    cache = shared_cache()
+    if cache is None:
+        with _heavy:
+            return compute()
+    key, token = _acquire(cache, [('heavy', i) for i in range(MAX_HEAVY)])
+    try:
+        return compute()
+    finally:
+        _release(cache, key, token)
+
+def single_flight(key = (), compute = None, heavy = False, expire = FLIGHT_RESULT_TTL, logger = ''):
+    #Result of compute() for the key. Only one computation for the key is done at once,
+    #concurrent calls wait for it and get the same result. With shared cache it works across
+    #worker processes and the result is kept in the cache for expire seconds (None - forever).
+    #If the computation fails, the error is raised in its caller and waiting calls try again.
+    #Results are kept in the shared cache as (result,), so None is also a finished result
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    key = ('single-flight',) + tuple(key)
+    while True:
+        stored = get_shared(key)
+        if stored is not None:
+            return stored[0]
+        with _lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = {'event': threading.Event(), 'done': False, 'result': None}
+        if not leader:
+            log.info('Waiting for the same computation started by other request', extra = {'key': str(key)})
+            flight['event'].wait()
+            if flight['done']:
+                return flight['result']
+            continue
+        try:
+            cache = shared_cache()
+            if cache is None:
+                result = compute_heavy(compute) if heavy else compute()
+            else:
+                #Other worker process can compute the same key, its result is taken after the lock
+                lock, token = _acquire(cache, [('lock',) + key])
+                try:
+                    stored = cache.get(key)
+                    if stored is None:
+                        stored = (compute_heavy(compute) if heavy else compute(),)
+                        cache.set(key, stored, expire = expire)
+                    result = stored[0]
+                finally:
+                    _release(cache, lock, token)
+            flight['result'] = result
+            flight['done'] = True
+            return result
+        finally:
+            with _lock:
+                del _flights[key]
+            flight['event'].set()
+
+def data_version(filename = ''):
+    #Version of the data file: modification time and size
+    stat = os.stat(filename)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def fragments_size(fragments = {}):
+    #Approximate size of the cached fragments in bytes
+    size = 0
+    for value in fragments.values():
+        if isinstance(value, pd.DataFrame):
+            size += int(value.memory_usage(deep = True).sum())
+        elif isinstance(value, (str, bytes)):
+            size += len(value)
+        elif isinstance(value, (dict, list)):
+            size += len(json.dumps(value, default = str))
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+def cache_fragments(key = None, fragments = {}):
+    set_shared(('fragments',) + tuple(key), fragments)
+    _remember(key, fragments)
+
+def _remember(key = None, fragments = {}):
+    global _total
+    size = fragments_size(fragments)
+    with _lock:
+        if key in _fragments:
+            _total -= _sizes.pop(key)
+            del _fragments[key]
+        _fragments[key] = fragments
+        _sizes[key] = size
+        _total += size
+        #The newest fragments are kept even if they alone are above the limit
+        while _total > FIGURE_CACHE_MB*1024*1024 and len(_fragments) > 1:
+            old_key, _ = _fragments.popitem(last = False)
+            _total -= _sizes.pop(old_key)
+
+def get_fragments(key = None):
+    #Cached fragments or None. Fragments created by other worker processes are taken
+    #from the shared cache and kept in memory of this process
+    with _lock:
+        if key in _fragments:
+            _fragments.move_to_end(key)
+            return _fragments[key]
+    fragments = get_shared(('fragments',) + tuple(key))
+    if fragments is not None:
+        _remember(key, fragments)
+    return fragments
+
+def clear_fragments():
+    global _total
+    with _lock:
+        _fragments.clear()
+        _sizes.clear()
+        _total = 0
@@ -0,0 +1,510 @@
+import re
+import logging
+import numpy as np
+import pandas as pd
+from DB_instrumentation import instrument
+from DB_logging import names_sample
+from DB_tree import build_tree_index, ancestors
+
+# Checks of the audit which run in worker processes of DB_executor. Workers import only
+# this module, so it must not have side effects on import (no app, logger files or data).
+
+# The best option will be to feed list of unique values to this function
+@instrument()
+def check_names(mp_names = [], logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    #Validation of input
+    if not isinstance(mp_names, list):
+        log.error(f'Check names recieved wrong data structure. Accepted structure: list')
+        return None
+    
+    # Checking for regular vibration points
+    regex_vibr = '^((MA)|(MI)|(ME)|(OS)|(TO)|(DV)|(OI))?( |^)\d{2}(A|H|V|R)(A|T|V|S|B|P|G|D|(E1)|(E2)|(E3)|(E4)) ?.*? ?((DE)|(NDE))? ?(.{1,})?$'
+    r = re.compile(regex_vibr)
+    good_list = list(filter(r.match, mp_names))
+    log.info('Names checked for vibration patterns.', extra={'point_names': names_sample(good_list)})
+    first_rejected = list(set(mp_names) - set(good_list))
+    if len(first_rejected) > 0:
+        log.warning('DB contains names with wrong naming conventions', extra= {'checked_list': names_sample(mp_names), 'wrong_names': names_sample(first_rejected)})
+    else:
+        log.info('All points have names according naming conventions')
+    
+    # Checking for MI SIT
+    regex_misit = 'M(I|A) SIT'
+    r_sit = re.compile(regex_misit)
+    misit_list = list(filter(r_sit.match, first_rejected))
+    log.info('Names checked for SIT points patterns', extra={'point_names': names_sample(misit_list)})
+    second_rejected = list(set(first_rejected) - set(misit_list))
+    if len(second_rejected)>0:
+        log.warning('DB contains SIT points', extra= {'checked_list': names_sample(first_rejected), 'wrong_names': names_sample(second_rejected)})
+    else:
+        log.info('DB doesn\'t contain SIT points')
+    
+    #Checking for points that are 01S Manual entry REP
+    regex_manentry = '[0-9]{2}S [Mm]anual [Ee]ntry'
+    r_manentry = re.compile(regex_manentry)
+    manentry_list = list(filter(r_manentry.match, second_rejected))
+    log.info('Among %s unique names, %s names with paterrns Manual Entry', len(second_rejected), len(manentry_list))
+    third_rejected = list(set(second_rejected) - set(manentry_list))
+    log.info('%s unique names has pattern that are not vibrationa and not MI|A SIT and not Manual entry points', len(third_rejected))
+
+    #Checking for speed and temperature points which don't have orientation notation
+    regex_temp_speed = '[0-9]{2}(S|T)( |$)'
+    r_temp_speed = re.compile(regex_temp_speed)
+    temp_speed_list = list(filter(r_temp_speed.match, third_rejected))
+    log.info('Among %s unique names, %s names with speed or temp pattern', len(third_rejected), len(temp_speed_list))
+    fourth_rejected = list(set(third_rejected) - set(temp_speed_list))
+    log.info('%s unique names has pattern that are not not vibrational not SIT mot Manual entry RPM and not temperature', len(fourth_rejected))
+
+    #Crating a list of good names
+    good_names = list(set(mp_names) - set(fourth_rejected))
+    
+    return {'good_names': good_names, 'wrong_names': fourth_rejected}
+
+@instrument()
+def check_sit(treelem = pd.DataFrame(),
+              logger = ''):
+    
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the imput.
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    # Checking for MI SIT point in each FL if we have at least half of the FL with them
+    regex_misit = 'M(I|A) SIT'
+    #Mask of the nodes with SIT name (re.match semantic - name starts with pattern)
+    is_sit = treelem.NAME.astype(str).str.match(regex_misit).to_numpy()
+    misit_count = int((is_sit & (treelem.CONTAINERTYPE == 4).to_numpy()).sum())
+    
+    # Counting SIT points under each node using parent relation:
+    #SIT points directly under the node (MPs of the asset)
+    sit_in_node = treelem.loc[is_sit, 'PARENTID'].value_counts()
+    #SIT points under children of the node (MPs of the assets in the FL)
+    sit_in_children = treelem.TREEELEMID.map(sit_in_node).fillna(0)
+    sit_in_grandchildren = sit_in_children.groupby(treelem.PARENTID.to_numpy()).sum()
+    
+    #List of FL
+    mask_fl = (treelem.CONTAINERTYPE == 2) & (treelem.BRANCHLEVEL >= (max(treelem.BRANCHLEVEL) - 2))
+    fls = treelem.loc[mask_fl, ['NAME', 'TREEELEMID']]
+    fl_ids = fls.TREEELEMID.to_numpy()
+    misit_in_fl = fls.TREEELEMID.map(sit_in_grandchildren).fillna(0).astype(int).to_numpy()
+    log.info('SIT points are counted for %s FLs, %s SIT points in total', len(fls), misit_count)
+    
+    # Checking the rule that if customer uses MI SIT than each maesurement location 
+    # should have at least one and it should be located in Motor component! 
+    log.info(f'Checking hierachy for SIT points potential problems')
+    sit_problems = {'missing_sit': [], 'excessive_sit': [], 'good_sit': []}
+    if misit_count > len(fls)/2:
+        sit_problems['missing_sit'] = fl_ids[misit_in_fl == 0].tolist()
+        sit_problems['excessive_sit'] = fl_ids[misit_in_fl > 1].tolist()
+        sit_problems['good_sit'] = fl_ids[misit_in_fl == 1].tolist()
+        if len(sit_problems['missing_sit']) > 0:
+            log.warning('There are %s FLs without SIT point in any asset. Need to add', len(sit_problems['missing_sit']), extra = {'fl_ids': names_sample(sit_problems['missing_sit'])})
+        if len(sit_problems['excessive_sit']) > 0:
+            log.warning('There are %s FLs with more than one SIT points. Need to remove excessive points.', len(sit_problems['excessive_sit']), extra = {'fl_ids': names_sample(sit_problems['excessive_sit'])})
+        log.info('There are %s FLs with SIT point.', len(sit_problems['good_sit']))
+                
+    # Checking the problem that MI SIT points should be presented in Motor component
+    # list of assets:
+    mask_asset = treelem.CONTAINERTYPE == 3
+    assets = treelem.loc[mask_asset, ['NAME', 'TREEELEMID', 'FilterKey']]
+    #Checking for assets without Filter Key Assigned
+    assets_wo_filterkey = assets.loc[assets.FilterKey.isna(), ['NAME', 'TREEELEMID']]
+    if len(assets_wo_filterkey) > 0:
+        log.warning('There are %s assets without defined filter key.', len(assets_wo_filterkey), extra = {'asset_names': names_sample(list(assets_wo_filterkey.NAME))})
+    else:
+        log.info('All assets have assigned filter key.')
+        
+    is_motor = (assets.FilterKey == '*Motor').to_numpy()
+    asset_ids = assets.TREEELEMID.to_numpy()
+    misit_in_asset = assets.TREEELEMID.map(sit_in_node).fillna(0).astype(int).to_numpy()
+    
+    #Checking that all Motor Assets has MI SIT
+    sit_problems['motors_wo_SIT'] = []
+    sit_problems['duplicated_SIT_in_motor'] = []
+    sit_problems['other_components_w_SIT'] = []
+    
+    if misit_count > len(fls)/2:
+        sit_problems['motors_wo_SIT'] = asset_ids[is_motor & (misit_in_asset == 0)].tolist()
+        sit_problems['duplicated_SIT_in_motor'] = asset_ids[is_motor & (misit_in_asset > 1)].tolist()
+        sit_problems['other_components_w_SIT'] = asset_ids[~is_motor & (misit_in_asset >= 1)].tolist()
+        if len(sit_problems['motors_wo_SIT']) > 0:
+            log.warning('There are %s assets with filter Key Motor without SIT point. Need to add', len(sit_problems['motors_wo_SIT']), extra = {'asset_ids': names_sample(sit_problems['motors_wo_SIT'])})
+        if len(sit_problems['duplicated_SIT_in_motor']) > 0:
+            log.warning('There are %s assets with Filter Key Motor with more than one SIT points. Need to remove excessive points.', len(sit_problems['duplicated_SIT_in_motor']), extra = {'asset_ids': names_sample(sit_problems['duplicated_SIT_in_motor'])})
+        if len(sit_problems['other_components_w_SIT']) > 0:
+            log.warning('There are %s assets with other Filter Keys which have SIT points.', len(sit_problems['other_components_w_SIT']), extra = {'asset_ids': names_sample(sit_problems['other_components_w_SIT'])})
+
+    
+    return {'sit_issues': sit_problems}
+
+# Columns of TREEELEM table which are needed for the analysis
+required_columns = ['TREEELEMID', 'PARENTID', 'CONTAINERTYPE', 'NAME', 
+                    'ELEMENTENABLE', 'PARENTENABLE', 'ChannelEnable', 'HIERARCHYTYPE',
+                    'TBLSETID', 'BRANCHLEVEL', 'PointUnitType', 'FilterEnvelope',
+                    'PointSensorUnitType', 'PointOrientation', 'PointLocation', 'DADType',
+                    'FilterKey', 'SCALARALRMID', 'ALARMMETHOD', 'DANGERHI', 'DANGERLO',
+                    'ALERTHI', 'ALERTLO', 'ENABLEALERTHI', 'ENABLEALERTLO',
+                    'ENABLEDANGERHI', 'ENABLEDANGERLO']
+
+def validate_treelems(tree_df = pd.DataFrame(), 
+                      logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    validated = True
+    if not isinstance(tree_df, pd.DataFrame):
+        log.warning(f'Provided input has incorrect type. Required type: pd.DatFrame, received input: {type(tree_df)}')
+        return None
+    
+    if set(required_columns).issubset(tree_df.columns):
+        log.info('Provided dataframe has all necessary information for the analysis: %s', tree_df.columns)
+    else:
+        missing_columns = list(set(required_columns) - set(tree_df.columns))
+        log.warning(f'Provided dataframe contains not all information needed. Check the input. Missing columns: {missing_columns}')
+        validated = False
+    
+    if len(tree_df) == 0:
+        log.warning(f'Provided dataframe is empty.')
+        validated = False
+    
+    return validated
+
+@instrument()
+def check_thresholds(treelem = pd.DataFrame(), 
+                    logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    #Validationof the input
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    #Creatnig list of points without thresholds
+    points_wo_alarms = treelem.loc[(treelem.CONTAINERTYPE == 4) & 
+                               treelem.SCALARALRMID.isna() &  
+                               ~treelem.NAME.isin(['MA SIT', 'MI SIT']), ['TREEELEMID','NAME', 'Path']]
+
+    #Checking if the thresholds are in correct sequence. Enabled thresholds should be strictly 
+    #increasing, so each pair of enabled thresholds is compared for all points at once
+    mask_alarms = ~treelem.SCALARALRMID.isna()
+    alarms = treelem.loc[mask_alarms, ['DANGERLO', 'ALERTLO', 'ALERTHI', 'DANGERHI']].to_numpy(dtype = 'float64')
+    enabled = treelem.loc[mask_alarms, ['ENABLEDANGERLO', 'ENABLEALERTLO', 'ENABLEALERTHI', 'ENABLEDANGERHI']].to_numpy(dtype = 'float64') != 0
+    wrong = np.zeros(len(alarms), dtype = bool)
+    for low in range(4):
+        for high in range(low + 1, 4):
+            wrong |= enabled[:, low] & enabled[:, high] & ~(alarms[:, low] < alarms[:, high])
+    wrong_ids = treelem.loc[mask_alarms, 'TREEELEMID'].to_numpy()[wrong]
+    if len(wrong_ids) > 0:
+        log.warning('%s MP have a wrong thresholds set.', len(wrong_ids), extra = {'Node ID': names_sample(wrong_ids.tolist())})
+
+    wrong_alarms = treelem.loc[treelem.TREEELEMID.isin(wrong_ids), ['TREEELEMID', 'NAME', 'Path']]   
+    return {'threshold_issues': wrong_alarms,
+            'points_wo_alarms': points_wo_alarms}
+
+@instrument()
+def check_location(treelem = pd.DataFrame(), 
+                    logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the input
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    #Only needed columns are selected, provided data frame is not changed
+    tmp_df = treelem.loc[(treelem.CONTAINERTYPE == 4) & (~treelem.NAME.isin(['MI SIT', 'MA SIT'])), ['TREEELEMID', 'NAME', 'PointLocation', 'Path']]
+    #treelem['PointLocation'] = [np.nan if pd.isnull(x) else x for x in treelem['PointLocation']]
+    
+    locations_name = []
+    for name in tmp_df['NAME']:
+        try:
+            number = re.search('[0-9]{1,3}', name).group(0)
+            locations_name.append(str(int(number)))
+        except AttributeError:
+            locations_name.append(None)
+    locations_set = list(tmp_df['PointLocation'])
+    for i in range(len(locations_set)):
+        try: 
+            locations_set[i] = str(int(locations_set[i]))
+        except:
+            locations_set[i] = str(locations_set[i])
+
+    locations_set = [str(x) for x in locations_set]
+    
+    diff = np.array([lset != lname for lset, lname in zip(locations_set, locations_name)], dtype = bool)
+    results_df = pd.DataFrame({'TREEELEMID': tmp_df['TREEELEMID'].to_numpy()[diff],
+                               'NAME': tmp_df['NAME'].to_numpy()[diff],
+                               'Location': np.array(locations_set, dtype = object)[diff],
+                               'Path': tmp_df['Path'].to_numpy()[diff]})
+    #results_df['Path'] = [create_path(node_id = x, treelem = treelem) for x in results_df.TREEELEMID]
+
+    return results_df
+
+@instrument()
+def check_orientation(treelem = pd.DataFrame(),
+                      logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the input
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    #Only needed columns are selected, provided data frame is not changed
+    tmp_df = treelem.loc[(treelem.CONTAINERTYPE == 4) & (~treelem.NAME.isin(['MI SIT', 'MA SIT'])), ['TREEELEMID', 'NAME', 'PointOrientation', 'Path']]
+    #treelem['PointLocation'] = [np.nan if pd.isnull(x) else x for x in treelem['PointLocation']]
+    
+    orientations_name = []
+    orientation_mapping = {'H': 'Horizontal', 'V': 'Vertical', 'A': 'Axial', 'R': 'Radial'}
+    for name in tmp_df['NAME']:
+            try:
+                orientation = re.search('(^\w{2})?( |^)[0-9]{1,3}(A|H|V|R)', name).group(0)
+                orientations_name.append(orientation_mapping[orientation[-1]])
+            except AttributeError:
+                orientations_name.append(None)
+    orientations_set = list(tmp_df['PointOrientation'])
+    
+    diff = np.array([oset != oname for oset, oname in zip(orientations_set, orientations_name)], dtype = bool)
+    
+    results_df = pd.DataFrame({'TREEELEMID': tmp_df['TREEELEMID'].to_numpy()[diff],
+                               'NAME': tmp_df['NAME'].to_numpy()[diff],
+                               'Orientation': np.array(orientations_set, dtype = object)[diff],
+                               'Path': tmp_df['Path'].to_numpy()[diff]})
+    #results_df['Path'] = [create_path(node_id = x, treelem = treelem) for x in results_df.TREEELEMID]
+
+    return results_df
+
+@instrument()
+def check_type_enveleope(treelem = pd.DataFrame(),
+                   logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+       
+    # Validation of the input
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    #Retrieving Points. Only needed columns are selected, provided data frame is not changed
+    points = treelem.loc[(treelem.CONTAINERTYPE == 4) & ~treelem.NAME.isin(['MA SIT', 'MI SIT']), 
+                         ['NAME', 'TREEELEMID', 'FilterEnvelope', 'PointUnitType', 'Path']]
+    
+    units_maping = {'in/s': 'velocity',
+                    'mm/s': 'velocity',
+                    'g': 'acceleration',
+                    'gE': 'envelope',
+                    'RPM': 'speed',
+                    'Hz': 'speed',
+                    'F': 'temp',
+                    'C': 'temp'}
+    regex_types = {
+        'velocity': '(^\w*)?( |^)\d*.*V( |$)',
+        'temp': '(^\w*)?( |^)\d*.*T( |$)',
+        'speed': '(^\w*)?( |^)\d*.*S( |$)',
+        'envelope': '(^\w*)?( |^)\d*.*((E1)|(E2)|(E3)|(E4))( |$)',
+        'acceleration': '(^\w*)?( |^)\d*.*A( |$)'
+    }
+    meas_type = np.array([units_maping[x] if x in units_maping.keys() else 'undefined' for x in points.PointUnitType], dtype = object)
+    types_in_treelem = list(set(meas_type))
+    settings_prob = {'TREEELEMID': [],
+                     'NAME': [],
+                     'Type': [],
+                     'Envelope': [],
+                     'Path': []}
+    for point_type in types_in_treelem:
+        if point_type == 'undefined':
+            continue
+        point_names = points[meas_type == point_type]
+        regex = regex_types[point_type]
+        r_point_type = re.compile(regex)
+        bad_meastype = point_names[~point_names.NAME.str.contains(regex)]
+        if len(bad_meastype) > 0:
+            log.warning('%s points has discrepancies between settings and name', len(bad_meastype), extra = {'Node ID': names_sample(list(bad_meastype.TREEELEMID))})
+            settings_prob['TREEELEMID'] = settings_prob['TREEELEMID'] + list(bad_meastype.TREEELEMID)
+            settings_prob['NAME'] = settings_prob['NAME'] + list(bad_meastype.NAME)
+            settings_prob['Type'] = settings_prob['Type'] + list(bad_meastype.PointUnitType)
+            settings_prob['Envelope'] = settings_prob['Envelope'] + len(bad_meastype.PointUnitType)*[np.nan]
+            settings_prob['Path'] = settings_prob['Path'] + list(bad_meastype.Path)
+        if point_type == 'envelope':
+            envelope = np.array(['E'+str(int(x) - 20599) if x in [20600, 20601, 20602, 20603] else 'Undefined Filter in DB' for x in point_names.FilterEnvelope], dtype = object)
+            bad_mask = np.array([y not in x for x,y in zip(point_names.NAME, envelope)], dtype = bool)
+            bad_filter = point_names[bad_mask]
+            if len(bad_filter) > 0:
+                log.warning('%s points has wrong envelope filter', len(bad_filter), extra = {'Node ID': names_sample(list(bad_filter.TREEELEMID))})
+                settings_prob['TREEELEMID'] = settings_prob['TREEELEMID'] + list(bad_filter.TREEELEMID)
+                settings_prob['NAME'] = settings_prob['NAME'] + list(bad_filter.NAME)
+                settings_prob['Type'] = settings_prob['Type'] + len(bad_filter)*[np.nan]
+                settings_prob['Envelope'] = settings_prob['Envelope'] + list(envelope[bad_mask])
+                settings_prob['Path'] = settings_prob['Path'] + list(bad_filter.Path)
+    
+    #settings_prob['Path'] = [create_path(node_id = x, treelem = treelem) for x in settings_prob['TREEELEMID']]
+    
+    return settings_prob
+
+def grandparents(treelem = pd.DataFrame(),
+                 logger = '',
+                 index = None):
+    #Second ancestor of each node (None for the top levels). The audit adds it to the hierarchy
+    #as GRANDPARENTID column from its tree index, so the checks in workers don't build the index again
+    if 'GRANDPARENTID' in treelem.columns:
+        return treelem.GRANDPARENTID
+    if index is None:
+        index = build_tree_index(treelem, logger)
+    return pd.Series(ancestors(index, treelem.TREEELEMID, 2), index = treelem.index)
+
+@instrument()
+def check_duplications(treelem = pd.DataFrame(), 
+                       logger = ''):
+    
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the imput.
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    #Duplications problems
+    log.info(f'Checking hierarchy for ducplicated names in the same FL')
+    fls_id = set(treelem.loc[treelem.CONTAINERTYPE == 3, 'PARENTID'])
+    #Points of the FL are children of its assets, so FL is the second ancestor of the point
+    fl = grandparents(treelem, logger)
+    points_mask = fl.isin(fls_id) & treelem.NAME.notna()
+    points = pd.DataFrame({'FL': fl[points_mask],
+                           'Asset': treelem.loc[points_mask, 'PARENTID'],
+                           'NAME': treelem.loc[points_mask, 'NAME'].astype(str)})
+    
+    duplication_problems = {}
+    for level in ['FL', 'Asset']:
+        duplicated = points[points.duplicated([level, 'NAME'], keep = False)].drop_duplicates([level, 'NAME'])
+        duplication_problems[level] = duplicated.groupby(level, sort = False).NAME.agg(list).to_dict()
+    if len(duplication_problems['FL']) > 0:
+        log.warning('%s FLs contain points with duplicated names', len(duplication_problems['FL']), extra = {'Node ID': names_sample(list(duplication_problems['FL'].keys()))})
+    
+    #Generating common table with issues
+    tables = []
+    for level in ['FL', 'Asset']:
+        tmp_rows = treelem.loc[treelem.TREEELEMID.isin(list(duplication_problems[level].keys())), ['TREEELEMID', 'Path']]
+        tables.append(tmp_rows.assign(Problem = [f'FL has points with duplicated names: {duplication_problems[level][x]}' for x in tmp_rows.TREEELEMID]))
+    resulted_table = pd.concat(tables)
+    resulted_table.reset_index(drop = True, inplace = True)
+    
+    return resulted_table
+
+@instrument()
+def check_hierarchy(treelem = pd.DataFrame(), 
+                       logger = ''):
+    
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the imput.
+    if not validate_treelems(treelem, logger):
+        return None
+    # Checking that the hierarchy has at least certain amount of layers
+    wrong_hier_mask = (treelem.CONTAINERTYPE == 3) & (treelem.BRANCHLEVEL <= 1)
+    df_wrong = treelem.loc[wrong_hier_mask, ['TREEELEMID', 'Path']].assign(Problem = 'Too short hierarchy')
+    
+    return df_wrong
+
+@instrument()
+def check_sequence(treelem = pd.DataFrame(), 
+                       logger = ''):
+    
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the imput.
+    if not validate_treelems(treelem, logger):
+        return None
+    
+    fls_id = set(treelem.loc[treelem.CONTAINERTYPE == 3, 'PARENTID'])
+    #Check if we have wrong hierarchy than we can have fl_id which is the same as hierarchy ID
+    if treelem.loc[treelem.BRANCHLEVEL == 0, 'TREEELEMID'].item() in list(fls_id):
+        fls_id.remove(treelem.loc[treelem.BRANCHLEVEL == 0, 'TREEELEMID'].item())
+    fls = treelem.loc[treelem.TREEELEMID.isin(list(fls_id)), ['TREEELEMID', 'Path']]
+    
+    # FL of each measurement point is the parent of its asset
+    mps = treelem.loc[treelem.CONTAINERTYPE == 4, ['TREEELEMID', 'NAME']]
+    mp_fl = grandparents(treelem, logger)[mps.index]
+    mps = mps[mp_fl.isin(fls_id).to_numpy()].assign(FL = mp_fl)
+    log.info('%s measurement points are found in %s FLs', len(mps), len(fls))
+    
+    # Location number is extracted once for all points. Locations above 99 are ignored
+    number = mps.NAME.astype(str).str.extract('^(?:MA|MI|ME|OS|TO|DV|OI)?(?: |^)([0-9]{1,3})', expand = False)
+    number = pd.to_numeric(number, errors = 'coerce')
+    located = number.between(1, 99).to_numpy()
+    number = number.to_numpy()[located].astype(np.int64)
+    fl_of_number = mps.FL.to_numpy()[located]
+    
+    # Locations of each FL as 128 bit mask stored in two 64 bit words (bits 0-63 and 64-127)
+    codes, fl_uniques = pd.factorize(fl_of_number)
+    order = np.argsort(codes, kind = 'stable')
+    codes = codes[order]
+    number = number[order]
+    low = np.where(number < 64, np.left_shift(np.uint64(1), np.minimum(number, 63).astype(np.uint64)), np.uint64(0))
+    high = np.where(number >= 64, np.left_shift(np.uint64(1), np.maximum(number - 64, 0).astype(np.uint64)), np.uint64(0))
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) > 0 else np.array([], dtype = np.int64)
+    masks = {}
+    if len(starts) > 0:
+        low = np.bitwise_or.reduceat(low, starts)
+        high = np.bitwise_or.reduceat(high, starts)
+        masks = {fl_uniques[code]: (int(h) << 64) | int(l) for code, l, h in zip(codes[starts], low, high)}
+    
+    # Missing locations are bits between 1 and the highest location which are not set
+    sequence_problems = {}
+    for fl_id in fls.TREEELEMID:
+        mask = masks.get(fl_id, 0)
+        if mask == 0:
+            continue
+        missing = ((1 << mask.bit_length()) - 2) & ~mask
+        if missing != 0:
+            sequence_problems[fl_id] = [x for x in range(1, mask.bit_length()) if (missing >> x) & 1]
+    if len(sequence_problems) > 0:
+        log.warning('There are %s FLs with missing measurement locations', len(sequence_problems), extra = {'fl_ids': names_sample(list(sequence_problems.keys()))})
+    else:
+        log.info('All FLs have continuous measurement locations')
+    
+    resulted_table = fls[fls.TREEELEMID.isin(list(sequence_problems.keys())).to_numpy()]
+    resulted_table = resulted_table.assign(Problem = [f'Locations {", ".join([str(x) for x in sequence_problems[x]])} is/are missing in FL' for x in resulted_table.TREEELEMID])
+    resulted_table.reset_index(drop = True, inplace = True)
+    return resulted_table
+
+@instrument()
+def check_motors(treelem = pd.DataFrame(), 
+                       logger = ''):
+    
+    # Setting logger
+    log = logging.getLogger(logger)
+    
+    # Validation of the imput.
+    if not validate_treelems(treelem, logger):
+        return None
+    motors_mask = (treelem.CONTAINERTYPE == 3) & (treelem.FilterKey.isin(['*Motor']))
+    motors = treelem.loc[motors_mask, ['TREEELEMID', 'Path']]
+    
+    # Location numbers of all points in motors are extracted at once
+    motors_mps = treelem.loc[treelem.PARENTID.isin(motors.TREEELEMID).to_numpy(), ['PARENTID', 'NAME']]
+    number = pd.to_numeric(motors_mps.NAME.astype(str).str.extract('([1-9]{1,3})', expand = False), errors = 'coerce')
+    motors_mps = motors_mps.assign(Location = number.to_numpy()).dropna(subset = ['Location'])
+    motors_mps = motors_mps.drop_duplicates(subset = ['PARENTID', 'Location'])
+    max_location = motors_mps.groupby('PARENTID').Location.max()
+    extra_locations = (motors_mps[motors_mps.Location > 2]
+                       .sort_values('Location', kind = 'stable')
+                       .groupby('PARENTID').Location
+                       .agg(lambda x: ', '.join(str(int(v)) for v in x)))
+    
+    motor_max = motors.TREEELEMID.map(max_location).to_numpy()
+    motor_extra = motors.TREEELEMID.map(extra_locations).to_numpy()
+    problem = np.select([np.isnan(motor_max), motor_max > 2, motor_max == 1],
+                        ['Motor has no measurement locations or impossible to detect locations based on names',
+                         ('Motor has more than 2 locations for MP(s): ' + pd.Series(motor_extra, dtype = object).fillna('')).to_numpy(dtype = object),
+                         'Motor has less than 2 measurement locations'],
+                        default = '')
+    resulted_table = motors.assign(Problem = problem)[problem != '']
+    log.info('%s motors are checked. %s motors have wrong measurement locations', len(motors), len(resulted_table))
+                                               
+    return resulted_table
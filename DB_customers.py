@@ -0,0 +1,40 @@
+import os
+import pickle
+import logging
+import pandas as pd
+
+# List of customers is read from cust_details.xlsx. Parsing of excel with openpyxl is slow,
+# so parsed list is saved next to it in pickle file together with modification time
+# and size of the excel file. Pickle is used until excel file is changed.
+
+def load_customers(filename = '', logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    stat = os.stat(filename)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cache_file = os.path.splitext(filename)[0] + '.pkl'
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_version, cust_details = pickle.load(f)
+        if cached_version == version:
+            return cust_details
+    except Exception:
+        #Pickle is only a cache. Missing, corrupted or written by other version of pandas
+        #pickle is replaced by the list read from the excel file
+        pass
+    cust_details = pd.read_excel(filename)
+    try:
+        #File is replaced at once, so other processes never read partially written list
+        with open(cache_file + '.tmp', 'wb') as f:
+            pickle.dump((version, cust_details), f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+    except OSError:
+        #Folder can be read only, excel file is parsed on each start then
+        log.warning('Unable to save list of customers to %s', cache_file)
+    return cust_details
+
+def customer_options(cust_details = pd.DataFrame()):
+    #Options of the dropdown menu in one pass over the table
+    return [{'label': label, 'value': value}
+            for label, value in zip(cust_details.customer.tolist(), cust_details.short_name.tolist())]
@@ -0,0 +1,246 @@
+import os
+import time
+import uuid
+import pickle
+import atexit
+import logging
+import threading
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from DB_instrumentation import peak_rss, count_rows, record
+
+# Number of worker processes for the audit. DB_AUDIT_WORKERS=0 runs all checks
+# one by one in the current process (useful for debugging and small customers).
+AUDIT_WORKERS = int(os.environ.get('DB_AUDIT_WORKERS', str(min(6, os.cpu_count() or 1))))
+
+# Placeholder for the hierarchy in the arguments of the check. In the worker
+# it's replaced by the frame attached from shared memory.
+SHARED_FRAME = '__shared_frame__'
+
+_pool = None
+_log_queue = None
+_log_listener = None
+# Frames attached in the worker process: {token: (frame, [shared memory blocks])}
+_attached = {}
+
+def _new_block(nbytes):
+    return shared_memory.SharedMemory(create = True, size = max(int(nbytes), 1))
+
+def _share_array(arr, blocks):
+    arr = np.ascontiguousarray(arr)
+    block = _new_block(arr.nbytes)
+    np.ndarray(arr.shape, dtype = arr.dtype, buffer = block.buf)[:] = arr
+    blocks.append(block)
+    return {'shm': block.name, 'dtype': arr.dtype.str, 'shape': arr.shape}
+
+def _share_bytes(data, blocks):
+    block = _new_block(len(data))
+    block.buf[:len(data)] = data
+    blocks.append(block)
+    return {'shm': block.name, 'size': len(data)}
+
+def share_frame(treelem = pd.DataFrame()):
+    #Copying frame once to shared memory. Numeric columns are stored as numpy arrays,
+    #text and categorical columns as integer codes plus table of unique values.
+    #Returns small picklable handle and list of blocks which should be released by release_frame
+    blocks = []
+    columns = []
+    for col in treelem.columns:
+        values = treelem[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            uniques = values.cat.categories.to_numpy()
+            kind = 'category'
+        elif values.dtype.kind in 'biuf':
+            columns.append({'name': col, 'kind': 'numeric', 'data': _share_array(values.to_numpy(), blocks)})
+            continue
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel = True)
+            uniques = np.asarray(uniques, dtype = object)
+            kind = 'factorized'
+        columns.append({'name': col, 'kind': kind,
+                        'data': _share_array(codes, blocks),
+                        'uniques': _share_bytes(pickle.dumps(uniques, protocol = pickle.HIGHEST_PROTOCOL), blocks)})
+    handle = {'token': uuid.uuid4().hex, 'length': len(treelem), 'columns': columns}
+    return handle, blocks
+
+def release_frame(blocks = []):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+def _attach_array(spec, opened):
+    block = shared_memory.SharedMemory(name = spec['shm'])
+    opened.append(block)
+    arr = np.ndarray(spec['shape'], dtype = np.dtype(spec['dtype']), buffer = block.buf)
+    #Checks must not change the shared hierarchy
+    arr.flags.writeable = False
+    return arr
+
+def _attach_bytes(spec, opened):
+    block = shared_memory.SharedMemory(name = spec['shm'])
+    opened.append(block)
+    return pickle.loads(bytes(block.buf[:spec['size']]))
+
+def attach_frame(handle = {}):
+    #Rebuilding the frame from shared memory once per audit in each worker
+    if handle['token'] in _attached:
+        return _attached[handle['token']][0]
+    #Only one audit is kept attached in the worker
+    for frame, opened in _attached.values():
+        for block in opened:
+            block.close()
+    _attached.clear()
+
+    opened = []
+    data = {}
+    for col in handle['columns']:
+        codes = _attach_array(col['data'], opened)
+        if col['kind'] == 'numeric':
+            data[col['name']] = codes
+            continue
+        uniques = _attach_bytes(col['uniques'], opened)
+        if col['kind'] == 'category':
+            data[col['name']] = pd.Categorical.from_codes(codes, categories = uniques)
+        else:
+            values = np.empty(len(codes), dtype = object)
+            values[:] = np.nan
+            mask = codes >= 0
+            values[mask] = uniques[codes[mask]]
+            data[col['name']] = values
+    frame = pd.DataFrame(data, copy = False)
+    _attached[handle['token']] = (frame, opened)
+    return frame
+
+def _is_shared(value):
+    return isinstance(value, str) and value == SHARED_FRAME
+
+def _init_worker(log_queue, log_name):
+    #Records of the worker are sent to the listener of the main process
+    log = logging.getLogger(log_name)
+    log.handlers = [logging.handlers.QueueHandler(log_queue)]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+def _run_task(name, func, kwargs, handle):
+    if handle is not None:
+        #Checks don't change provided frame, so the same attached frame is used by all tasks
+        kwargs = {key: (attach_frame(handle) if _is_shared(value) else value)
+                  for key, value in kwargs.items()}
+    rows_in = None
+    for value in kwargs.values():
+        rows_in = count_rows(value)
+        if rows_in is not None:
+            break
+    rss_start = peak_rss()
+    start = time.perf_counter()
+    result = func(**kwargs)
+    measurement = {'duration': time.perf_counter() - start,
+                   'rows_in': rows_in,
+                   'rows_out': count_rows(result),
+                   'rss_delta': peak_rss() - rss_start}
+    return name, result, measurement
+
+def get_pool(logger = ''):
+    #Pool is created once per process and reused by all its audits. Audit callback of the
+    #server reuses one pool. Background jobs of the audit run in new processes, so each job
+    #starts own pool: 6 workers start in 0.1 s with fork (Linux) and in about 3 s with spawn
+    #(Windows), which is small compared to the checks of big hierarchies. Checks are in DB_checks,
+    #so workers unpickle them without importing the dashboard. With spawn Python also runs the
+    #main script in each worker, so in production the app is served as a module
+    #(waitress-serve or gunicorn DB_general:server) and the dashboard is not the main script
+    global _pool, _log_queue, _log_listener
+    if _pool is None:
+        _log_queue = multiprocessing.Queue()
+        _log_listener = logging.handlers.QueueListener(_log_queue, *logging.getLogger(logger).handlers)
+        _log_listener.start()
+        _pool = ProcessPoolExecutor(max_workers = AUDIT_WORKERS,
+                                    initializer = _init_worker,
+                                    initargs = (_log_queue, logger))
+        atexit.register(shutdown_pool)
+    return _pool
+
+def shutdown_pool():
+    global _pool, _log_listener
+    if _pool is not None:
+        _pool.shutdown(cancel_futures = True)
+        _pool = None
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def run_checks(treelem = pd.DataFrame(),
+               checks = {},
+               logger = '',
+               progress = None):
+    #Running independent checks. checks is a dictionary {name: (function, kwargs)}
+    #where SHARED_FRAME in kwargs marks the place of the hierarchy.
+    #progress(name, result) is called after each finished check.
+    #Returns dictionary {name: result of the check}
+    log = logging.getLogger(logger)
+    results = {}
+    if AUDIT_WORKERS == 0:
+        for name, (func, kwargs) in checks.items():
+            kwargs = {key: (treelem if _is_shared(value) else value) for key, value in kwargs.items()}
+            results[name] = func(**kwargs)
+            if progress is not None:
+                progress(name, results[name])
+        return results
+
+    handle, blocks = share_frame(treelem)
+    try:
+        pool = get_pool(logger)
+        futures = [pool.submit(_run_task, name, func, kwargs, handle) for name, (func, kwargs) in checks.items()]
+        for future in as_completed(futures):
+            name, result, measurement = future.result()
+            #Measurements of the workers are collected in the aggregate of the main process
+            record(name = name + '[worker]', **measurement)
+            results[name] = result
+            if progress is not None:
+                progress(name, result)
+    finally:
+        release_frame(blocks)
+    log.info('Audit checks finished in worker processes', extra = {'checks': list(results.keys()), 'workers': AUDIT_WORKERS})
+    return results
+
+def start_checks(treelem = pd.DataFrame(),
+                 checks = {},
+                 logger = '',
+                 progress = None):
+    #Running checks in background thread, so results of the finished checks can be used
+    #while the other checks are running. Returns function wait(*names) which waits for
+    #the checks and returns dictionary with results of all the checks finished so far
+    results = {}
+    state = {'done': False, 'error': None}
+    finished = threading.Condition()
+
+    def collect(name, result):
+        with finished:
+            results[name] = result
+            finished.notify_all()
+        if progress is not None:
+            progress(name, result)
+
+    def run():
+        try:
+            run_checks(treelem = treelem, checks = checks, logger = logger, progress = collect)
+        except Exception as e:
+            state['error'] = e
+        finally:
+            with finished:
+                state['done'] = True
+                finished.notify_all()
+
+    threading.Thread(target = run, daemon = True).start()
+
+    def wait(*names):
+        with finished:
+            finished.wait_for(lambda: state['done'] or all(name in results for name in names))
+            if not all(name in results for name in names):
+                raise state['error'] or KeyError(names)
+            return dict(results)
+    return wait
@@ -0,0 +1,136 @@
+import os
+import re
+import io
+import logging
+import zipfile
+import tempfile
+import numpy as np
+import pandas as pd
+from DB_tables import get_table
+
+# Export of all issue tables of the audit from the tables cache, checks are not run again.
+# Tables are written by chunks of DB_EXPORT_CHUNK_ROWS rows straight to the file, so memory
+# used by export doesn't depend on the number of issues. xlsxwriter and pyarrow are imported
+# only when the export is requested.
+EXPORT_CHUNK_ROWS = int(os.environ.get('DB_EXPORT_CHUNK_ROWS', '10000'))
+EXPORT_DIR = os.environ.get('DB_EXPORT_DIR', tempfile.gettempdir())
+EXPORT_FORMATS = {'xlsx': '.xlsx', 'csv': '.zip', 'parquet': '.zip'}
+# Excel sheet can't have more rows, longer tables are continued on the next sheets
+EXCEL_MAX_ROWS = 1048575
+
+# Tables of the audit in the order of the export and their sheet/file names
+EXPORT_TABLES = {'names-table': 'Names',
+                 'settings-table': 'Names-Settings',
+                 'integrity-table': 'Integrity',
+                 'hierarchy-table': 'Hierarchy',
+                 'no-thresholds-table': 'No thresholds',
+                 'no_thresholds-table': 'Wrong thresholds',
+                 'fl-wo-sit-table': 'FL without SIT',
+                 'few-sit-fl-table': 'FL with few SIT',
+                 'motor_wo_sit-table': 'Motors without SIT',
+                 'other-w-sit-table': 'SIT in NON Motor assets',
+                 'disabled-table': 'Disabled nodes',
+                 'tree-issues': 'All issues'}
+
+def audit_tables(tables_key = None):
+    #Tables of the audit which are still in the cache: {sheet name: frame}
+    tables = {}
+    for table_id, sheet in EXPORT_TABLES.items():
+        frame = get_table(tables_key, table_id)
+        if frame is not None:
+            tables[sheet] = frame
+    return tables
+
+def _chunks(frame = pd.DataFrame()):
+    #Chunks of the frame with None instead of missing values and text instead of
+    #lists and other objects which can't be written to the file
+    for start in range(0, len(frame), EXPORT_CHUNK_ROWS):
+        chunk = frame.iloc[start:start + EXPORT_CHUNK_ROWS]
+        columns = {}
+        for col in chunk.columns:
+            values = chunk[col].to_numpy(dtype = object, copy = True)
+            values[pd.isna(chunk[col]).to_numpy()] = None
+            if chunk[col].dtype.kind not in 'biuf':
+                values = np.array([x if x is None or isinstance(x, (str, int, float, bool)) else str(x) for x in values], dtype = object)
+            columns[col] = values
+        yield columns
+
+def write_excel(tables = {}, filename = ''):
+    import xlsxwriter
+    #In constant memory mode each row is written to the file when the next row is started
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True, 'nan_inf_to_errors': True})
+    header = workbook.add_format({'bold': True})
+    for sheet, frame in tables.items():
+        part = 1
+        worksheet = workbook.add_worksheet(sheet[:31])
+        worksheet.write_row(0, 0, [str(x) for x in frame.columns], header)
+        row = 1
+        for columns in _chunks(frame):
+            for values in zip(*columns.values()):
+                if row > EXCEL_MAX_ROWS:
+                    part += 1
+                    name = f'{sheet[:25]} ({part})'
+                    worksheet = workbook.add_worksheet(name)
+                    worksheet.write_row(0, 0, [str(x) for x in frame.columns], header)
+                    row = 1
+                worksheet.write_row(row, 0, values)
+                row += 1
+    workbook.close()
+
+def write_csv(tables = {}, filename = ''):
+    #One csv file per table in zip archive
+    with zipfile.ZipFile(filename, 'w', compression = zipfile.ZIP_DEFLATED) as archive:
+        for sheet, frame in tables.items():
+            with archive.open(sheet + '.csv', 'w') as f:
+                text = io.TextIOWrapper(f, encoding = 'utf-8', newline = '')
+                frame.iloc[:0].to_csv(text, index = False)
+                for columns in _chunks(frame):
+                    pd.DataFrame(columns, columns = frame.columns).to_csv(text, index = False, header = False)
+                text.flush()
+                text.detach()
+
+def write_parquet(tables = {}, filename = ''):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    #One parquet file per table in zip archive. Numeric columns keep their type, other columns are text
+    #Parquet writer needs seekable file, so tables are written to temporary files first
+    with zipfile.ZipFile(filename, 'w', compression = zipfile.ZIP_STORED) as archive, \
+         tempfile.TemporaryDirectory(dir = EXPORT_DIR) as folder:
+        for sheet, frame in tables.items():
+            schema = pa.schema([(str(col), pa.from_numpy_dtype(frame[col].dtype) if frame[col].dtype.kind in 'biuf' else pa.string())
+                                for col in frame.columns])
+            path = os.path.join(folder, sheet + '.parquet')
+            with pq.ParquetWriter(path, schema) as writer:
+                for columns in _chunks(frame):
+                    arrays = [pa.array(values if frame[col].dtype.kind in 'biuf' else [None if x is None else str(x) for x in values],
+                                       type = schema.field(str(col)).type, from_pandas = True)
+                              for col, values in columns.items()]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema = schema))
+            archive.write(path, sheet + '.parquet')
+            os.remove(path)
+
+def export_audit(tables_key = None, file_format = 'xlsx', logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    #Writing all issue tables of the audit to temporary file. Returns the name of the file
+    #or None if the audit is not in the cache anymore
+    tables = audit_tables(tables_key)
+    if len(tables) == 0:
+        log.warning('Audit for the export is not found in the cache', extra = {'tables_key': tables_key})
+        return None
+    os.makedirs(EXPORT_DIR, exist_ok = True)
+    handle, filename = tempfile.mkstemp(suffix = EXPORT_FORMATS[file_format], dir = EXPORT_DIR)
+    os.close(handle)
+    try:
+        {'xlsx': write_excel, 'csv': write_csv, 'parquet': write_parquet}[file_format](tables, filename)
+    except:
+        os.remove(filename)
+        raise
+    log.info('Audit is exported', extra = {'format': file_format, 'rows': sum(len(x) for x in tables.values())})
+    return filename
+
+def export_name(customer = '', file_format = 'xlsx'):
+    #Name of the downloaded file
+    customer = re.sub(r'[^A-Za-z0-9_.-]+', '_', customer or 'customer')
+    return f'{customer}_issues{EXPORT_FORMATS[file_format]}'
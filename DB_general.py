@@ -1,71 +1,42 @@
 import os
+import json
 import numpy as np
 import pandas as pd
 import sys
 import plotly.express as px
+import plotly.io as pio
 import logging
-import json_log_formatter
 import dash
 import uuid
+from urllib.parse import quote
+import multiprocessing
 from dash import no_update, dcc, html
 from dash import dash_table as dt
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+from flask import jsonify, send_file, request, abort
 from DB_validation import *
+from DB_checks import (check_names, check_sit, required_columns, validate_treelems, check_thresholds,
+                       check_location, check_orientation, check_type_enveleope, grandparents,
+                       check_duplications, check_hierarchy, check_sequence, check_motors)
+from DB_customers import load_customers, customer_options
+from DB_instrumentation import instrument, configure as configure_instrumentation, metrics_snapshot
+from DB_logging import names_sample, setup_json_logger
+from DB_executor import start_checks, SHARED_FRAME
+from DB_tree import build_tree_index, node_rows, subtree_sums
+from DB_tables import store_tables, get_table, table_page, page_props, stat_tables_key
+from DB_serialize import frame_to_store, frame_from_store, orjson
+from DB_export import export_audit, export_name, EXPORT_FORMATS
+from DB_cache import data_version, get_fragments, cache_fragments, configure_shared, single_flight, compute_heavy
+# Audit is done as background job of diskcache manager when diskcache is installed,
+# otherwise it's done in the callback itself
+try:
+    import diskcache
+    from dash.long_callback import DiskcacheLongCallbackManager
+except ImportError:
+    diskcache = None
 
-# The best option will be to feed list of unique values to this function
-def check_names(mp_names = [], logger = ''):
-    # Setting logger
-    log = logging.getLogger(logger)
-    
-    #Validation of input
-    if not isinstance(mp_names, list):
-        log.error(f'Check names recieved wrong data structure. Accepted structure: list')
-        return None
-    
-    # Checking for regular vibration points
-    regex_vibr = '^((MA)|(MI)|(ME)|(OS)|(TO)|(DV)|(OI))?( |^)\d{2}(A|H|V|R)(A|T|V|S|B|P|G|D|(E1)|(E2)|(E3)|(E4)) ?.*? ?((DE)|(NDE))? ?(.{1,})?$'
-    r = re.compile(regex_vibr)
-    good_list = list(filter(r.match, mp_names))
-    log.info('Names checked for vibration patterns.', extra={'point_names': good_list})
-    first_rejected = list(set(mp_names) - set(good_list))
-    if len(first_rejected) > 0:
-        log.warning('DB contains names with wrong naming conventions', extra= {'checked_list': mp_names, 'wrong_names': first_rejected})
-    else:
-        log.info('All points have names according naming conventions')
-    
-    # Checking for MI SIT
-    regex_misit = 'M(I|A) SIT'
-    r_sit = re.compile(regex_misit)
-    misit_list = list(filter(r_sit.match, first_rejected))
-    log.info('Names checked for SIT points patterns', extra={'point_names': misit_list})
-    second_rejected = list(set(first_rejected) - set(misit_list))
-    if len(second_rejected)>0:
-        log.warning('DB contains SIT points', extra= {'checked_list': first_rejected, 'wrong_names': second_rejected})
-    else:
-        log.info('DB doesn\'t contain SIT points')
-    
-    #Checking for points that are 01S Manual entry REP
-    regex_manentry = '[0-9]{2}S [Mm]anual [Ee]ntry'
-    r_manentry = re.compile(regex_manentry)
-    manentry_list = list(filter(r_manentry.match, second_rejected))
-    log.info(f'Among {len(second_rejected)} unique names, {len(manentry_list)} names with paterrns Manual Entry')
-    third_rejected = list(set(second_rejected) - set(manentry_list))
-    log.info(f'{len(third_rejected)} unique names has pattern that are not vibrationa and not MI|A SIT and not Manual entry points')
-
-    #Checking for speed and temperature points which don't have orientation notation
-    regex_temp_speed = '[0-9]{2}(S|T)( |$)'
-    r_temp_speed = re.compile(regex_temp_speed)
-    temp_speed_list = list(filter(r_temp_speed.match, third_rejected))
-    log.info(f'Among {len(third_rejected)} unique names, {len(temp_speed_list)} names with speed or temp pattern')
-    fourth_rejected = list(set(third_rejected) - set(temp_speed_list))
-    log.info(f'{len(fourth_rejected)} unique names has pattern that are not not vibrational not SIT mot Manual entry RPM and not temperature')
-
-    #Crating a list of good names
-    good_names = list(set(mp_names) - set(fourth_rejected))
-    
-    return {'good_names': good_names, 'wrong_names': fourth_rejected}
     
 # Function for checking for problems in rejected names. Function should check for few main problems with the names
 #1. Check for wrong first two letters. Wrong Device
@@ -153,6 +124,7 @@ def define_names_problems(wrong_names = [],
     return names_problems
 
 #Need function for checking that names are consistent with settings
+@instrument()
 def check_names_consistency(mp_names = [],
                             mp_settings = pd.DataFrame(),
                             logger = ''):
@@ -170,6 +142,27 @@ def check_names_consistency(mp_names = [],
         log.error(f'Data frame for point settings has zero rows. Cannot compare.')
         return None
 
+def propagate_disabled(treelem = pd.DataFrame(),
+                       fl_ids = [],
+                       logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    #Creating clear identification for disabled points. All assets inside disabled FL
+    #and all mp inside disabled asset are marked as disabled. Returns new ELEMENTENABLE 
+    #column, provided data frame is not changed.
+    enabled = treelem['ELEMENTENABLE'].copy()
+    ids = treelem['TREEELEMID']
+    disabled_fl = ids[ids.isin(fl_ids) & (enabled == 0)]
+    if len(disabled_fl) > 0:
+        log.warning('%s FL completely disabled. All assets inside will be marked and counted as disabled.', len(disabled_fl), extra = {'Node ID': names_sample(list(disabled_fl))})
+    enabled[treelem.PARENTID.isin(disabled_fl)] = 0
+    disabled_assets = ids[(treelem.CONTAINERTYPE == 3) & (enabled == 0)]
+    if len(disabled_assets) > 0:
+        log.warning('%s assets completely disabled. All mp inside will be marked and counted as disabled.', len(disabled_assets), extra = {'Node ID': names_sample(list(disabled_assets))})
+    enabled[treelem.PARENTID.isin(disabled_assets)] = 0
+    return enabled
+
 def prepare_hierarchy(treelem = pd.DataFrame(),
                       logger = ''):
     
@@ -180,21 +173,20 @@ def prepare_hierarchy(treelem = pd.DataFrame(),
     if not validate_treelems(treelem, logger):
         return None
     
-    #Creating path for easier identification
+    #Creating path for easier identification. Paths of parents are always created
+    #before paths of children since nodes are processed level by level
     levels = list(treelem.BRANCHLEVEL.unique())
     levels.sort()
-    log.info(f'Creating PATH for each element of tree. Hierary in total has following unique levels: {levels}')
-    treelem['PATH'] = ""
-    for level in levels:
-        if level == 0:
-            continue
-        tmp_df = treelem[(treelem.BRANCHLEVEL == level)]
-        log.info(f'Creating hierarchy for {level} level. Level has {len(tmp_df)} elements. Element names are {tmp_df["NAME"]}')
-        for element in tmp_df.TREEELEMID.unique():
-            parent_id = treelem.loc[treelem.TREEELEMID == element, 'PARENTID'].item()
-            parent_path = treelem.loc[treelem.TREEELEMID == parent_id, 'PATH'].item()
-            element_name = treelem.loc[treelem.TREEELEMID == element, 'NAME'].item()
-            treelem.loc[treelem.TREEELEMID == element, 'PATH'] = parent_path + "/" + element_name
+    log.info('Creating PATH for each element of tree. Hierary in total has following unique levels: %s', levels)
+    order = np.argsort(treelem.BRANCHLEVEL.to_numpy(), kind = 'stable')
+    ids = treelem.TREEELEMID.to_numpy()[order]
+    parents = treelem.PARENTID.to_numpy()[order]
+    names = treelem.NAME.to_numpy()[order]
+    node_levels = treelem.BRANCHLEVEL.to_numpy()[order]
+    paths = {}
+    for element, parent_id, element_name, level in zip(ids, parents, names, node_levels):
+        paths[element] = "" if level == 0 else paths.get(parent_id, "") + "/" + str(element_name)
+    path = pd.Series([paths[x] for x in treelem.TREEELEMID], index = treelem.index, name = 'PATH')
     
     #Creating list of  measurement point, assets and fls
     mps = treelem.loc[treelem.CONTAINERTYPE == 4, ['NAME', 'TREEELEMID']]
@@ -203,300 +195,111 @@ def prepare_hierarchy(treelem = pd.DataFrame(),
     log.info(f'Hierarchy has {len(fls)} Functional locations, {len(assets)} assets and {len(mps)} measurement points')
     
     #Creating clear identification for disabled points
-    for fl in fls.TREEELEMID:
-        if treelem.loc[treelem.TREEELEMID == fl, 'ELEMENTENABLE'].item() == 0:
-            log.warning(f'FL with ID {fl} completely disabled. All assets and mp indide it will be marked and counted as disabled.')
-            dis_assets = list(treelem.loc[treelem.PARENTID == fl, 'TREEELEMID'])
-            treelem.loc[treelem.TREEELEMID.isin(dis_assets), 'ELEMENTENABLE'] = 0
-    for asset in assets.TREEELEMID:
-        if treelem.loc[treelem.TREEELEMID == asset, 'ELEMENTENABLE'].item() == 0:
-            log.warning(f'Asset with ID {asset} completely disabled all mp inside will be marked and counted as disabled.')
-            treelem.loc[treelem.PARENTID == asset, 'ELEMENTENABLE'] = 0
+    enabled = propagate_disabled(treelem, fls.TREEELEMID, logger)
             
-    results = {'mp_names': mps, 'assets_names': assets, 'fl_names': fls, 'hierarchy_depth': max(levels), 'treeelem': treelem}
+    #Provided data frame is not changed. PATH and ELEMENTENABLE with disabled children are returned separately
+    results = {'mp_names': mps, 'assets_names': assets, 'fl_names': fls, 'hierarchy_depth': max(levels), 'treeelem': treelem,
+               'path': path, 'enabled': enabled}
     
     return results
 
-def check_sit(treelem = pd.DataFrame(),
-              logger = ''):
-    
-    # Setting logger
-    log = logging.getLogger(logger)
-    
-    # Validation of the imput.
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    # Checking for MI SIT point in each FL if we have at least half of the FL with them
-    mp_names = list(treelem.loc[treelem.CONTAINERTYPE == 4, 'NAME'])
-    regex_misit = 'M(I|A) SIT'
-    r_sit = re.compile(regex_misit)
-    misit_list = list(filter(r_sit.match, mp_names))
-    
-    # Creating list of MPs for each functional location
-    #List of FL
-    mask_fl = (treelem.CONTAINERTYPE == 2) & (treelem.BRANCHLEVEL >= (max(treelem.BRANCHLEVEL) - 2))
-    fls = treelem.loc[mask_fl, ['NAME', 'TREEELEMID']]
-    mp_in_fl = {}
-    for fl_id in list(fls['TREEELEMID']):
-        mp_in_fl[fl_id] = []
-    for fl_id in list(fls['TREEELEMID']):
-        asset_ids = list(treelem.loc[treelem.PARENTID == fl_id, 'TREEELEMID'])
-        for asset_id in asset_ids:
-            mp = list(treelem.loc[treelem.PARENTID == asset_id, 'NAME'])
-            mp_in_fl[fl_id] = mp_in_fl[fl_id] + mp
-        log.info(f'FL with id {fl_id} has {len(mp_in_fl[fl_id])} measurement points with following names: {mp_in_fl[fl_id]}')
-    
-    # Checking the rule that if customer uses MI SIT than each maesurement location 
-    # should have at least one and it should be located in Motor component! 
-    log.info(f'Checking hierachy for SIT points potential problems')
-    sit_problems = {'missing_sit': [], 'excessive_sit': [], 'good_sit': []}
-    if len(misit_list) > len(fls)/2:
-        for fl_id in mp_in_fl.keys():
-            misit_in_fl = list(filter(r_sit.match, mp_in_fl[fl_id]))
-            if len(misit_in_fl) == 0:
-                log.warning(f'FL with ID {fl_id} has no SIT point in any asset. Need to add')
-                sit_problems['missing_sit'].append(fl_id)
-            if len(misit_in_fl) > 1:
-                log.warning(f'FL with ID {fl_id} has more than one SIT points. Need to remove excessive points.')
-                sit_problems['excessive_sit'].append(fl_id)
-            if len(misit_in_fl) == 1:
-                log.info(f'FL with ID {fl_id} has SIT point.')
-                sit_problems['good_sit'].append(fl_id)
+
                 
-    # Checking the problem that MI SIT points should be presented in Motor component
-    # list of assets:
-    mask_asset = treelem.CONTAINERTYPE == 3
-    assets = treelem.loc[mask_asset, ['NAME', 'TREEELEMID', 'FilterKey']]
-    #Checking for assets without Filter Key Assigned
-    assets_wo_filterkey = assets.loc[assets.FilterKey.isna(), ['NAME', 'TREEELEMID']]
-    if len(assets_wo_filterkey) > 0:
-        log.warning(f'There are {len(assets_wo_filterkey)} assets without defined filter key. The names are: {list(assets_wo_filterkey.NAME)}')
-    else:
-        log.info('All assets have assigned filter key.')
-        
-    assets_motors = assets.loc[assets.FilterKey == '*Motor', ['NAME', 'TREEELEMID', 'FilterKey']]
-    assets_other = assets.loc[assets.FilterKey != '*Motor', ['NAME', 'TREEELEMID', 'FilterKey']]
-    
-    #Checking that all Motor Assets has MI SIT
-    sit_problems['motors_wo_SIT'] = []
-    sit_problems['duplicated_SIT_in_motor'] = []
-    sit_problems['other_components_w_SIT'] = []
-    
-    if len(misit_list) > len(fls)/2:
-        for motor in assets_motors.TREEELEMID:
-            mp_asset = treelem.loc[treelem.PARENTID == motor, 'NAME']
-            misit_in_asset = list(filter(r_sit.match, mp_asset))
-            if len(misit_in_asset) == 0:
-                log.warning(f'Asset with ID {motor} and filter Key Motor has no SIT point in any asset. Need to add')
-                sit_problems['motors_wo_SIT'].append(motor)
-            if len(misit_in_asset) > 1:
-                log.warning(f'Asset with ID {motor} and Filter Key has more than one SIT points. Need to remove excessive points.')
-                sit_problems['duplicated_SIT_in_motor'].append(motor)
-            if len(misit_in_asset) == 1:
-                log.info(f'Asset with ID {motor} and Filter Key Motor has SIT point.')
-        for component in assets_other.TREEELEMID:
-            mp_asset = treelem.loc[treelem.PARENTID == component, 'NAME']
-            misit_in_asset = list(filter(r_sit.match, mp_asset))
-            if len(misit_in_asset) == 0:
-                log.info(f'Asset with ID {component} and filter key {treelem.loc[treelem.TREEELEMID == component, "FilterKey"].item()} has no MI SIT points')
-            if len(misit_in_asset) >= 1:
-                log.warning(f'Asset with ID {component} and Filter Key {treelem.loc[treelem.TREEELEMID == component, "FilterKey"].item()} has SIT points.')
-                sit_problems['other_components_w_SIT'].append(component)
 
-    
-    return {'sit_issues': sit_problems}
+# Types of TREEELEM columns used by load_treelems. 
+# category - low cardinality text/codes, stored as categorical
+# id - integer identifiers and codes, downcasted to the smallest integer type
+# flag - enable flags, stored as uint8
+# float32 - thresholds, stored as float32 if it's lossless
+treelem_schema = {'TREEELEMID': 'id', 'PARENTID': 'id', 'CONTAINERTYPE': 'id', 'NAME': 'category',
+                  'ELEMENTENABLE': 'flag', 'PARENTENABLE': 'flag', 'ChannelEnable': 'flag', 'HIERARCHYTYPE': 'id',
+                  'TBLSETID': 'id', 'BRANCHLEVEL': 'id', 'PointUnitType': 'category', 'FilterEnvelope': 'id',
+                  'PointSensorUnitType': 'category', 'PointOrientation': 'category', 'PointLocation': 'id', 'DADType': 'category',
+                  'FilterKey': 'category', 'SCALARALRMID': 'id', 'ALARMMETHOD': 'id', 'DANGERHI': 'float32', 'DANGERLO': 'float32',
+                  'ALERTHI': 'float32', 'ALERTLO': 'float32', 'ENABLEALERTHI': 'flag', 'ENABLEALERTLO': 'flag',
+                  'ENABLEDANGERHI': 'flag', 'ENABLEDANGERLO': 'flag', 'NodePriority': 'id'}
 
-def check_duplications(treelem = pd.DataFrame(), 
-                       logger = ''):
-    
-    # Setting logger
-    log = logging.getLogger(logger)
-    
-    # Validation of the imput.
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    #Duplications problems
-    log.info(f'Checking hierarchy for ducplicated names in the same FL')
-    duplication_problems = {'dupl_in_fl': {},
-                            'dupl_in_assets': {}}
-    levels = list(treelem.BRANCHLEVEL.unique())
-    fls_id = set(treelem.loc[treelem.CONTAINERTYPE == 3, 'PARENTID'])
-    fls = treelem.loc[treelem.TREEELEMID.isin(list(fls_id)), ['NAME', 'TREEELEMID']]
-    for fl_id in fls.TREEELEMID:
-        mp_in_fl = []
-        assets = treelem.loc[treelem.PARENTID == fl_id, 'TREEELEMID']
-        for asset in assets:
-            mp_in_asset = list(treelem.loc[treelem.PARENTID == asset, 'NAME'])
-            mp_in_fl = mp_in_fl + mp_in_asset
-            #Checking for duplications in asset
-            first_in_asset = True
-            for name in set(mp_in_asset):
-                name_count = mp_in_asset.count(name)
-                if (name_count > 1) & first_in_asset:
-                    duplication_problems['dupl_in_assets'][asset] = []
-                    first_in_asset = False
-                
-                if name_count > 1:
-                    duplication_problems['dupl_in_assets'][asset].append(name)
-                    log.warning(f'Asset {asset} contains points with duplicated names: List of duplicated names are: {", ".join(duplication_problems["dupl_in_assets"][asset])}')
-        
-        #Counting duplications for FL
-        first_in_fl = True
-        for name in set(mp_in_fl):
-            name_count = mp_in_fl.count(name)
-            if (name_count > 1) & first_in_fl:
-                duplication_problems['dupl_in_fl'][fl_id] = []
-                first_in_fl = False
-            if name_count > 1:
-                duplication_problems['dupl_in_fl'][fl_id].append(name)
-                log.warning(f'FL {fl_id} contains points with duplicated names: List of duplicated names are: {", ".join(duplication_problems["dupl_in_fl"][fl_id])}')
-    
-    #Generating common table with issues
-    resulted_table = pd.DataFrame()
-    for fl_problem_id in duplication_problems['dupl_in_fl'].keys():
-        tmp_row = treelem.loc[treelem.TREEELEMID == fl_problem_id, ['TREEELEMID', 'Path']]
-        tmp_row['Problem'] = f'FL has points with duplicated names: {duplication_problems["dupl_in_fl"][fl_problem_id]}'
-        resulted_table = pd.concat([resulted_table, tmp_row])
-    for asset_problem_id in duplication_problems['dupl_in_assets'].keys():
-        tmp_row = treelem.loc[treelem.TREEELEMID == asset_problem_id, ['TREEELEMID', 'Path']]
-        tmp_row['Problem'] = f'FL has points with duplicated names: {duplication_problems["dupl_in_assets"][asset_problem_id]}'
-        resulted_table = pd.concat([resulted_table, tmp_row])    
-    resulted_table.reset_index(drop = True, inplace = True)
-    
-    return resulted_table
-                
-def validate_treelems(tree_df = pd.DataFrame(), 
-                      logger = ''):
+
+def apply_treelem_dtypes(treelem = pd.DataFrame(),
+                         logger = ''):
     # Setting logger
     log = logging.getLogger(logger)
-    
-    validated = True
-    if not isinstance(tree_df, pd.DataFrame):
-        log.warning(f'Provided input has incorrect type. Required type: pd.DatFrame, received input: {type(tree_df)}')
-        return None
-    
-    required_columns = ['TREEELEMID', 'PARENTID', 'CONTAINERTYPE', 'NAME', 
-                        'ELEMENTENABLE', 'PARENTENABLE', 'ChannelEnable', 'HIERARCHYTYPE',
-                        'TBLSETID', 'BRANCHLEVEL', 'PointUnitType', 'FilterEnvelope',
-                        'PointSensorUnitType', 'PointOrientation', 'PointLocation', 'DADType',
-                        'FilterKey', 'SCALARALRMID', 'ALARMMETHOD', 'DANGERHI', 'DANGERLO',
-                        'ALERTHI', 'ALERTLO', 'ENABLEALERTHI', 'ENABLEALERTLO',
-                        'ENABLEDANGERHI', 'ENABLEDANGERLO']
-    if set(required_columns).issubset(tree_df.columns):
-        log.info(f'Provided dataframe has all necessary information for the analysis: {tree_df.columns}')
-    else:
-        missing_columns = list(set(required_columns) - set(tree_df.columns))
-        log.warning(f'Provided dataframe contains not all information needed. Check the input. Missing columns: {missing_columns}')
-        validated = False
-    
-    if len(tree_df) == 0:
-        log.warning(f'Provided dataframe is empty.')
-        validated = False
-    
-    return validated
+
+    memory_before = treelem.memory_usage(deep = True).sum()
+    for col, col_type in treelem_schema.items():
+        if col not in treelem.columns:
+            continue
+        values = treelem[col]
+        has_na = values.isna().any()
+        if col_type == 'category':
+            #Categorical saves memory only if values are repeated
+            if values.nunique(dropna = True) <= len(values)/2:
+                treelem[col] = values.astype('category')
+        elif col_type in ['id', 'flag']:
+            if values.dtype.kind not in 'biuf':
+                continue
+            if has_na:
+                #Integers can't have missing values. Float32 is used if it keeps all values
+                casted = values.astype('float32')
+                if np.array_equal(casted.to_numpy(dtype = 'float64'), values.to_numpy(dtype = 'float64'), equal_nan = True):
+                    treelem[col] = casted
+            elif col_type == 'flag' and values.isin([0, 1]).all():
+                treelem[col] = values.astype('uint8')
+            elif (values % 1 == 0).all():
+                treelem[col] = pd.to_numeric(values.astype('int64'), downcast = 'integer')
+        elif col_type == 'float32' and values.dtype.kind == 'f':
+            casted = values.astype('float32')
+            if np.array_equal(casted.to_numpy(dtype = 'float64'), values.to_numpy(dtype = 'float64'), equal_nan = True):
+                treelem[col] = casted
+    memory_after = treelem.memory_usage(deep = True).sum()
+    log.info('Data types of TREEELEM were optimized', extra = {'memory_before_mb': round(memory_before/2**20, 2),
+                                                               'memory_after_mb': round(memory_after/2**20, 2),
+                                                               'rows': len(treelem)})
+    return treelem
+
+def load_treelems(filename = '', 
+                  logger = ''):
+    # Reading TREEELEM export and converting columns to memory efficient types
+    treelem = pd.read_csv(filename)
+    return apply_treelem_dtypes(treelem, logger)
    
-def check_thresholds(treelem = pd.DataFrame(), 
-                    logger = ''):
-    # Setting logger
-    log = logging.getLogger(logger)
-    
-    #Validationof the input
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    #Creatnig list of points without thresholds
-    points_wo_alarms = treelem.loc[(treelem.CONTAINERTYPE == 4) & 
-                               treelem.SCALARALRMID.isna() &  
-                               ~treelem.NAME.isin(['MA SIT', 'MI SIT']), ['TREEELEMID','NAME', 'Path']]
-
-    #Checking if the thresholds are in correct sequence
-    tmp_df = treelem[~treelem.SCALARALRMID.isna()]
-    tmp_df.reset_index(drop = True, inplace = True)
-    
-    results_thresh = {'wrong_alarms': []}
-    #Analysing 
-    for i in range(len(tmp_df)):
-        alarms = list(tmp_df.loc[i, ['DANGERLO', 'ALERTLO', 'ALERTHI', 'DANGERHI']])
-        enabled = list(tmp_df.loc[i, ['ENABLEDANGERLO', 'ENABLEALERTLO', 'ENABLEALERTHI', 'ENABLEDANGERHI']])
-        enabled_alarms = [x for y, x in enumerate(alarms) if enabled[y] != 0]
-        good_alarms = all(enabled_alarms[i] < enabled_alarms[i+1] for i in range(len(enabled_alarms) - 1))
-        if not good_alarms:
-            results_thresh['wrong_alarms'].append(tmp_df.loc[i, 'TREEELEMID'])
-            log.warning(f'MP with ID {tmp_df.loc[i, "TREEELEMID"]} has a wrong thresholds set.')
-
-    wrong_alarms = treelem.loc[treelem.TREEELEMID.isin(results_thresh['wrong_alarms']), ['TREEELEMID', 'NAME', 'Path']]   
-    return {'threshold_issues': wrong_alarms,
-            'points_wo_alarms': points_wo_alarms}
             
-def check_location(treelem = pd.DataFrame(), 
-                    logger = ''):
-    # Setting logger
-    log = logging.getLogger(logger)
     
-    # Validation of the input
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    tmp_df = treelem[(treelem.CONTAINERTYPE == 4) & (~treelem.NAME.isin(['MI SIT', 'MA SIT']))]
-    tmp_df.reset_index(drop = True, inplace = True)
-    #treelem['PointLocation'] = [np.NaN if pd.isnull(x) else x for x in treelem['PointLocation']]
-    
-    locations_name = []
-    for name in tmp_df['NAME']:
-        try:
-            number = re.search('[0-9]{1,3}', name).group(0)
-            locations_name.append(str(int(number)))
-        except AttributeError:
-            locations_name.append(None)
-    locations_set = list(tmp_df['PointLocation'])
-    for i in range(len(locations_set)):
-        try: 
-            locations_set[i] = str(int(locations_set[i]))
-        except:
-            locations_set[i] = str(locations_set[i])
+   
+def stat_flags(treelem = pd.DataFrame(),
+               logger = ''):
+    #Boolean flags of each node used by statistics. Every counter of db_stat is a sum
+    #of one column, so counters for many customers are a single groupby sum
+    assets_mask = (treelem.CONTAINERTYPE == 3).to_numpy()
+    mp_mask = (treelem.CONTAINERTYPE == 4).to_numpy()
+    fl_mask = treelem.TREEELEMID.isin(treelem.PARENTID[assets_mask]).to_numpy()
+    disabled = (propagate_disabled(treelem, treelem.TREEELEMID[fl_mask], logger) == 0).to_numpy()
+    alarm = treelem.SCALARALRMID.notna().to_numpy()
+    return pd.DataFrame({'n_fl': fl_mask,
+                         'n_assets': assets_mask,
+                         'n_mp': mp_mask,
+                         'n_dis_fl': fl_mask & disabled,
+                         'n_dis_assets': assets_mask & disabled,
+                         'n_dis_mp': mp_mask & disabled,
+                         'n_alarms': mp_mask & alarm})
 
-    locations_set = [str(x) for x in locations_set]
-    
-    diff = [lset != lname for lset, lname in zip(locations_set, locations_name)]
-    tmp_df['Location'] = locations_set
-    results_df = tmp_df.loc[diff, ['TREEELEMID', 'NAME', 'Location', 'Path']]
-    #results_df['Path'] = [create_path(node_id = x, treelem = treelem) for x in results_df.TREEELEMID]
+def percent(part, total):
+    #Percentage of the counter, vectorized for columns of the customers table
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.round(np.divide(part, total)*100, 2)
 
-    return results_df.to_dict()
-    
-def check_orientation(treelem = pd.DataFrame(),
-                      logger = ''):
-    # Setting logger
-    log = logging.getLogger(logger)
-    
-    # Validation of the input
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    tmp_df = treelem[(treelem.CONTAINERTYPE == 4) & (~treelem.NAME.isin(['MI SIT', 'MA SIT']))]
-    tmp_df.reset_index(drop = True, inplace = True)
-    #treelem['PointLocation'] = [np.NaN if pd.isnull(x) else x for x in treelem['PointLocation']]
-    
-    orientations_name = []
-    orientation_mapping = {'H': 'Horizontal', 'V': 'Vertical', 'A': 'Axial', 'R': 'Radial'}
-    for name in tmp_df['NAME']:
-            try:
-                orientation = re.search('(^\w{2})?( |^)[0-9]{1,3}(A|H|V|R)', name).group(0)
-                orientations_name.append(orientation_mapping[orientation[-1]])
-            except AttributeError:
-                orientations_name.append(None)
-    orientations_set = list(tmp_df['PointOrientation'])
-    
-    diff = [oset != oname for oset, oname in zip(orientations_set, orientations_name)]
-    
-    tmp_df['Orientation'] = orientations_set
-    results_df = tmp_df.loc[diff, ['TREEELEMID', 'NAME', 'Orientation', 'Path']]
-    #results_df['Path'] = [create_path(node_id = x, treelem = treelem) for x in results_df.TREEELEMID]
+def labels_count(values = pd.Series(dtype = object),
+                 labels = {}):
+    #Counting of codes (DAD types, priorities) and translating them to the labels.
+    #Counting is done on codes, so mapping is applied to few unique values only
+    counts = values.value_counts(dropna = False)
+    counts = counts[counts > 0]
+    index = [labels.get(x, x) for x in counts.index]
+    counts = pd.Series(counts.to_numpy(), index = pd.Index(index, dtype = object))
+    counts = counts.groupby(level = 0, sort = False, dropna = False).sum().sort_values(ascending = False, kind = 'stable')
+    return counts.rename(values.name)
 
-    return results_df.to_dict()
-   
+@instrument()
 def db_stat(treelem = pd.DataFrame(), 
             logger = ''):
     # Setting logger
@@ -507,33 +310,12 @@ def db_stat(treelem = pd.DataFrame(),
         return None
     
     #Creating statistics
-    assets = treelem.loc[treelem.CONTAINERTYPE == 3, ['NAME', 'TREEELEMID', 'PARENTID', 'NodePriority']]
-    fl_id = list(assets.PARENTID.unique())
-    fls = treelem.loc[treelem.TREEELEMID.isin(fl_id), ['NAME', 'TREEELEMID']]
-    #General statistics
-    n_mp = len(treelem[treelem.CONTAINERTYPE == 4])
-    n_assets = len(assets)
-    n_fl = len(fls)
-    
-    #Disabled Statistics
-    #Creating clear identification for disabled points
-    for fl in fls.TREEELEMID:
-        if treelem.loc[treelem.TREEELEMID == fl, 'ELEMENTENABLE'].item() == 0:
-            log.warning(f'All assets inside FL will be marked and counted as disabled.', extra= {'type of node': 'FL', 'Node ID': fl, 'disability status': 'disabled'})
-            treelem.loc[treelem.PARENTID == fl, 'ELEMENTENABLE'] = 0
-    for asset in assets.TREEELEMID:
-        if treelem.loc[treelem.TREEELEMID == asset, 'ELEMENTENABLE'].item() == 0:
-            log.warning(f'All mp inside asset will be marked and counted as disabled.', extra = {'type of node': 'Asset', 'Node ID': asset, 'disability status': 'disabled'})
-            treelem.loc[treelem.PARENTID == asset, 'ELEMENTENABLE'] = 0
-
-    n_dis_mp = len(treelem[(treelem.CONTAINERTYPE == 4) & (treelem.ELEMENTENABLE == 0)])
+    #General and disabled statistics. Disabled FL and assets are propagated to their children
+    counters = stat_flags(treelem, logger).sum()
+    n_fl, n_assets, n_mp = int(counters.n_fl), int(counters.n_assets), int(counters.n_mp)
+    n_dis_fl, n_dis_assets, n_dis_mp = int(counters.n_dis_fl), int(counters.n_dis_assets), int(counters.n_dis_mp)
     n_dis_mp_perc = round(n_dis_mp/n_mp*100, 2)
-    
-    n_dis_assets = len(treelem[(treelem.CONTAINERTYPE == 3)&(treelem.ELEMENTENABLE == 0)])
     n_dis_assets_perc = round(n_dis_assets/n_assets*100, 2)
-    
-    mask_disfl = (treelem.TREEELEMID.isin(fl_id))&(treelem.ELEMENTENABLE == 0) 
-    n_dis_fl = len(treelem[mask_disfl])
     n_dis_fl_perc = round(n_dis_fl/n_fl*100, 2)
 
     if n_dis_mp > 0:
@@ -541,17 +323,22 @@ def db_stat(treelem = pd.DataFrame(),
     else:
         log.info('Customer doesn\'t have disabled assets')
     
+    assets = treelem.loc[treelem.CONTAINERTYPE == 3, ['FilterKey', 'NodePriority']]
+    mps = treelem.loc[treelem.CONTAINERTYPE == 4, ['NAME', 'DADType', 'SCALARALRMID', 'TREEELEMID']]
+    
     #FilterKey Statistics
-    filter_key_stat = treelem.loc[treelem.CONTAINERTYPE == 3, 'FilterKey'].value_counts(dropna=False)
+    filter_key_stat = assets.FilterKey.value_counts(dropna=False)
+    #Categorical columns count also categories which are not presented among assets
+    filter_key_stat = filter_key_stat[filter_key_stat > 0].rename('FilterKey')
             
     #Names Statistics
-    names = treelem.loc[treelem.CONTAINERTYPE == 4, 'NAME'].value_counts(dropna = False)
+    names = mps.NAME.value_counts(dropna = False)
+    names = names[names > 0].rename('NAME')
     
     #Points with Thresholds
-    n_alarms = len(treelem[(treelem.CONTAINERTYPE == 4) & (~pd.isnull(treelem.SCALARALRMID))])
+    n_alarms = int(counters.n_alarms)
     mp_w_alarm_perc = round(n_alarms/n_mp*100, 2)
-    points_wo_alarms = treelem.loc[(treelem.CONTAINERTYPE == 4) & (pd.isnull(treelem.SCALARALRMID)), ['TREEELEMID']]
-    points_wo_alarms.set_index('TREEELEMID', inplace = True)
+    points_wo_alarms = pd.DataFrame(index = mps.loc[mps.SCALARALRMID.isna(), 'TREEELEMID'])
     
 
     #DAD statistics
@@ -562,11 +349,7 @@ def db_stat(treelem = pd.DataFrame(),
         184: 'Manual Point', 
         792: 'Derived Point',
         1159: 'Manual Point'}
-    DAD_types = treelem.loc[treelem.CONTAINERTYPE == 4, ['DADType', 'TREEELEMID']]
-    DAD_types['DADType'] = [dad_map[x] if x in dad_map.keys() else x for x in DAD_types['DADType']]
-    DAD_types.set_index('TREEELEMID', inplace = True)
-    DAD_types = DAD_types['DADType'].value_counts(dropna = False)
-    # Need to add mapping to DAD types in order to present not values but Names of the DAD
+    DAD_types = labels_count(mps.DADType, dad_map)
 
     #Priority statistics
     priorities_map = {
@@ -577,8 +360,7 @@ def db_stat(treelem = pd.DataFrame(),
         4: 'Low',
         5: 'Lowest'
     }
-    assets['NodePriority'] = [priorities_map[x] if x in priorities_map.keys() else x for x in assets['NodePriority']]
-    priority = assets['NodePriority'].value_counts(dropna = False)
+    priority = labels_count(assets.NodePriority, priorities_map)
 
 
     fl_line = f'FL: {n_fl} incl. {n_dis_fl} ({n_dis_fl_perc}% disabled.)'
@@ -597,10 +379,36 @@ def db_stat(treelem = pd.DataFrame(),
              'priorities': priority}
     
     return result
+
+@instrument()
+def db_stat_customers(treelems = {}, 
+                      logger = ''):
+    #Statistics table for many customers at once. treelems is a dictionary 
+    #{customer: hierarchy}. Flags of all customers are aggregated by one groupby,
+    #returns data frame with one row per customer
+    log = logging.getLogger(logger)
+    
+    flags = []
+    for customer, treelem in treelems.items():
+        if not validate_treelems(treelem, logger):
+            log.warning('Customer %s is skipped in statistics table', customer)
+            continue
+        flags.append(stat_flags(treelem, logger).assign(Customer = customer))
+    if len(flags) == 0:
+        return pd.DataFrame()
+    
+    table = pd.concat(flags, ignore_index = True).groupby('Customer', sort = False).sum()
+    table = table.assign(n_dis_fl_perc = percent(table.n_dis_fl, table.n_fl),
+                         n_dis_assets_perc = percent(table.n_dis_assets, table.n_assets),
+                         n_dis_mp_perc = percent(table.n_dis_mp, table.n_mp),
+                         mp_w_alarm_perc = percent(table.n_alarms, table.n_mp))
+    log.info('Statistics table is created for %s customers', len(table))
+    return table.reset_index()
         
 def create_path(node_id = 1, 
                treelem = pd.DataFrame(), 
-               logger = ''):
+               logger = '',
+               index = None):
     # Setting logger
     log = logging.getLogger(logger)
     
@@ -608,281 +416,241 @@ def create_path(node_id = 1,
     if not validate_treelems(treelem, logger):
         return None
     
-    level = treelem.loc[treelem.TREEELEMID == node_id, 'BRANCHLEVEL'].item()
-    node_name = treelem.loc[treelem.TREEELEMID == node_id, 'NAME'].item()
-    path = str(node_name)
-    while level > treelem.BRANCHLEVEL.min()+1:
-        parent_id = treelem.loc[treelem.TREEELEMID == node_id, 'PARENTID'].item()
-        parent_name = treelem.loc[treelem.TREEELEMID == parent_id, 'NAME'].item()
-        level = treelem.loc[treelem.TREEELEMID == parent_id, 'BRANCHLEVEL'].item()
-        node_id = parent_id
-        path = parent_name + "/" + path
-    return path
-
-def check_type_enveleope(treelem = pd.DataFrame(),
-                   logger = ''):
-    # Setting logger
-    log = logging.getLogger(logger)
-       
-    # Validation of the input
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    #Retrieving Points 
-    points = treelem[(treelem.CONTAINERTYPE == 4) & ~treelem.NAME.isin(['MA SIT', 'MI SIT'])]
-    
-    units_maping = {'in/s': 'velocity',
-                    'mm/s': 'velocity',
-                    'g': 'acceleration',
-                    'gE': 'envelope',
-                    'RPM': 'speed',
-                    'Hz': 'speed',
-                    'F': 'temp',
-                    'C': 'temp'}
-    regex_types = {
-        'velocity': '(^\w*)?( |^)\d*.*V( |$)',
-        'temp': '(^\w*)?( |^)\d*.*T( |$)',
-        'speed': '(^\w*)?( |^)\d*.*S( |$)',
-        'envelope': '(^\w*)?( |^)\d*.*((E1)|(E2)|(E3)|(E4))( |$)',
-        'acceleration': '(^\w*)?( |^)\d*.*A( |$)'
-    }
-    points['meas_type'] = [units_maping[x] if x in units_maping.keys() else 'undefined' for x in points.PointUnitType]
-    types_in_treelem = list(set(points.meas_type))
-    print(types_in_treelem)
-    settings_prob = {'TREEELEMID': [],
-                     'NAME': [],
-                     'Type': [],
-                     'Envelope': [],
-                     'Path': []}
-    for point_type in types_in_treelem:
-        print(point_type)
-        if point_type == 'undefined':
-            continue
-        point_names = points.loc[points.meas_type == point_type, ['NAME', 'TREEELEMID', 'FilterEnvelope', 'PointUnitType', 'Path']]
-        regex = regex_types[point_type]
-        r_point_type = re.compile(regex)
-        bad_meastype = point_names[~point_names.NAME.str.contains(regex)]
-        if len(bad_meastype) > 0:
-            log.warning(f'Following points has discrepancies between settings and name: {[bad_meastype.TREEELEMID]}')
-            settings_prob['TREEELEMID'] = settings_prob['TREEELEMID'] + list(bad_meastype.TREEELEMID)
-            settings_prob['NAME'] = settings_prob['NAME'] + list(bad_meastype.NAME)
-            settings_prob['Type'] = settings_prob['Type'] + list(bad_meastype.PointUnitType)
-            settings_prob['Envelope'] = settings_prob['Envelope'] + len(bad_meastype.PointUnitType)*[np.NaN]
-            settings_prob['Path'] = settings_prob['Path'] + list(bad_meastype.Path)
-        if point_type == 'envelope':
-            point_names.FilterEnvelope = ['E'+str(int(x) - 20599) if x in [20600, 20601, 20602, 20603] else 'Undefined Filter in DB' for x in point_names.FilterEnvelope]
-            bad_filter = point_names[[y not in x for x,y in zip(point_names.NAME, point_names.FilterEnvelope)]]
-            if len(bad_filter) > 0:
-                log.warning(f'Following points has wrong envelope filter: {[bad_filter.TREEELEMID]}')
-                settings_prob['TREEELEMID'] = settings_prob['TREEELEMID'] + list(bad_filter.TREEELEMID)
-                settings_prob['NAME'] = settings_prob['NAME'] + list(bad_filter.NAME)
-                settings_prob['Type'] = settings_prob['Type'] + len(bad_filter.FilterEnvelope)*[np.NaN]
-                settings_prob['Envelope'] = settings_prob['Envelope'] + list(bad_filter.FilterEnvelope)
-                settings_prob['Path'] = settings_prob['Path'] + list(bad_filter.Path)
-    
-    #settings_prob['Path'] = [create_path(node_id = x, treelem = treelem) for x in settings_prob['TREEELEMID']]
-    
-    return settings_prob
+    #Index can be provided when path is created for many nodes of the same hierarchy
+    if index is None:
+        index = build_tree_index(treelem, logger)
+    row = node_rows(index, [node_id])[0]
+    names = treelem.NAME.to_numpy()
+    #Path starts from the level below the root
+    path = [str(names[row])]
+    parent = index['parent'][row]
+    while parent >= 0 and index['depth'][parent] > 0:
+        path.insert(0, str(names[parent]))
+        parent = index['parent'][parent]
+    return "/".join(path)
 
-#More efficient code with numpy arrays.
-# Think about creating hierarchy for max asset levels. That can help with performance issues, especially for very big customers.
-# The idea is to create path for assets and for measurement points just add path to specific asset.
+
+#Path is created level by level. For each level paths of parents are looked up 
+#by id in one operation, so the cost is linear in number of nodes for each level.
+@instrument()
 def define_path(data, logger = ''):
     log = logging.getLogger(logger)
-    path = [[x] for x in data[:, 2]]
-    levels = np.unique(data[:, 4])
-    data = np.insert(data, 5, '', axis =1)
-    for level in levels:
+    data = pd.DataFrame(data, columns = ['TREEELEMID', 'PARENTID', 'NAME', 'CONTAINERTYPE', 'BRANCHLEVEL'])
+    paths = pd.Series('', index = data.index, dtype = object)
+    for level in np.unique(data.BRANCHLEVEL):
         if level == 0:
             continue
-        tmp_df = data[(data[:,4] == level)]
-        for element in np.unique(tmp_df[:, 0]):
-            parent_id = data[data[:, 0] == element, 1]
-            parent_path = data[data[:, 0] == parent_id, 5]
-            element_name = data[data[:, 0] == element, 2]
-            try:
-                data[data[:, 0] == element, 5] = parent_path + "/" + element_name
-            except:
-                log.warning('unable to update path', extra={'element_name': element_name, 'element_id': element, 'parent_id': parent_id})
-                pass
-    data = pd.DataFrame(data)
-    data.columns = ['TREEELEMID', 'PARENTID', 'NAME', 'CONTAINERTYPE', 'BRANCHLEVEL', 'Path']
+        mask = (data.BRANCHLEVEL == level).to_numpy()
+        lookup = pd.Series(paths.to_numpy(), index = data.TREEELEMID.to_numpy())
+        lookup = lookup[~lookup.index.duplicated()]
+        parent_path = data.loc[mask, 'PARENTID'].map(lookup)
+        missing = parent_path.isna()
+        if missing.any():
+            log.warning('unable to update path', extra={'element_id': names_sample(list(data.loc[mask, 'TREEELEMID'][missing])), 
+                                                        'parent_id': names_sample(list(data.loc[mask, 'PARENTID'][missing]))})
+        paths[mask] = (parent_path + "/" + data.loc[mask, 'NAME'].astype(str)).fillna('').to_numpy()
+    data['Path'] = paths
     return data
 
-def check_duplications(treelem = pd.DataFrame(), 
-                       logger = ''):
-    
+@instrument()
+def enrich_hierarchy(treelem = pd.DataFrame(),
+                     logger = ''):
     # Setting logger
     log = logging.getLogger(logger)
-    
-    # Validation of the imput.
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    #Duplications problems
-    log.info(f'Checking hierarchy for ducplicated names in the same FL')
-    duplication_problems = {'dupl_in_fl': {},
-                            'dupl_in_assets': {}}
-    fls_id = set(treelem.loc[treelem.CONTAINERTYPE == 3, 'PARENTID'])
-    fls = treelem.loc[treelem.TREEELEMID.isin(list(fls_id)), ['NAME', 'TREEELEMID']]
-    for fl_id in fls.TREEELEMID:
-        mp_in_fl = []
-        assets = treelem.loc[treelem.PARENTID == fl_id, 'TREEELEMID']
-        for asset in assets:
-            mp_in_asset = list(treelem.loc[treelem.PARENTID == asset, 'NAME'])
-            mp_in_fl = mp_in_fl + mp_in_asset
-            #Checking for duplications in asset
-            first_in_asset = True
-            for name in set(mp_in_asset):
-                name_count = mp_in_asset.count(name)
-                if (name_count > 1) & first_in_asset:
-                    duplication_problems['dupl_in_assets'][asset] = []
-                    first_in_asset = False
-                
-                if name_count > 1:
-                    duplication_problems['dupl_in_assets'][asset].append(name)
-        
-        #Counting duplications for FL
-        first_in_fl = True
-        for name in set(mp_in_fl):
-            name_count = mp_in_fl.count(name)
-            if (name_count > 1) & first_in_fl:
-                duplication_problems['dupl_in_fl'][fl_id] = []
-                first_in_fl = False
-            if name_count > 1:
-                duplication_problems['dupl_in_fl'][fl_id].append(name)
-                log.warning(f'FL {fl_id} contains points with duplicated names: List of duplicated names are: {", ".join(duplication_problems["dupl_in_fl"][fl_id])}')
-    
-    #Generating common table with issues
-    resulted_table = pd.DataFrame()
-    for fl_problem_id in duplication_problems['dupl_in_fl'].keys():
-        tmp_row = treelem.loc[treelem.TREEELEMID == fl_problem_id, ['TREEELEMID', 'Path']]
-        tmp_row['Problem'] = f'FL has points with duplicated names: {duplication_problems["dupl_in_fl"][fl_problem_id]}'
-        resulted_table = pd.concat([resulted_table, tmp_row])
-    for asset_problem_id in duplication_problems['dupl_in_assets'].keys():
-        tmp_row = treelem.loc[treelem.TREEELEMID == asset_problem_id, ['TREEELEMID', 'Path']]
-        tmp_row['Problem'] = f'FL has points with duplicated names: {duplication_problems["dupl_in_assets"][asset_problem_id]}'
-        resulted_table = pd.concat([resulted_table, tmp_row])    
-    resulted_table.reset_index(drop = True, inplace = True)
-    
-    return resulted_table
 
-def check_hierarchy(treelem = pd.DataFrame(), 
-                       logger = ''):
-    
+    #Path for each node of hierarchy, measurement points get path of the asset plus own name
+    pathdf = define_path(np.array(treelem[['TREEELEMID', 'PARENTID', 'NAME', 'CONTAINERTYPE', 'BRANCHLEVEL']]), logger)
+
+    #Functional locations are parents of assets
+    assets_mask = treelem.CONTAINERTYPE == 3
+    asset_ids = treelem.loc[assets_mask, 'TREEELEMID']
+    fl_id = treelem.loc[assets_mask, 'PARENTID'].unique()
+
+    #Filter Key of the asset for each measurement point
+    asset_filterkey = pd.Series(treelem.loc[assets_mask, 'FilterKey'].to_numpy(), index = asset_ids.to_numpy())
+    asset_filterkey = asset_filterkey[~asset_filterkey.index.duplicated()]
+    asset_type = treelem.PARENTID.map(asset_filterkey).astype(object)
+    asset_type[~treelem.PARENTID.isin(asset_ids)] = None
+
+    #Short notation of envelope filter: 20600 -> E1 ... 20603 -> E4
+    envelope = treelem.FilterEnvelope
+    envelope_mask = envelope.isin([20600, 20601, 20602, 20603])
+    envelope_label = pd.Series('', index = treelem.index, dtype = object)
+    envelope_label[envelope_mask] = 'E' + (envelope[envelope_mask].astype(int) - 20599).astype(str)
+
+    #Type of the node for disabled nodes table
+    node_type = np.select([treelem.TREEELEMID.isin(fl_id), treelem.CONTAINERTYPE == 4, assets_mask],
+                          ['FL', 'MP', 'Asset'], default = 'System and higher')
+
+    log.info('Hierarchy enriched', extra = {'nodes': len(treelem), 'assets': len(asset_ids), 'fl': len(fl_id)})
+    return treelem.assign(Path = pathdf['Path'].to_numpy(),
+                          ELEMENTENABLE = propagate_disabled(treelem, fl_id, logger),
+                          AssetType = asset_type,
+                          EnvelopeLabel = envelope_label,
+                          NodeType = node_type)
+
+
+@instrument()
+def collect_node_issues(treelem = pd.DataFrame(),
+                        issues = {},
+                        index = None,
+                        logger = ''):
     # Setting logger
     log = logging.getLogger(logger)
-    
-    # Validation of the imput.
-    if not validate_treelems(treelem, logger):
-        return None
-    # Checking that the hierarchy has at least certain amount of layers
-    wrong_hier_mask = (treelem.CONTAINERTYPE == 3) & (treelem.BRANCHLEVEL <= 1)
-    df_wrong = treelem.loc[wrong_hier_mask, ['TREEELEMID', 'Path']]
-    df_wrong['Problem'] = 'Too short hierarchy'
-    
-    return df_wrong
 
-def check_sequence(treelem = pd.DataFrame(), 
-                       logger = ''):
-    
+    #Common table of issues of all the checks, one row per node and problem.
+    #issues is a dictionary {check: data frame with TREEELEMID and Problem columns}.
+    #Entry and Exit of the tree index are added, so issues of any subtree are
+    #selected by interval Entry <= x < Exit without going through the hierarchy
+    if index is None:
+        index = build_tree_index(treelem, logger)
+    tables = []
+    for check, table in issues.items():
+        if table is None or len(table) == 0:
+            continue
+        problem = table['Problem'].to_numpy(dtype = object) if 'Problem' in table.columns else check
+        tables.append(pd.DataFrame({'TREEELEMID': table['TREEELEMID'].to_numpy(), 'Check': check, 'Problem': problem}))
+    if len(tables) == 0:
+        return pd.DataFrame(columns = ['TREEELEMID', 'Path', 'Check', 'Problem', 'Entry', 'Exit'])
+    node_issues = pd.concat(tables, ignore_index = True)
+    rows = node_rows(index, node_issues.TREEELEMID)
+    known = rows >= 0
+    node_issues = node_issues.assign(Path = np.where(known, treelem.Path.to_numpy()[np.maximum(rows, 0)], None),
+                                     Entry = np.where(known, index['entry'][np.maximum(rows, 0)], -1),
+                                     Exit = np.where(known, index['exit'][np.maximum(rows, 0)], -1))
+    log.info('%s issues are collected from %s checks', len(node_issues), len(tables))
+    return node_issues[['TREEELEMID', 'Path', 'Check', 'Problem', 'Entry', 'Exit']]
+
+@instrument()
+def rollup_issues(treelem = pd.DataFrame(),
+                  node_issues = pd.DataFrame(),
+                  index = None,
+                  logger = ''):
     # Setting logger
     log = logging.getLogger(logger)
-    
-    # Validation of the imput.
-    if not validate_treelems(treelem, logger):
-        return None
-    
-    fls_id = set(treelem.loc[treelem.CONTAINERTYPE == 3, 'PARENTID'])
-    #Check if we have wrong hierarchy than we can have fl_id which is the same as hierarchy ID
-    if treelem.loc[treelem.BRANCHLEVEL == 0, 'TREEELEMID'].item() in list(fls_id):
-        fls_id.remove(treelem.loc[treelem.BRANCHLEVEL == 0, 'TREEELEMID'].item())
-    fls = treelem.loc[treelem.TREEELEMID.isin(list(fls_id)), ['NAME', 'TREEELEMID']]
-    mp_in_fl = {}
-    for fl_id in list(fls['TREEELEMID']):
-        mp_in_fl[fl_id] = []
-        asset_ids = list(treelem.loc[treelem.PARENTID == fl_id, 'TREEELEMID'])
-        for asset_id in asset_ids:
-            mp_names = list(treelem.loc[(treelem.PARENTID == asset_id) & (treelem.CONTAINERTYPE == 4), 'NAME'])
-            mp_in_fl[fl_id] = mp_in_fl[fl_id] + mp_names
-        log.info(f'FL with id {fl_id} has {len(mp_in_fl[fl_id])} measurement points with following names: {mp_in_fl[fl_id]}')
-    
-    
-    sequence_problems = {}        
-    for fl_id in mp_in_fl.keys():
-        sequence_in_fl = []
-        for name in set(mp_in_fl[fl_id]):
-            try:
-                number = re.search('^((MA)|(MI)|(ME)|(OS)|(TO)|(DV)|(OI))?( |^)[0-9]{1,3}', name).group(0)
-                number = re.search('[0-9]{1,3}', number).group(0)
-                if int(number) > 99:
-                    pass
-                else:
-                    sequence_in_fl.append(number)
-            except AttributeError:
-                pass
-        sequence_in_fl = list(set(sequence_in_fl))
-        sequence_in_fl = [int(x) for x in sequence_in_fl]
-        if len(sequence_in_fl) > 0:
-            meas_location_count = max(sequence_in_fl)
-            meas_location_theory = set(range(1, int(meas_location_count) + 1))
-            missing_meas_location = list(set(meas_location_theory) - set(sequence_in_fl))
-        else:
-            missing_meas_location = []
-        if len(missing_meas_location) > 0:
-            log.warning(f'We have a missing measurement location in the FL {fl_id}. Missing measurement locations are: {missing_meas_location}')
-            sequence_problems[fl_id] = missing_meas_location
-    
-    resulted_table = pd.DataFrame()
-    for id_wrong_seq in sequence_problems.keys():
-        df_wrong = treelem.loc[treelem.TREEELEMID == id_wrong_seq, ['TREEELEMID', 'Path']]
-        df_wrong['Problem'] = f'Locations {", ".join([str(x) for x in sequence_problems[id_wrong_seq]])} is/are missing in FL' 
-        resulted_table = pd.concat([resulted_table, df_wrong])
-    resulted_table.reset_index(drop = True, inplace = True)
-    return resulted_table
 
-def check_motors(treelem = pd.DataFrame(), 
-                       logger = ''):
+    #Issues of every check are rolled up the hierarchy (MP -> asset -> FL -> system -> root).
+    #Score of the node is number of issues in its subtree. Returns table with a column
+    #per check for the nodes with at least one issue in the subtree
+    if index is None:
+        index = build_tree_index(treelem, logger)
+    checks = list(node_issues.Check.unique()) if len(node_issues) > 0 else []
+    rows = node_rows(index, node_issues.TREEELEMID) if len(node_issues) > 0 else np.array([], dtype = np.int64)
+    codes = pd.Categorical(node_issues.Check, categories = checks).codes.astype(np.int64) if len(node_issues) > 0 else rows
+    known = rows >= 0
+    #Own issues of the nodes, one column per check
+    own = np.bincount(rows[known]*len(checks) + codes[known], minlength = len(treelem)*len(checks))
+    own = own.astype(np.int32).reshape(len(treelem), len(checks))
+    rolled = subtree_sums(index, own)
+    score = rolled.sum(axis = 1)
+    
+    mask = score > 0
+    parent = index['parent'][mask]
+    rollup = pd.DataFrame(rolled[mask], columns = checks)
+    rollup.insert(0, 'TREEELEMID', treelem.TREEELEMID.to_numpy()[mask])
+    rollup.insert(1, 'PARENTID', np.where(parent >= 0, index['ids'][np.maximum(parent, 0)], None))
+    rollup.insert(2, 'NAME', treelem.NAME.to_numpy()[mask])
+    rollup.insert(3, 'Path', treelem.Path.to_numpy()[mask])
+    rollup.insert(4, 'CONTAINERTYPE', treelem.CONTAINERTYPE.to_numpy()[mask])
+    rollup.insert(5, 'Depth', index['depth'][mask])
+    rollup['Own issues'] = own[mask].sum(axis = 1)
+    rollup['Score'] = score[mask]
+    log.info('Issues are rolled up for %s nodes', len(rollup), extra = {'checks': checks})
+    return rollup
+
+def rollup_figure(rollup = pd.DataFrame(),
+                  max_nodes = 2000,
+                  logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    #Treemap of the issue scores. Measurement points are not shown and only the levels
+    #which fit into max_nodes are drawn, so the figure stays small for large hierarchies
+    nodes = rollup[rollup.CONTAINERTYPE != 4]
+    per_depth = nodes.Depth.value_counts().sort_index().cumsum()
+    max_depth = per_depth[per_depth <= max_nodes].index.max() if (per_depth <= max_nodes).any() else 0
+    nodes = nodes[nodes.Depth <= max_depth]
+    log.info('Treemap of the issues is created for %s nodes up to depth %s', len(nodes), max_depth)
+    checks = [x for x in rollup.columns if x not in ['TREEELEMID', 'PARENTID', 'NAME', 'Path', 'CONTAINERTYPE', 'Depth', 'Own issues', 'Score']]
+    plot_data = nodes[checks + ['Score']].assign(Id = nodes.TREEELEMID.astype(str).to_numpy(),
+                                                 Parent = np.where(nodes.Depth > 0, nodes.PARENTID.astype(str), ''),
+                                                 Name = nodes.NAME.astype(str).to_numpy())
+    figure = px.treemap(plot_data,
+                        ids = 'Id',
+                        parents = 'Parent',
+                        names = 'Name',
+                        values = 'Score',
+                        color = 'Score',
+                        color_continuous_scale = 'Reds',
+                        branchvalues = 'total',
+                        hover_data = checks,
+                        title = 'Issues by hierarchy')
+    figure.update_layout(title_x = 0.5, margin = {'t': 50, 'l': 10, 'r': 10, 'b': 10})
+    return figure
+
+
+@instrument()
+def check_integrity(treelem = pd.DataFrame(),
+                    index = None,
+                    logger = ''):
     
     # Setting logger
     log = logging.getLogger(logger)
     
-    # Validation of the imput.
+    # Validation of the imput. Audit reads Critical column, so empty table is returned
     if not validate_treelems(treelem, logger):
-        return None
-    motors_mask = (treelem.CONTAINERTYPE == 3) & (treelem.FilterKey.isin(['*Motor']))
-    motors = treelem.loc[motors_mask, ['TREEELEMID', 'Path']]
-    seq_in_motor = []
-    resulted_table = pd.DataFrame()
-    for motor_id in motors.TREEELEMID:
-        motors_mps = treelem.loc[treelem.PARENTID == motor_id, ['TREEELEMID', 'NAME']]
-        for name in set(motors_mps['NAME']):
-            try:
-                number = re.search('[1-9]{1,3}', name).group(0)
-                seq_in_motor.append(number)
-            except AttributeError:
-                pass
-        seq_in_motor = [int(x) for x in seq_in_motor]
-        seq_in_motor = list(set(seq_in_motor))
-        print(seq_in_motor)
-        if len(seq_in_motor) != 0:
-            if max(seq_in_motor) > 2:
-                df_wrong = motors[motors.TREEELEMID == motor_id]
-                wrong_ml = [set(seq_in_motor) - set([1,2])]
-                wrong_ml = [str(x) for x in wrong_ml]
-                df_wrong['Problem'] = f'Motor has more than 2 locations for MP(s): {", ".join(wrong_ml)}'                        
-                resulted_table = pd.concat([resulted_table, df_wrong])
-            if max(seq_in_motor) == 1:
-                df_wrong = motors[motors.TREEELEMID == motor_id]
-                df_wrong['Problem'] = f'Motor has less than 2 measurement locations'                        
-                resulted_table = pd.concat([resulted_table, df_wrong])
-        else:
-            df_wrong = motors[motors.TREEELEMID == motor_id]
-            df_wrong['Problem'] = f'Motor has no measurement locations or impossible to detect locations based on names'                        
-            resulted_table = pd.concat([resulted_table, df_wrong])
-                                               
+        return pd.DataFrame(columns = ['TREEELEMID', 'Path', 'Problem', 'Critical'])
+    
+    #Integrity of TREEELEMID/PARENTID relation. Critical problems (no root, several roots,
+    #cycles) make the results of other checks meaningless, so they are reported before
+    #the audit. Orphans and level mismatches are reported together with other issues
+    if index is None:
+        index = build_tree_index(treelem, logger)
+    ids = treelem.TREEELEMID.to_numpy()
+    levels = treelem.BRANCHLEVEL.to_numpy()
+    parent = index['parent']
+    has_parent = parent >= 0
+    self_parent = (treelem.PARENTID == treelem.TREEELEMID).to_numpy()
+    #Nodes without parent in the hierarchy are roots when they are on the top level
+    no_parent = ~has_parent & ~self_parent
+    roots = no_parent & (levels == levels.min())
+    orphans = no_parent & ~roots
+    duplicated = treelem.TREEELEMID.duplicated(keep = False).to_numpy()
+    #Nodes which are not reachable from any node without parent are in a cycle or under it
+    cycles = index['entry'] < 0
+    parent_level = np.where(has_parent, levels[np.maximum(parent, 0)], -1)
+    wrong_level = has_parent & ~cycles & (levels != parent_level + 1)
+    
+    problems = [(duplicated, 'TREEELEMID is not unique', True),
+                (self_parent, 'Node is the parent of itself', True),
+                (cycles, 'Node is in a cycle of parents or under it', True),
+                (orphans, 'Parent of the node is not found (orphan)', False)]
+    if roots.sum() > 1:
+        problems.append((roots, 'Hierarchy has more than one root', True))
+    tables = []
+    for mask, problem, critical in problems:
+        if mask.any():
+            log.warning('%s nodes: %s', int(mask.sum()), problem, extra = {'Node ID': names_sample(list(ids[mask]))})
+            tables.append(pd.DataFrame({'TREEELEMID': ids[mask], 'Problem': problem, 'Critical': critical}))
+    if wrong_level.any():
+        log.warning('%s nodes have BRANCHLEVEL which is not next level of the parent', int(wrong_level.sum()), extra = {'Node ID': names_sample(list(ids[wrong_level]))})
+        tables.append(pd.DataFrame({'TREEELEMID': ids[wrong_level],
+                                    'Problem': [f'BRANCHLEVEL {x} doesn\'t follow level {y} of the parent' for x, y in zip(levels[wrong_level], parent_level[wrong_level])],
+                                    'Critical': False}))
+    if roots.sum() == 0:
+        log.error('Hierarchy has no root')
+        tables.append(pd.DataFrame({'TREEELEMID': [None], 'Problem': 'Hierarchy has no root', 'Critical': True}))
+    if len(tables) == 0:
+        log.info('Hierarchy has one root and no orphans, cycles or level inconsistencies.')
+        return pd.DataFrame(columns = ['TREEELEMID', 'Path', 'Problem', 'Critical'])
+    
+    resulted_table = pd.concat(tables, ignore_index = True)
+    if 'Path' in treelem.columns:
+        rows = node_rows(index, resulted_table.TREEELEMID)
+        resulted_table.insert(1, 'Path', np.where(rows >= 0, treelem.Path.to_numpy()[np.maximum(rows, 0)], None))
     return resulted_table
 
+
 def suggest_name(name = '', logger = ''):
     # Setting logger
     log = logging.getLogger(logger)
@@ -890,7 +658,7 @@ def suggest_name(name = '', logger = ''):
     #Check if we have manual entry RPM/Hz points
     reg_MERPM = re.compile('^manual {1,}entry {1,}\(?((rpm)|(hz))\)?', re.IGNORECASE)
     reg_motor = re.compile('motor', re.IGNORECASE)
-    suggest_name = np.NaN
+    suggest_name = np.nan
     if reg_MERPM.search(name):
         #Need to understand if we have Hz or RPM
         regRPM = re.compile('rpm', re.IGNORECASE)
@@ -920,12 +688,12 @@ def suggest_name(name = '', logger = ''):
     try:
         location = int(re.search('[0-9]{1,3}', name).group(0))
     except AttributeError:
-        location = np.NaN
+        location = np.nan
     
     if ~pd.isna(location):
         if location <= 99:
             location = format(location, '02d')
-        else: location = np.NaN
+        else: location = np.nan
     
     #Checking orientation
     try:
@@ -952,7 +720,7 @@ def suggest_name(name = '', logger = ''):
         suggested_name = str(device) + ' ' + str(location) + str(orientation) + str(m_type) + ' ' + de_nde
         suggested_name = suggested_name.strip()
     else:
-        suggested_name = np.NaN
+        suggested_name = np.nan
 
     #Now it's obligatory to check if the proposed name is according to the settings of the point
     
@@ -1004,21 +772,162 @@ def suggest_settings(resulted_table = pd.DataFrame(),
             
     return resulted_table
 
+def names_figure(names = pd.Series(dtype = int),
+                 top_n = 30):
+    #Bar plot of the most frequent names. All other names are summed in one bar,
+    #so size of the figure doesn't depend on number of distinct names in DB
+    names = names.sort_values(ascending = False)
+    top = names.iloc[:top_n]
+    if len(names) > top_n:
+        other = pd.Series([names.iloc[top_n:].sum()], index = [f'Other ({len(names) - top_n} names)'])
+        top = pd.concat([top, other])
+    name_plot = px.bar(y = top.index.astype(str), 
+                    x = top.to_numpy(), 
+                    orientation='h',  
+                    labels = {'x': 'Number of MP\'s name occurencies in DB', 'y': 'Name of MP in DB'}, 
+                    height=20*len(top) + 100)
+    name_plot.update_layout(yaxis= {'categoryorder': 'array', 'categoryarray': list(top.index.astype(str))[::-1]},
+                            xaxis = {'side': 'top', 'mirror': 'allticks'})
+    return name_plot
+
+def create_names_table(names = pd.DataFrame(), props = None):
+    #Full distribution of the names with server side search and paging.
+    #Properties of the first page can be provided from the cache
+    if props is None:
+        props = page_props(names, page_size = 10)
+    names_table = dt.DataTable(
+        id='names-stat-table', 
+        **props,
+        columns = [{'name': i, 'id': i} for i in ['NAME', 'N occurencies']],
+        style_cell={
+            'textAlign': 'left',
+            'height': 'auto',
+            'width': 'auto',
+            'fontFamily': 'Calibri',
+            'whiteSpace': 'normal',
+            'fontSize': '14px'},
+        style_header = {
+            'fontWeight': 'bold',
+            'fontFamily': 'Calibri',
+            'fontSize': '14px'
+        },
+        style_cell_conditional=[
+        {'if': {'column_id': 'NAME'},
+        'width': '70%'},
+        {'if': {'column_id': 'N occurencies'},
+        'width': '30%'}
+        ])
+    return names_table
+
+def stat_fragments(stat = {}):
+    #Serialized figures and tables of Stat tab created from results of db_stat
+    names_hist = stat['names_stat']
+    names_frame = pd.DataFrame({'NAME': names_hist.index.astype(str), 'N occurencies': names_hist.to_numpy()})
+    dad_pie_df = pd.DataFrame(stat['DAD'])
+    dad_pie = px.pie(values = dad_pie_df.DADType, 
+                    names = dad_pie_df.index, 
+                    title = 'DAD types distribution')
+    dad_pie.update_layout(title_x = 0.5)
+    prio = pd.DataFrame(stat['priorities'])
+    prio_pie = px.pie(values=prio.NodePriority,
+                    names = prio.index,
+                    title = 'Assets criticalities')
+    prio_pie.update_layout(title_x = 0.5)
+    fk_pie_df = pd.DataFrame(stat['filter_key_stat'])
+    fk_pie = px.pie(values=fk_pie_df.FilterKey,
+                    names = fk_pie_df.index,
+                    title = 'Filter Key distribution')
+    fk_pie.update_layout(title_x = 0.5)
+    return {'FL': stat['FL'],
+            'assets': stat['assets'],
+            'MP': stat['MP'],
+            'names_frame': names_frame,
+            'names_table': page_props(names_frame, page_size = 10),
+            'names_figure': names_figure(names_hist).to_json(),
+            'dad_figure': dad_pie.to_json(),
+            'priority_figure': prio_pie.to_json(),
+            'filter_key_figure': fk_pie.to_json()}
+
+def create_settings_table(frame = pd.DataFrame()):
+    #Table of names/settings discrepancies. Only the first page is sent with the table
+    settings_table = dt.DataTable(
+        id='settings-table', 
+        **page_props(frame, page_size = 15),
+        columns = [
+            {"name": ["", "N occurencies"], "id": "N occurencies"},
+            {"name": ["", "NAME"], "id": "NAME"},
+            {"name": ["Current settings", "Location"], "id": "Location"},
+            {"name": ["Current settings", "Orientation"], "id": "Orientation"},
+            {"name": ["Current settings", "Unit"], "id": "Type"},
+            {"name": ["Current settings", "Envelope"], "id": "Envelope"},
+            {"name": ["Suggested settings", "Location"], "id": "Location_sgst"},
+            {"name": ["Suggested settings", "Orientation"], "id": "Orientation_sgst"},
+            {"name": ["Suggested settings", "Unit"], "id": "Type_sgst"},
+            {"name": ["Suggested settings", "Envelope"], "id": "Envelope_sgst"},
+            {"name": ["", "Path"], "id": "Path"},
+        ],
+        merge_duplicate_headers=True,
+        editable = True,
+        row_selectable='multi',
+        style_cell={
+            'textAlign': 'left',
+            'height': 'auto',
+            'width': 'auto',
+            'fontFamily': 'Calibri',
+            'whiteSpace': 'normal',
+            'fontSize': '14px'},
+        style_header = {
+            'fontWeight': 'bold',
+            'fontFamily': 'Calibri',
+            'fontSize': '14px'
+        },
+        style_cell_conditional=[
+        {'if': {'column_id': 'TREEELEMID'},
+        'width': '5%'},
+        {'if': {'column_id': 'NAME'},
+        'width': '10%'},
+         {'if': {'column_id': 'Location'},
+        'width': '5%'},
+        {'if': {'column_id': 'Orientation'},
+        'width': '5%'},
+        {'if': {'column_id': 'Type'},
+        'width': '5%'},
+        {'if': {'column_id': 'Envelope'},
+        'width': '5%'},
+         {'if': {'column_id': 'Location_sgst'},
+        'width': '5%'},
+        {'if': {'column_id': 'Orientation_sgst'},
+        'width': '5%'},
+        {'if': {'column_id': 'Type_sgst'},
+        'width': '5%'},
+        {'if': {'column_id': 'Envelope_sgst'},
+        'width': '5%'},
+        {'if': {'column_id': 'Path'},
+        'width': '45%'}
+        ],
+         style_data_conditional = [
+        {'if': {'row_index': 'odd'},
+        'backgroundColor': 'rgb(248, 248, 248)'}
+        ]
+    )
+    return html.Div(settings_table)
+
 #Setting up a logger in order to be able to save logs in json 
 # and transfer them to datadog
-formatter = json_log_formatter.JSONFormatter()
 #Specify where to store the logs
 os.makedirs('C:/var/log/', exist_ok= True)
 log_name = str(uuid.uuid4())
-json_handler = logging.FileHandler(filename = '/var/log/'+ log_name +'.json')
-json_handler.setFormatter(formatter)
-#Creating the name of the logger
-logger = logging.getLogger(log_name)
-logger.addHandler(json_handler)
-logger.setLevel(logging.INFO)
+#Creating the logger. Records are written to the file through the queue in background thread
+logger = setup_json_logger(log_name = log_name, log_dir = '/var/log/')
+#Durations, rows and memory of each check are written to the same json log
+configure_instrumentation(logger = log_name)
 
 logger.warning('Here is some warning here', extra={'additional information:': 1256})
 
+#Server for __main__: 'dev' is the development server of dash, 'waitress' is production WSGI server
+SERVER_MODE = os.environ.get('DB_SERVER', 'dev')
+SERVER_THREADS = int(os.environ.get('DB_SERVER_THREADS', '8'))
+
 #Determination of executable path and creating path to cust_table excel file and data files
 path_dir = os.path.dirname(os.__file__)
 path_dir = path_dir.replace(os.sep, '/')
@@ -1026,12 +935,16 @@ path_dir = 'C:/Users/krama/Documents/work/SKF/Vibration - Analyst/Scripts/Custom
 path_data = path_dir + '/data/'
 # Reading excel file and creating a list of options for dropdown menu
 # These lines should be modified in order to get information from SharePoint
-cust_details = pd.read_excel(path_data + 'cust_details.xlsx')
-options_c = []
-for cust in cust_details.customer:
-    label = cust_details.loc[cust_details.customer == cust, "customer"].item()
-    value = cust_details.loc[cust_details.customer == cust, "short_name"].item()
-    options_c.append({'label': label, 'value': value})
+cust_details = load_customers(path_data + 'cust_details.xlsx', logger = log_name)
+options_c = customer_options(cust_details)
+#Background jobs of the audit are kept in DB_JOBS_DIR. Jobs run in separate processes, so
+#the tables created by them are stored in the shared cache in the same folder
+JOBS_DIR = os.environ.get('DB_JOBS_DIR', path_dir + '/cache')
+if diskcache is not None:
+    configure_shared(JOBS_DIR + '/shared')
+    long_callback_manager = DiskcacheLongCallbackManager(diskcache.Cache(JOBS_DIR + '/jobs'))
+else:
+    long_callback_manager = None
 info_wrong_convention = """
 The table presented informtion about the measurement points\nwith wrong naming conventions.\n
 Names presented in the table represent only unique names.\nNumber of times wrong name appeared in the DB prsented\nin column "N occurencies".
@@ -1044,10 +957,53 @@ Each column of the tabl has its own filter where it's\npossible to search for sp
 """
 
 
-app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+#Responses of all the callbacks are encoded by plotly json encoder, orjson is much faster
+if orjson is not None:
+    pio.json.config.default_engine = 'orjson'
+
+#Tables of the issues are created by callbacks, so their ids are not in initial layout
+app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True,
+                long_callback_manager=long_callback_manager)
+#WSGI application for production servers, e.g. gunicorn -w 4 -b 0.0.0.0:8080 DB_general:server
+#Several workers need DB_SHARED_CACHE_DIR, otherwise pages of the tables are found only by the worker which made the audit
+server = app.server
+
+#Lightweight route for the launcher: server answers it as soon as it accepts requests
+@app.server.route('/health')
+def health():
+    return 'OK'
+
+#Aggregated timings of the checks and callbacks since the start of the server
+@app.server.route('/metrics')
+def metrics():
+    return jsonify(metrics_snapshot())
+
+#Download of all issue tables of the audit. File is written on disk by chunks and sent
+#from disk, so neither the export nor the response keeps the whole file in memory
+@app.server.route('/export/<tables_key>/<file_format>')
+def export(tables_key, file_format):
+    if file_format not in EXPORT_FORMATS:
+        abort(404)
+    filename = export_audit(tables_key, file_format, logger = log_name)
+    if filename is None:
+        abort(404)
+    response = send_file(filename, as_attachment = True,
+                         download_name = export_name(request.args.get('customer'), file_format))
+    def remove_file():
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+    response.call_on_close(remove_file)
+    return response
+
 app.layout = html.Div([
     dcc.Store(id='db-data-memory', data = None),
-    dcc.Store(id='issues_memory', data = None),
+    #Key of the issue tables of the last audit, tables are kept on the server
+    dcc.Store(id='tables-key', data = None),
+    dcc.Store(id='stat-key', data = None),
+    #Key of the subtree table of the node selected on this page, it's not shared with other users
+    dcc.Store(id='node-issues-key', data = None),
     dbc.Card(
         dbc.CardBody([
             dbc.Row([
@@ -1072,6 +1028,12 @@ app.layout = html.Div([
                     html.H6('MP: -', id = 'mp-stat')
                 ])
             ]),
+            #Progress of the audit, visible only while the audit is running
+            html.Div([
+                html.Br(),
+                html.H6('Audit of the customer is running...'),
+                dbc.Progress(id='audit-progress', value=0, max=1, striped=True, animated=True)
+            ], id='audit-progress-row', style={'display': 'none'}),
             html.Br(),
             dcc.Tabs([
                 dcc.Tab(html.Div([
@@ -1079,9 +1041,13 @@ app.layout = html.Div([
                         dbc.Col(id='stat-col-1'),
                         dbc.Col(id='stat-col-2'),
                         dbc.Col(id='stat-col-3')
+                    ]),
+                    dbc.Row([
+                        dbc.Col(id='issues-rollup')
                     ])
                 ]), label= 'Stat', id='stat-tab', value='stat-tab'),
                 dcc.Tab([
+                    html.Div([], id = 'export-links'),
                     dcc.Tabs([
                             dcc.Tab([
                                 html.Br(),
@@ -1099,7 +1065,10 @@ app.layout = html.Div([
                                 ), 
                                 html.Div(id = 'names-settings-res')], 
                                     label = 'Names/Settings discrepancies', id='names-settings', value='settings-tab'),
-                            dcc.Tab(html.Div([]), label = 'Hierarchy Issues', id = 'hierarchy-issues', value='hierarchy-tab'),
+                            dcc.Tab(html.Div([
+                                html.Div([], id = 'hierarchy-issues-table'),
+                                html.Div([], id = 'node-issues')
+                            ]), label = 'Hierarchy Issues', id = 'hierarchy-issues', value='hierarchy-tab'),
                             dcc.Tab(html.Div([]), label = 'Thresholds', id = 'thresholds', value='thresholds-tab'),
                             dcc.Tab(
                                 html.Div([
@@ -1145,8 +1114,10 @@ app.layout = html.Div([
     Output('stat-col-1', 'children'),
     Output('stat-col-2', 'children'),
     Output('stat-col-3', 'children'),
+    Output('stat-key', 'data'),
     Input('customer-selection', 'value')
 )
+@instrument()
 def update_stat(selected_file):
     nodes_word = 'Nodes:'
     if selected_file == None:
@@ -1156,7 +1127,12 @@ def update_stat(selected_file):
         #Instead of following lines here we can have a function which will send a request to SQL db
         try:
             filename = cust_details.loc[cust_details.short_name == selected_file, 'datafile'].item()
-            data_db = pd.read_csv(path_data + filename)
+            version = data_version(path_data + filename)
+            #Parsed hierarchy is shared by worker processes of the server through the shared cache.
+            #Concurrent requests of the same customer wait for one parsing of the file
+            data_db = single_flight(('treelems', filename) + version,
+                                    lambda: load_treelems(path_data + filename, logger = log_name),
+                                    expire = None, logger = log_name)
         except:
             #Need to have some wrror messages here, but only prevent update for now
             cust = 'Customer name: Unable to get the data for customer'
@@ -1169,79 +1145,68 @@ def update_stat(selected_file):
             dad_plot = html.Div()
             fk_plot = html.Div()
             data_db = None
-            return data_db, cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot
+            return data_db, cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot, None
 
         #1. Selected DB details
         cust = 'Customer name: ' + cust_details.loc[cust_details.short_name == selected_file, 'customer'].item()
         db = 'DB name: ' + selected_file
         tblset = 'TablsetId: ' + str(cust_details.loc[cust_details.short_name == selected_file, 'tablesetID'].item())
-        #2. Nodes statistics
-        try:
-            stat = db_stat(treelem = data_db, logger=log_name)
-        except:
-            # Final words regardnig problems in stat calculation
-            print('Something wrong with statistics calculation')
-            raise PreventUpdate
-        if stat == None:
-            cust = 'Customer name: Unable to get the data for customer'
-            db = 'DB name: Unable to get the data for customer'
-            tblset = 'TablsetId: Unable to get the data for customer'
-            fl_stat = '-'
-            asset_stat = '-'
-            mp_stat = '-'
-            names_plot = html.Div('No data to display')
-            dad_plot = html.Div()
-            fk_plot = html.Div()
-            data_db = None
-            return data_db, cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot
-            
-        fl_stat = stat['FL']
-        asset_stat = stat['assets']
-        mp_stat = stat['MP']
+        #2. Nodes statistics. Statistics and figures are cached per customer and version
+        #of the data file, so selecting the customer again costs only a cache lookup
+        cache_key = (selected_file,) + version
+        fragments = get_fragments(cache_key)
+        if fragments is None:
+            try:
+                stat = single_flight(('stat',) + cache_key, lambda: db_stat(treelem = data_db, logger=log_name), logger = log_name)
+            except:
+                # Final words regardnig problems in stat calculation
+                print('Something wrong with statistics calculation')
+                raise PreventUpdate
+            if stat == None:
+                cust = 'Customer name: Unable to get the data for customer'
+                db = 'DB name: Unable to get the data for customer'
+                tblset = 'TablsetId: Unable to get the data for customer'
+                fl_stat = '-'
+                asset_stat = '-'
+                mp_stat = '-'
+                names_plot = html.Div('No data to display')
+                dad_plot = html.Div()
+                fk_plot = html.Div()
+                data_db = None
+                return data_db, cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot, None
+            fragments = stat_fragments(stat)
+            cache_fragments(cache_key, fragments)
+        else:
+            logger.info('Statistics of the customer are taken from the cache', extra = {'customer': selected_file})
+
+        fl_stat = fragments['FL']
+        asset_stat = fragments['assets']
+        mp_stat = fragments['MP']
         #3. Statistic plots
         #Names plot
-        names_hist = pd.DataFrame(stat['names_stat'])
-        name_plot = px.bar(y = names_hist.index, 
-                        x = names_hist.NAME, 
-                        orientation='h',  
-                        labels = {'x': 'Number of MP\'s name occurencies in DB', 'y': 'Name of MP in DB'}, 
-                        height=20*len(names_hist))
-        name_plot.update_layout(yaxis= {'categoryorder': 'total ascending'},
-                                xaxis = {'side': 'top', 'mirror': 'allticks'})
-        names_plot = html.Div(dcc.Graph(figure = name_plot, style= {'height': 20*len(names_hist)}), style={'overflowY': 'scroll', 'height': 700, 'width': '100%'})
-        #Dad types stat
-        dad_pie_df = pd.DataFrame(stat['DAD'])
-        dad_pie = px.pie(values = dad_pie_df.DADType, 
-                        names = dad_pie_df.index, 
-                        title = 'DAD types distribution')
-        dad_pie.update_layout(title_x = 0.5)
-        #Priorities stat
-        prio = pd.DataFrame(stat['priorities'])
-        prio_pie = px.pie(values=prio.NodePriority,
-                        names = prio.index,
-                        title = 'Assets criticalities')
-        prio_pie.update_layout(title_x = 0.5)
-
+        #Top names are plotted, full distribution is available in the table with search and paging
+        #Stat tables are kept per customer and version, so repeated selection doesn't store them again
+        stat_key = stat_tables_key(cache_key)
+        if get_table(stat_key, 'names-stat-table') is None:
+            store_tables({'names-stat-table': fragments['names_frame']}, key = stat_key)
+        names_plot = html.Div([
+            dcc.Graph(figure = json.loads(fragments['names_figure'])),
+            html.H6(f'All {len(fragments["names_frame"])} names:'),
+            create_names_table(props = fragments['names_table'])], style={'width': '100%'})
+        #Dad types and priorities stat
         dad_plot = html.Div([
-            dcc.Graph(figure = dad_pie),
-            dcc.Graph(figure = prio_pie)], style={'width': '100%'})
+            dcc.Graph(figure = json.loads(fragments['dad_figure'])),
+            dcc.Graph(figure = json.loads(fragments['priority_figure']))], style={'width': '100%'})
         #Filter Key stat
-        fk_pie_df = pd.DataFrame(stat['filter_key_stat'])
-        fk_pie = px.pie(values=fk_pie_df.FilterKey,
-                        names = fk_pie_df.index,
-                        title = 'Filter Key distribution')
-        fk_pie.update_layout(title_x = 0.5)
-        fk_plot = html.Div(dcc.Graph(figure = fk_pie), style = {'width': '100%'})
+        fk_plot = html.Div(dcc.Graph(figure = json.loads(fragments['filter_key_figure'])), style = {'width': '100%'})
 
-    return data_db.to_dict(), cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot
+    return frame_to_store(data_db), cust, db, tblset, nodes_word, fl_stat, asset_stat, mp_stat, names_plot, dad_plot, fk_plot, stat_key
 
-@app.callback(
+issues_outputs = [
     #0.Names issues
     Output('names-issues', 'children'),
-    #1. Names-settings_discrepancies
-    #Output('names-settings-res', 'children'),
     #2. Hierarchy problems
-    Output('hierarchy-issues', 'children'),
+    Output('hierarchy-issues-table', 'children'),
     #3. Thresholds problems
     Output('thresholds', 'children'),
     #4. SIT points
@@ -1251,56 +1216,118 @@ def update_stat(selected_file):
     Output('other-w-sit', 'children'),
     #5. Disabled points
     Output('disabled-points', 'children'),
-    Output('issues_memory', 'data'),
-    Input('db-data-memory', 'data')
-    #manager=long_callback_manager
-)
-def update_issues(data):
+    #1. Names-settings_discrepancies
+    Output('names-settings-res', 'children'),
+    Output('tables-key', 'data'),
+    #7. Issues rolled up by hierarchy on Stat tab
+    Output('issues-rollup', 'children')]
+
+def running_tabs(text = '', tables_key = None):
+    #Tabs of the Issues page and the key of the tables while the audit is running. Each progress
+    #of the background job contains value of every progress output: 3 of the progress bar and these
+    return tuple([html.Div(text)]*9 + [tables_key])
+
+@instrument()
+def update_issues(set_progress, data, switcher, selected_file):
     if data is None:
-        return (no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update)
+        return (no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update)
+    #Audits of the same customer and version of the data requested at the same time are
+    #done once, heavy audits of different customers are limited by DB_MAX_HEAVY
+    set_progress((0, 1, 'Waiting for the audit') + running_tabs('Waiting for the audit'))
+    try:
+        filename = cust_details.loc[cust_details.short_name == selected_file, 'datafile'].item()
+        key = ('audit', filename, len(switcher or []) == 1) + data_version(path_data + filename)
+    except (ValueError, OSError) as e:
+        #Customer or its data file is not found, the audit is not shared but still takes a heavy slot
+        logger.warning('Audit is not shared with other requests', extra = {'customer': selected_file, 'error': str(e)})
+        return compute_heavy(lambda: audit_customer(set_progress, data, switcher))
+    return single_flight(key, lambda: audit_customer(set_progress, data, switcher), heavy = True, logger = log_name)
+
+def audit_customer(set_progress, data, switcher):
+    if data is None:
+        return (no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update)
     else:
-        db_data = pd.DataFrame(data)
-        #Creation of "Path" column for easier identification
-        tmp_db = db_data[db_data.CONTAINERTYPE != 4]
-        for_path = np.array(tmp_db[['TREEELEMID', 'PARENTID', 'NAME', 'CONTAINERTYPE', 'BRANCHLEVEL']])
-        #Here we need to try to define path. It can be unsuccessfull for many reasons
-        try:
-            pathdf = define_path(for_path)
-        except Exception as e:
-            print(e)
-            pathdf = pd.DataFrame(columns= ['TREEELEMID', 'Path'])
-        db_data = pd.merge(db_data, pathdf[['TREEELEMID', 'Path']], how = 'left', on = 'TREEELEMID')
-        for asset in db_data.loc[db_data.CONTAINERTYPE == 3, 'TREEELEMID']:
-            db_data.loc[db_data.PARENTID == asset, 'Path'] = db_data.loc[db_data.TREEELEMID == asset, 'Path'].item()
-        db_data.loc[db_data.CONTAINERTYPE == 4,'Path'] = db_data.loc[db_data.CONTAINERTYPE == 4,'Path'] + '/' + db_data.loc[db_data.CONTAINERTYPE == 4,'NAME']
-
-        #Creating Clear identification of disabled points
-        assets = db_data.loc[db_data.CONTAINERTYPE == 3, ['TREEELEMID', 'PARENTID', 'FilterKey']]
-        fl_id = list(assets.PARENTID.unique())
-        fls = db_data.loc[db_data.TREEELEMID.isin(fl_id), ['TREEELEMID', 'PARENTID']]
-  
-        #Creating clear identification for disabled points
-        for fl in fls.TREEELEMID:
-            if db_data.loc[db_data.TREEELEMID == fl, 'ELEMENTENABLE'].item() == 0:
-                db_data.loc[db_data.PARENTID == fl, 'ELEMENTENABLE'] = 0
-        for asset in assets.TREEELEMID:
-            if db_data.loc[db_data.TREEELEMID == asset, 'ELEMENTENABLE'].item() == 0:
-                db_data.loc[db_data.PARENTID == asset, 'ELEMENTENABLE'] = 0
-        #Creating identification of Filter Key of assets for each measurement point
-        db_data['AssetType'] = None
-        for asset, filterkey in zip(assets.TREEELEMID, assets.FilterKey):
-            db_data.loc[db_data.PARENTID == asset, 'AssetType'] = filterkey
+        #Steps of the progress: preparation of the hierarchy, 10 checks and creation of the tables
+        steps = 12
+        done = [1]
+        set_progress((0, steps, 'Preparing hierarchy') + running_tabs('Audit is running...'))
+        #Path, disabled nodes, AssetType, envelope labels and NodeType are derived 
+        #once and used by all tabs
+        db_data = enrich_hierarchy(frame_from_store(data), logger = log_name)
+        #Tree index is used to show issues of the subtree of selected node
+        tree_data = db_data
+        tree_index = build_tree_index(tree_data, logger = log_name)
+        #Frames of all issue tables, DataTables get only visible page of them
+        issue_frames = {}
+        #Corrupted hierarchy is reported before the audit instead of running all the checks
+        integrity = check_integrity(treelem = tree_data, index = tree_index, logger = log_name)
+        if integrity.Critical.any():
+            corrupted = html.Div('Hierarchy is corrupted. The audit is not done, see Hierarchy Issues tab.')
+            issue_frames['integrity-table'] = integrity.drop(columns = 'Critical')
+            integrity_table = dt.DataTable(
+                id='integrity-table', 
+                **page_props(issue_frames['integrity-table'], page_size = 15),
+                columns = [{'name': i, 'id': i} for i in ['TREEELEMID', 'Path', 'Problem']],
+                style_cell={
+                    'textAlign': 'left',
+                    'height': 'auto',
+                    'width': 'auto',
+                    'fontFamily': 'Calibri',
+                    'whiteSpace': 'normal',
+                    'fontSize': '14px'},
+                style_header = {
+                    'fontWeight': 'bold',
+                    'fontFamily': 'Calibri',
+                    'fontSize': '14px'
+                })
+            integrity_table = html.Div([html.Br(), html.H6('Hierarchy is corrupted:'), integrity_table])
+            return (corrupted, integrity_table, corrupted, corrupted, html.Div(), html.Div(), html.Div(), corrupted, corrupted, store_tables(issue_frames), corrupted)
 
-        # Defining names problems
+        #Tabs are published as soon as their checks are finished, in background mode they are
+        #sent to the browser with the progress of the job. Tables of the published tabs are stored
+        #under the key of the audit, so their pages are available before the end of the audit
+        tables_key = store_tables({})
+        outputs = list(running_tabs('Audit is running...', tables_key))
+        stored = set()
+        def publish(label):
+            store_tables({x: issue_frames[x] for x in issue_frames if x not in stored}, key = tables_key)
+            stored.update(issue_frames)
+            set_progress((done[0], steps, label) + tuple(outputs))
+        def check_finished(name, result):
+            done[0] += 1
+            set_progress((done[0], steps, f'Check {name} is finished') + tuple(outputs))
+        publish('Running checks')
+
+        # Running independent checks in worker processes. Hierarchy is shared with workers
+        # through shared memory. Settings checks are done for all points and filtered
+        # by good names after check of names is finished.
         names= list(set(db_data.loc[db_data.CONTAINERTYPE == 4, 'NAME']))
-        names_issues = check_names(mp_names=names, logger=log_name)
+        audit_data = db_data[db_data.DADType != 792]
+        audit_data = audit_data.assign(GRANDPARENTID = grandparents(audit_data, index = tree_index).to_numpy())
+        wait_checks = start_checks(treelem = audit_data,
+                           checks = {'names': (check_names, {'mp_names': names, 'logger': log_name}),
+                                     'location': (check_location, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'orientation': (check_orientation, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'type': (check_type_enveleope, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'duplications': (check_duplications, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'hierarchy': (check_hierarchy, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'sequence': (check_sequence, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'motors': (check_motors, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'thresholds': (check_thresholds, {'treelem': SHARED_FRAME, 'logger': log_name}),
+                                     'sit': (check_sit, {'treelem': SHARED_FRAME, 'logger': log_name})},
+                           logger = log_name,
+                           progress = check_finished)
+
+        # Defining names problems
+        audit = wait_checks('names')
+        names_issues = audit['names']
         if len(names_issues['wrong_names']) == 0:
             names_table = html.Div('There were no issues with the names for the customer')
         else:
             problems = define_names_problems(wrong_names = names_issues['wrong_names'], logger=log_name)
             mask1 = (db_data.CONTAINERTYPE == 4) & (db_data.NAME.isin(names_issues['wrong_names']))
-            wrong_names_table = db_data.loc[ mask1, ['TREEELEMID', 'NAME', 'Path', 'FilterKey', 'PointLocation', 'PointOrientation', 'PointUnitType', 'FilterEnvelope', 'AssetType']]
-            wrong_names_table.FilterEnvelope = ['E'+str(int(x) - 20599) if x in [20600, 20601, 20602, 20603] else '' for x in wrong_names_table.FilterEnvelope]
+            wrong_names_table = db_data.loc[ mask1, ['TREEELEMID', 'NAME', 'Path', 'FilterKey', 'PointLocation', 'PointOrientation', 'PointUnitType', 'EnvelopeLabel', 'AssetType']]
+            wrong_names_table = wrong_names_table.rename(columns = {'EnvelopeLabel': 'FilterEnvelope'})
             wrong_names_table.reset_index(drop = True, inplace = True)
             wrong_names_table['Possible problem'] = [problems[x][0] for x in wrong_names_table.NAME]
             wrong_names_table['Confirm change'] = False
@@ -1316,7 +1343,7 @@ def update_issues(data):
             #Filtering out points Manual Entry RPM HZ if they are located not in Motor
             try:
                 mask_manual = wrong_names_table['Suggested name'].str.contains('01S Manual Entry') &  ((wrong_names_table['AssetType'].str.contains('Motor') == False) | wrong_names_table['AssetType'].isna())
-                wrong_names_table.loc[mask_manual, 'Suggested name'] = np.NaN
+                wrong_names_table.loc[mask_manual, 'Suggested name'] = np.nan
             except:
                 pass
             # Table in dashboard should represent unique names in hierarchy, not all points
@@ -1381,9 +1408,10 @@ def update_issues(data):
             # unit and envelope filter if exist. Location and orientation will not be 
 
         #Table here should be similar to the table in names/settings discrepancies.
+            issue_frames['names-table'] = gen_df
             names_table = dt.DataTable(
                 id='names-table', 
-                data = gen_df.to_dict('records'),
+                **page_props(issue_frames['names-table'], page_size = 15),
                 columns = [
                     {"name": ["", "N occurencies"], "id": "N occurencies"},
                     {"name": ["NAME", "Current"], "id": "Current name"},
@@ -1396,11 +1424,8 @@ def update_issues(data):
                     {'name': ["", 'AssetType'], 'id': 'AssetType'},
                     {"name": ["", "Path"], "id": "Path"}
                 ],
-                page_size=15,
                 editable = True,
                 row_selectable='multi',
-                filter_action="native",
-                sort_action="native",
                 merge_duplicate_headers=True,
                 style_cell={
                     'textAlign': 'left',
@@ -1445,14 +1470,19 @@ def update_issues(data):
             html.Br(),
             html.Div(names_table, style = {'margin': '10px'})
             ])
+        outputs[0] = names_table
+        publish('Names are checked')
         
         # Defining Name/Settings discrepancies
-        db_data = db_data[db_data.DADType != 792]
-        points_w_good_names = db_data[db_data.NAME.isin(names_issues['good_names'])]
+        audit = wait_checks('location', 'orientation', 'type')
+        db_data = audit_data
         #try:
-        location = pd.DataFrame(check_location(treelem=points_w_good_names))
-        orientation = pd.DataFrame(check_orientation(treelem=points_w_good_names))
-        type = pd.DataFrame(check_type_enveleope(treelem=points_w_good_names))
+        location = pd.DataFrame(audit['location'])
+        location = location[location.NAME.isin(names_issues['good_names'])]
+        orientation = pd.DataFrame(audit['orientation'])
+        orientation = orientation[orientation.NAME.isin(names_issues['good_names'])]
+        type = pd.DataFrame(audit['type'])
+        type = type[type.NAME.isin(names_issues['good_names'])]
         resulted = pd.merge(location, orientation, on = ['TREEELEMID', 'NAME', 'Path'], how  = 'outer')
         resulted = pd.merge(resulted, type, on = ['TREEELEMID', 'NAME', 'Path'], how  = 'outer')
         resulted = suggest_settings(resulted)
@@ -1525,24 +1555,35 @@ def update_issues(data):
 
         gen_df1.sort_values('N occurencies', ascending= False, inplace = True)
         gen_df1.reset_index(drop = True, inplace = True)
+        #Major issues are points with envelope filter or wrong type, "Show only major issues" 
+        #toggle switches between two precomputed frames
+        if len(gen_df1) > 0:
+            gen_df1['Major'] = gen_df1.Type.notna() & gen_df1.Envelope.notna()
+        else:
+            gen_df1 = pd.DataFrame(columns = ['N occurencies', 'NAME', 'Location', 'Orientation', 'Type', 'Envelope',
+                                              'Location_sgst', 'Orientation_sgst', 'Envelope_sgst', 'Path', 'Major'])
+        issue_frames['settings-table'] = gen_df1
+        issue_frames['settings-table-major'] = gen_df1[gen_df1.Major.astype(bool)]
+        settings_table = create_settings_table(issue_frames['settings-table-major'] if len(switcher) == 1 else issue_frames['settings-table'])
+        outputs[8] = settings_table
+        publish('Settings are checked')
 
         #Defining hierarchy problems
-        dupl = check_duplications(treelem=db_data)
-        hier = check_hierarchy(treelem=db_data)
-        sequ = check_sequence(treelem=db_data)
-        moto = check_motors(treelem=db_data)
-        hierarchy = pd.concat([dupl, hier])
+        audit = wait_checks('duplications', 'hierarchy', 'sequence', 'motors')
+        dupl = audit['duplications']
+        hier = audit['hierarchy']
+        sequ = audit['sequence']
+        moto = audit['motors']
+        hierarchy = pd.concat([integrity.drop(columns = 'Critical'), dupl, hier])
         hierarchy = pd.concat([hierarchy, sequ])
         hierarchy = pd.concat([hierarchy, moto])
-        hierarhy_table =  dt.DataTable(
-            id='settings-table', 
-            data = hierarchy.to_dict('records'),
+        issue_frames['hierarchy-table'] = hierarchy
+        hierarhy_table = dt.DataTable(
+            id='hierarchy-table', 
+            **page_props(issue_frames['hierarchy-table'], page_size = 15),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in hierarchy.columns],
-            page_size=15,
             editable = True,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1568,19 +1609,20 @@ def update_issues(data):
                 'backgroundColor': 'rgb(248, 248, 248)'
             }]
         )
-        hierarhy_table = html.Div([html.Br(), html.H6('Problems with hierarchy:'),hierarhy_table])
+        hierarhy_table = html.Div([html.Br(), html.H6('Problems with hierarchy (select a cell to see all issues below the node):'),hierarhy_table])
+        outputs[1] = hierarhy_table
+        publish('Hierarchy is checked')
 
         #Defining Thresholds problem
-        thresh_issues = check_thresholds(treelem=db_data)
+        audit = wait_checks('thresholds')
+        thresh_issues = audit['thresholds']
 
+        issue_frames['no-thresholds-table'] = thresh_issues['points_wo_alarms']
         no_thresholds_table = dt.DataTable(
             id='no-thresholds-table', 
-            data = thresh_issues['points_wo_alarms'].to_dict('records'),
+            **page_props(issue_frames['no-thresholds-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'NAME', 'Path']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1606,14 +1648,12 @@ def update_issues(data):
                 'backgroundColor': 'rgb(248, 248, 248)'
             }])
 
+        issue_frames['no_thresholds-table'] = thresh_issues['threshold_issues']
         wrong_thresholds_issue = dt.DataTable(
             id='no_thresholds-table', 
-            data = thresh_issues['threshold_issues'].to_dict('records'),
+            **page_props(issue_frames['no_thresholds-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'NAME', 'Path']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1644,17 +1684,18 @@ def update_issues(data):
             html.H6('Points with wrongly set thresholds'),
             wrong_thresholds_issue
         ])
+        outputs[2] = thresholds_table
+        publish('Thresholds are checked')
         #Defining SIT problems
-        sit_stat = check_sit(treelem=db_data)['sit_issues']
+        audit = wait_checks('sit')
+        sit_stat = audit['sit']['sit_issues']
         fl_wo_sit = db_data.loc[db_data.TREEELEMID.isin(sit_stat['missing_sit']), ['TREEELEMID', 'Path']]
+        issue_frames['fl-wo-sit-table'] = fl_wo_sit
         fl_wo_sit_table = dt.DataTable(
             id='fl-wo-sit-table', 
-            data = fl_wo_sit.to_dict('records'),
+            **page_props(issue_frames['fl-wo-sit-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'Path']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1679,14 +1720,12 @@ def update_issues(data):
             }])
         fl_wo_sit_table = html.Div([html.Br(),html.H6('FL without SIT points'), fl_wo_sit_table])
         few_sit_fl = db_data.loc[db_data.TREEELEMID.isin(sit_stat['excessive_sit']), ['TREEELEMID', 'Path']]
+        issue_frames['few-sit-fl-table'] = few_sit_fl
         few_sit_fl_table = dt.DataTable(
             id='few-sit-fl-table', 
-            data = few_sit_fl.to_dict('records'),
+            **page_props(issue_frames['few-sit-fl-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'Path']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1711,14 +1750,12 @@ def update_issues(data):
             }])
         few_sit_fl_table = html.Div([html.Br(),html.H6('FL with few SIT points'), few_sit_fl_table])
         motor_wo_sit = db_data.loc[db_data.TREEELEMID.isin(sit_stat['motors_wo_SIT']), ['TREEELEMID', 'Path']]
+        issue_frames['motor_wo_sit-table'] = motor_wo_sit
         motor_wo_sit_table = dt.DataTable(
             id='motor_wo_sit-table', 
-            data = motor_wo_sit.to_dict('records'),
+            **page_props(issue_frames['motor_wo_sit-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'Path']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1743,14 +1780,12 @@ def update_issues(data):
             }])
         motor_wo_sit_table = html.Div([html.Br(),html.H6('Motor assets without SIT points'), motor_wo_sit_table])
         other_w_sit = db_data.loc[db_data.TREEELEMID.isin(sit_stat['other_components_w_SIT']), ['TREEELEMID', 'FilterKey']]
+        issue_frames['other-w-sit-table'] = other_w_sit
         other_w_sit_table = dt.DataTable(
             id='other-w-sit-table', 
-            data = other_w_sit.to_dict('records'),
+            **page_props(issue_frames['other-w-sit-table'], page_size = 8),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'Path', 'FilterKey']],
-            page_size=8,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1776,21 +1811,16 @@ def update_issues(data):
                 'backgroundColor': 'rgb(248, 248, 248)'
             }])
         other_w_sit_table = html.Div([html.Br(),html.H6('SIT points in NON Motor assets'), other_w_sit_table])
+        outputs[3:7] = [fl_wo_sit_table, few_sit_fl_table, motor_wo_sit_table, other_w_sit_table]
+        publish('SIT points are checked')
         #Defining disabled points
-        db_data['NodeType'] = 'System and higher'
-        db_data.loc[db_data.CONTAINERTYPE == 3, 'NodeType'] = 'Asset'
-        db_data.loc[db_data.CONTAINERTYPE == 4, 'NodeType'] = 'MP'
-        db_data.loc[db_data.TREEELEMID.isin(fl_id), 'NodeType'] = 'FL'
-
         disabled = db_data.loc[db_data.ELEMENTENABLE == 0, ['TREEELEMID', 'NAME', 'Path', 'NodeType']]
+        issue_frames['disabled-table'] = disabled
         disabled_table = dt.DataTable(
             id='disabled-table', 
-            data = disabled.to_dict('records'),
+            **page_props(issue_frames['disabled-table'], page_size = 15),
             columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'NAME','NodeType', 'Path']],
-            page_size=15,
             row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1818,44 +1848,106 @@ def update_issues(data):
                 'backgroundColor': 'rgb(248, 248, 248)'
             }])
         disabled_table = html.Div([html.Br(),html.H6('Disabled nodes'), disabled_table])
+        outputs[7] = disabled_table
+        publish('Creating summary')
+
+        #Issues of all the checks with their position in the tree
+        wrong_names = tree_data.loc[(tree_data.CONTAINERTYPE == 4) & (tree_data.NAME.isin(names_issues['wrong_names'])), ['TREEELEMID']]
+        node_issues = collect_node_issues(treelem = tree_data,
+                                          issues = {'Names': wrong_names.assign(Problem = 'Name is not according to naming conventions'),
+                                                    'Location': location.assign(Problem = 'Location doesn\'t correspond to the name'),
+                                                    'Orientation': orientation.assign(Problem = 'Orientation doesn\'t correspond to the name'),
+                                                    'Type': type.assign(Problem = 'Type or envelope doesn\'t correspond to the name'),
+                                                    'Hierarchy': hierarchy,
+                                                    'Thresholds': thresh_issues['threshold_issues'].assign(Problem = 'Wrong thresholds'),
+                                                    'No thresholds': thresh_issues['points_wo_alarms'].assign(Problem = 'Point has no thresholds'),
+                                                    'SIT': pd.concat([fl_wo_sit.assign(Problem = 'FL without SIT points'),
+                                                                      few_sit_fl.assign(Problem = 'FL with few SIT points'),
+                                                                      motor_wo_sit.assign(Problem = 'Motor asset without SIT points'),
+                                                                      other_w_sit.assign(Problem = 'SIT points in NON Motor asset')])},
+                                          index = tree_index,
+                                          logger = log_name)
+        #Worst FLs and systems by number of issues in their subtree
+        rollup = rollup_issues(treelem = tree_data, node_issues = node_issues, index = tree_index, logger = log_name)
+        if len(rollup) == 0:
+            rollup_plot = html.Div('There were no issues for the customer')
+        else:
+            rollup_plot = html.Div(dcc.Graph(figure = rollup_figure(rollup, logger = log_name), style = {'height': 700}), style = {'width': '100%'})
+        issue_frames['tree-issues'] = node_issues
+        store_tables({'tree-issues': node_issues}, key = tables_key)
+
+    return (names_table, hierarhy_table, thresholds_table, fl_wo_sit_table, few_sit_fl_table, motor_wo_sit_table, other_w_sit_table, disabled_table, settings_table, tables_key, rollup_plot)
+
+if long_callback_manager is not None:
+    #Audit is cancelled when other customer is selected, the server answers other
+    #requests while the job is running. Tabs are also progress outputs of the job, so they
+    #are filled one by one while the checks are finishing. Final tabs are the result of the
+    #job, progress is only for the intermediate ones and can be lost without harm
+    @app.long_callback(
+        [Output(x.component_id, x.component_property, allow_duplicate = True) for x in issues_outputs[:-1]] + [issues_outputs[-1]],
+        Input('db-data-memory', 'data'),
+        State('switches-input', 'value'),
+        State('customer-selection', 'value'),
+        progress = [Output('audit-progress', 'value'), Output('audit-progress', 'max'), Output('audit-progress', 'label')] + issues_outputs[:-1],
+        running = [(Output('audit-progress-row', 'style'), {'display': 'block'}, {'display': 'none'})],
+        cancel = [Input('customer-selection', 'value')],
+        prevent_initial_call = True
+    )
+    def update_issues_background(set_progress, data, switcher, selected_file):
+        return update_issues(set_progress, data, switcher, selected_file)
+else:
+    @app.callback(
+        *issues_outputs,
+        Input('db-data-memory', 'data'),
+        State('switches-input', 'value'),
+        State('customer-selection', 'value')
+    )
+    def update_issues_now(data, switcher, selected_file):
+        return update_issues(lambda progress: None, data, switcher, selected_file)
 
-    return (names_table, hierarhy_table, thresholds_table, fl_wo_sit_table, few_sit_fl_table, motor_wo_sit_table, other_w_sit_table, disabled_table, gen_df1.to_dict()) #settings_table,
+@app.callback(
+    Output('export-links', 'children'),
+    Input('tables-key', 'data'),
+    State('customer-selection', 'value')
+)
+def update_export_links(tables_key, selected_file):
+    if tables_key is None:
+        return html.Div()
+    links = []
+    for file_format, label in [('xlsx', 'Excel'), ('csv', 'CSV'), ('parquet', 'Parquet')]:
+        links += [html.A(label, href = f'/export/{tables_key}/{file_format}?customer={quote(selected_file or "")}'), ' ']
+    return html.Div([html.Br(), html.H6('Download all issues: ', style={'display': 'inline'})] + links)
 
 @app.callback(
-    Output('names-settings-res', 'children'),
-    Input('issues_memory', 'data'),
-    Input('switches-input', 'value')
+    Output('node-issues', 'children'),
+    Output('node-issues-key', 'data'),
+    Input('hierarchy-table', 'active_cell'),
+    State('hierarchy-table', 'derived_viewport_data'),
+    State('tables-key', 'data')
 )
-def filter_table(table_data, switcher):
-    if table_data is None:
-        return no_update
+@instrument()
+def show_node_issues(active_cell, table_data, tables_key):
+    issues = get_table(tables_key, 'tree-issues')
+    if (active_cell is None) or (issues is None) or (table_data is None):
+        return no_update, no_update
     else:
-        table_data = pd.DataFrame(table_data)
-        if len(switcher) == 1:
-            table_data = table_data[~table_data.Type.isna() & ~table_data.Envelope.isna()]
-        print(len(switcher) == 1)
-        settings_table =  dt.DataTable(
-            id='settings-table', 
-            data = table_data.to_dict('records'),
-            columns = [
-                {"name": ["", "N occurencies"], "id": "N occurencies"},
-                {"name": ["", "NAME"], "id": "NAME"},
-                {"name": ["Current settings", "Location"], "id": "Location"},
-                {"name": ["Current settings", "Orientation"], "id": "Orientation"},
-                {"name": ["Current settings", "Unit"], "id": "Type"},
-                {"name": ["Current settings", "Envelope"], "id": "Envelope"},
-                {"name": ["Suggested settings", "Location"], "id": "Location_sgst"},
-                {"name": ["Suggested settings", "Orientation"], "id": "Orientation_sgst"},
-                {"name": ["Suggested settings", "Unit"], "id": "Type_sgst"},
-                {"name": ["Suggested settings", "Envelope"], "id": "Envelope_sgst"},
-                {"name": ["", "Path"], "id": "Path"},
-            ],
-            page_size=15,
-            merge_duplicate_headers=True,
-            editable = True,
-            row_selectable='multi',
-            filter_action="native",
-            sort_action="native",
+        node_id = table_data[active_cell['row']]['TREEELEMID']
+        node = issues[issues.TREEELEMID == node_id]
+        if len(node) == 0:
+            return html.Div('Selected node is not found in the hierarchy'), None
+        #Subtree of the node is interval of entry indexes of the tree index
+        entry = node.Entry.iloc[0]
+        exit = node.Exit.iloc[0]
+        subtree_issues = issues[(issues.Entry >= entry) & (issues.Entry < exit)]
+        subtree_issues = subtree_issues.sort_values('Entry', kind = 'stable')
+        subtree_issues = subtree_issues[['TREEELEMID', 'Path', 'Check', 'Problem']]
+        #Audit tables are shared by all users of the customer, so the table of the selected
+        #node is stored under its own key
+        node_key = store_tables({'node-issues-table': subtree_issues}, group = 'node')
+        node_table = dt.DataTable(
+            id='node-issues-table', 
+            **page_props(subtree_issues, page_size = 15),
+            columns = [{'name': i, 'id': i, 'selectable': True} for i in ['TREEELEMID', 'Path', 'Check', 'Problem']],
             style_cell={
                 'textAlign': 'left',
                 'height': 'auto',
@@ -1863,7 +1955,7 @@ def filter_table(table_data, switcher):
                 'fontFamily': 'Calibri',
                 'whiteSpace': 'normal',
                 'fontSize': '14px'},
-            style_header = {
+             style_header = {
                 'fontWeight': 'bold',
                 'fontFamily': 'Calibri',
                 'fontSize': '14px'
@@ -1871,35 +1963,78 @@ def filter_table(table_data, switcher):
             style_cell_conditional=[
             {'if': {'column_id': 'TREEELEMID'},
             'width': '5%'},
-            {'if': {'column_id': 'NAME'},
-            'width': '10%'},
-             {'if': {'column_id': 'Location'},
-            'width': '5%'},
-            {'if': {'column_id': 'Orientation'},
-            'width': '5%'},
-            {'if': {'column_id': 'Type'},
-            'width': '5%'},
-            {'if': {'column_id': 'Envelope'},
-            'width': '5%'},
-             {'if': {'column_id': 'Location_sgst'},
-            'width': '5%'},
-            {'if': {'column_id': 'Orientation_sgst'},
-            'width': '5%'},
-            {'if': {'column_id': 'Type_sgst'},
-            'width': '5%'},
-            {'if': {'column_id': 'Envelope_sgst'},
-            'width': '5%'},
             {'if': {'column_id': 'Path'},
+            'width': '40%'},
+            {'if': {'column_id': 'Check'},
+            'width': '10%'},
+             {'if': {'column_id': 'Problem'},
             'width': '45%'}
             ],
-             style_data_conditional = [
-            {'if': {'row_index': 'odd'},
-            'backgroundColor': 'rgb(248, 248, 248)'}
-            ]
-        )
-        settings_table = html.Div(settings_table)
-        return settings_table
+            style_data_conditional = [{
+                'if': {'row_index': 'odd'},
+                'backgroundColor': 'rgb(248, 248, 248)'
+            }])
+        return html.Div([html.Br(), html.H6(f'All issues in {node.Path.iloc[0]}: {len(subtree_issues)}'), node_table]), node_key
 
+@app.callback(
+    Output('settings-table', 'data'),
+    Output('settings-table', 'page_count'),
+    Output('settings-table', 'page_current'),
+    Input('settings-table', 'page_current'),
+    Input('settings-table', 'page_size'),
+    Input('settings-table', 'sort_by'),
+    Input('settings-table', 'filter_query'),
+    Input('switches-input', 'value'),
+    State('tables-key', 'data'),
+    prevent_initial_call = True
+)
+@instrument()
+def filter_table(page_current, page_size, sort_by, filter_query, switcher, tables_key):
+    #Major issues are selected once when the audit is done. Toggle only picks
+    #another cached frame and sends its visible page
+    table_id = 'settings-table-major' if len(switcher) == 1 else 'settings-table'
+    frame = get_table(tables_key, table_id)
+    if frame is None:
+        raise PreventUpdate
+    return table_page(frame, page_current, page_size, sort_by, filter_query)
+
+
+#Server side paging, filtering and sorting of the issue tables. Only visible page
+#of the table cached on the server is sent to the browser
+def register_paged_table(table_id = '', key_store = 'tables-key'):
+    @app.callback(
+        Output(table_id, 'data'),
+        Output(table_id, 'page_count'),
+        Output(table_id, 'page_current'),
+        Input(table_id, 'page_current'),
+        Input(table_id, 'page_size'),
+        Input(table_id, 'sort_by'),
+        Input(table_id, 'filter_query'),
+        State(key_store, 'data'),
+        prevent_initial_call = True
+    )
+    @instrument(name = 'page ' + table_id)
+    def update_page(page_current, page_size, sort_by, filter_query, tables_key):
+        frame = get_table(tables_key, table_id)
+        if frame is None:
+            raise PreventUpdate
+        return table_page(frame, page_current, page_size, sort_by, filter_query)
+    return update_page
+
+for table_id in ['integrity-table', 'names-table', 'hierarchy-table', 'no-thresholds-table', 'no_thresholds-table',
+                 'fl-wo-sit-table', 'few-sit-fl-table', 'motor_wo_sit-table', 'other-w-sit-table',
+                 'disabled-table']:
+    register_paged_table(table_id)
+register_paged_table('node-issues-table', key_store = 'node-issues-key')
+register_paged_table('names-stat-table', key_store = 'stat-key')
 
 if __name__ == '__main__':
-    app.run_server(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
\ No newline at end of file
+    #Needed for worker processes of the audit in frozen executable
+    multiprocessing.freeze_support()
+    if SERVER_MODE == 'waitress':
+        #Production server on Windows: requests are handled by DB_SERVER_THREADS threads of one
+        #process, so the caches are shared by all users without DB_SHARED_CACHE_DIR
+        from waitress import serve
+        serve(server, host = '0.0.0.0', port = 8080, threads = SERVER_THREADS)
+    else:
+        app.run_server(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
\ No newline at end of file
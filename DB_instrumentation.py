@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# resource is available only on POSIX systems, psutil is optional and used
+# as a fallback (on Windows it provides peak working set of the process)
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Instrumentation can be switched off with environment variable DB_INSTRUMENTATION=0.
+# When it's disabled wrapped functions are called directly without any measurements.
+enabled = os.environ.get('DB_INSTRUMENTATION', '1') != '0'
+logger_name = ''
+_lock = threading.Lock()
+_aggregate = {}
+_process = psutil.Process() if (psutil is not None and resource is None) else None
+
+def configure(logger = '', enable = None):
+    #Setting logger which will receive structured records with measurements
+    global logger_name, enabled
+    logger_name = logger
+    if enable is not None:
+        enabled = enable
+
+def peak_rss():
+    #Peak resident set size of the process in bytes
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #Linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == 'darwin' else peak*1024
+    if _process is not None:
+        mem = _process.memory_info()
+        return getattr(mem, 'peak_wset', mem.rss)
+    return 0
+
+def count_rows(obj):
+    #Number of rows in the input or output of the check. None if it's not a table like object
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray, list, set)):
+        return len(obj)
+    if isinstance(obj, dict):
+        #Results of the checks are frequently dictionaries with tables inside
+        values = [count_rows(x) for x in obj.values()]
+        values = [x for x in values if x is not None]
+        return sum(values) if len(values) > 0 else len(obj)
+    return None
+
+def record(name = '', duration = 0.0, rows_in = None, rows_out = None, rss_delta = 0, failed = False):
+    #Writing measurement to the json log and to the in-process aggregate
+    log = logging.getLogger(logger_name)
+    log.info('Check finished', extra = {'check': name,
+                                        'duration_ms': round(duration*1000, 3),
+                                        'rows_in': rows_in,
+                                        'rows_out': rows_out,
+                                        'peak_rss_delta_kb': rss_delta//1024,
+                                        'failed': failed})
+    with _lock:
+        stat = _aggregate.setdefault(name, {'calls': 0, 'failed': 0, 'total_s': 0.0, 'max_s': 0.0,
+                                            'last_s': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                            'max_peak_rss_delta_kb': 0})
+        stat['calls'] += 1
+        stat['failed'] += int(failed)
+        stat['total_s'] += duration
+        stat['max_s'] = max(stat['max_s'], duration)
+        stat['last_s'] = duration
+        stat['rows_in'] += rows_in or 0
+        stat['rows_out'] += rows_out or 0
+        stat['max_peak_rss_delta_kb'] = max(stat['max_peak_rss_delta_kb'], rss_delta//1024)
+
+@contextmanager
+def measure(name = '', rows_in = None):
+    #Context manager for measuring a block of code. Number of output rows
+    #can be provided by setting 'rows_out' key of yielded dictionary
+    sample = {'rows_out': None}
+    if not enabled:
+        yield sample
+        return
+    rss_start = peak_rss()
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield sample
+    except Exception:
+        failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        record(name, duration, rows_in, sample['rows_out'], peak_rss() - rss_start, failed)
+
+def instrument(name = None):
+    #Decorator for checks and callbacks. Rows in are taken from the first table like argument
+    def decorator(func):
+        check_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            rows_in = None
+            for arg in list(args) + list(kwargs.values()):
+                rows_in = count_rows(arg)
+                if rows_in is not None:
+                    break
+            with measure(check_name, rows_in) as sample:
+                result = func(*args, **kwargs)
+                sample['rows_out'] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+def metrics_snapshot():
+    #Copy of the aggregated statistics with average duration of each check
+    with _lock:
+        snapshot = {name: dict(stat) for name, stat in _aggregate.items()}
+    for stat in snapshot.values():
+        stat['avg_s'] = stat['total_s']/stat['calls'] if stat['calls'] > 0 else 0.0
+    return {'enabled': enabled, 'checks': snapshot}
+
+def reset_metrics():
+    with _lock:
+        _aggregate.clear()
@@ -0,0 +1,145 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+import numpy as np
+
+# Load test of the dashboard. Each simulated user selects random customers one after another:
+# request of the statistics callback is sent as after selection in the dropdown, and the
+# hierarchy from its response is sent to the audit callback, as the browser does.
+# Callbacks are found in /_dash-dependencies, so the test works with any variant of the dashboard.
+# When the audit is a background callback (diskcache is installed), the first request only starts
+# the job. The job is polled until its result is ready, so the audit time includes the whole audit.
+# Example: python DB_load_test.py --url http://127.0.0.1:8080 --users 8 --rounds 3
+
+def get_json(url = '', payload = None, timeout = 600):
+    data = None if payload is None else json.dumps(payload).encode()
+    request = urllib.request.Request(url, data = data, headers = {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout = timeout) as response:
+        body = response.read()
+    #Empty response (204) is sent when the callback doesn't update anything
+    return json.loads(body) if body else None
+
+def update_component(url = '', payload = None, poll_interval = 0.5, timeout = 1800):
+    #Response of the callback. Background callback answers with cacheKey and job first,
+    #then the browser repeats the request with them until the result is in the response
+    response = get_json(url + '/_dash-update-component', payload)
+    if response is None or 'cacheKey' not in response:
+        return response
+    query = urllib.parse.urlencode({'cacheKey': response['cacheKey'], 'job': response['job']})
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        time.sleep(poll_interval)
+        response = get_json(url + '/_dash-update-component?' + query, payload)
+        if response is None or 'response' in response:
+            return response
+    raise TimeoutError(f'Background callback is not finished after {timeout} s')
+
+def find_callback(dependencies = [], input_id = '', output_id = ''):
+    #Callback triggered by the property 'id.property'. Cancel callbacks of background jobs
+    #have the same inputs, so the callback can also be found by one of its outputs
+    for callback in dependencies:
+        if output_id not in callback['output']:
+            continue
+        if any(x['id'] + '.' + x['property'] == input_id for x in callback['inputs']):
+            return callback
+    raise ValueError(f'No callback with input {input_id}')
+
+def find_options(layout = {}, component_id = ''):
+    #Options of the dropdown in the initial layout
+    if isinstance(layout, dict):
+        props = layout.get('props', {})
+        if props.get('id') == component_id:
+            return props.get('options', [])
+        children = list(layout.values())
+    elif isinstance(layout, list):
+        children = layout
+    else:
+        return None
+    for child in children:
+        options = find_options(child, component_id)
+        if options is not None:
+            return options
+    return None
+
+def callback_payload(callback = {}, values = {}):
+    #Request of the browser to the callback. values are {'id.property': value} of inputs and states
+    output = callback['output']
+    outputs = [dict(zip(['id', 'property'], x.rsplit('.', 1))) for x in output.strip('.').split('...')]
+    return {'output': output,
+            'outputs': outputs if output.startswith('..') else outputs[0],
+            'inputs': [dict(x, value = values.get(x['id'] + '.' + x['property'])) for x in callback['inputs']],
+            'state': [dict(x, value = values.get(x['id'] + '.' + x['property'])) for x in callback['state']],
+            'changedPropIds': [x['id'] + '.' + x['property'] for x in callback['inputs']]}
+
+def simulate_user(url = '', customers = [], rounds = 1, stat_callback = {}, issues_callback = {}, results = [], lock = None):
+    for _ in range(rounds):
+        customer = random.choice(customers)
+        try:
+            start = time.perf_counter()
+            response = update_component(url, callback_payload(stat_callback, {'customer-selection.value': customer}))
+            stat_time = time.perf_counter() - start
+            data = response['response'].get('db-data-memory', {}).get('data')
+            start = time.perf_counter()
+            update_component(url, callback_payload(issues_callback, {'db-data-memory.data': data, 'switches-input.value': [],
+                                                                     'customer-selection.value': customer}))
+            issues_time = time.perf_counter() - start
+            with lock:
+                results.append({'customer': customer, 'stat': stat_time, 'issues': issues_time, 'failed': False})
+        except Exception as e:
+            print(f'Request for {customer} failed: {e}')
+            with lock:
+                results.append({'customer': customer, 'stat': np.nan, 'issues': np.nan, 'failed': True})
+
+def summary(values = []):
+    values = np.asarray(values, dtype = float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return 'no successful requests'
+    return (f'median {np.median(values):.2f} s, p95 {np.percentile(values, 95):.2f} s, '
+            f'max {values.max():.2f} s')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Concurrent users selecting customers in the dashboard')
+    parser.add_argument('--url', default = 'http://127.0.0.1:8080')
+    parser.add_argument('--users', type = int, default = 4, help = 'number of concurrent users')
+    parser.add_argument('--rounds', type = int, default = 3, help = 'customers selected by each user')
+    parser.add_argument('--customers', default = '', help = 'comma separated short names, all customers by default')
+    args = parser.parse_args()
+    url = args.url.rstrip('/')
+
+    dependencies = get_json(url + '/_dash-dependencies')
+    stat_callback = find_callback(dependencies, 'customer-selection.value', 'db-data-memory.data')
+    issues_callback = find_callback(dependencies, 'db-data-memory.data')
+    if args.customers:
+        customers = args.customers.split(',')
+    else:
+        customers = [x['value'] for x in find_options(get_json(url + '/_dash-layout'), 'customer-selection') or []]
+    if len(customers) == 0:
+        print('No customers to select')
+        return 1
+
+    results = []
+    lock = threading.Lock()
+    users = [threading.Thread(target = simulate_user,
+                              args = (url, customers, args.rounds, stat_callback, issues_callback, results, lock))
+             for _ in range(args.users)]
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    total = time.perf_counter() - start
+
+    failed = sum(x['failed'] for x in results)
+    print(f'{len(results)} customer selections by {args.users} users in {total:.2f} s, {failed} failed')
+    print('Statistics: ' + summary([x['stat'] for x in results]))
+    print('Audit:      ' + summary([x['issues'] for x in results]))
+    return 1 if failed > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
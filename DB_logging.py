@@ -0,0 +1,35 @@
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+from itertools import islice
+import json_log_formatter
+
+# Logging of names lists. By default only number of names and a bounded sample
+# is written to the log. Full lists can be enabled with DB_LOG_FULL_NAMES=1 for debugging.
+LOG_SAMPLE_SIZE = int(os.environ.get('DB_LOG_SAMPLE_SIZE', '20'))
+LOG_FULL_NAMES = os.environ.get('DB_LOG_FULL_NAMES', '0') == '1'
+
+def names_sample(names = [], limit = None):
+    #Structure for 'extra' of log records: number of names plus first names of the list
+    if limit is None:
+        limit = LOG_SAMPLE_SIZE
+    if LOG_FULL_NAMES:
+        return {'count': len(names), 'names': list(names)}
+    return {'count': len(names), 'sample': list(islice(names, limit))}
+
+def setup_json_logger(log_name = '', log_dir = '/var/log/', level = logging.INFO):
+    #Logger writes records to the queue. Formatting to json and writing to the file
+    #is done by listener in separate thread so checks never wait for file I/O
+    json_handler = logging.FileHandler(filename = log_dir + log_name + '.json')
+    json_handler.setFormatter(json_log_formatter.JSONFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, json_handler, respect_handler_level = True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(log_name)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    return logger
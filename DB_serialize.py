@@ -0,0 +1,89 @@
+import os
+import json
+import zlib
+import base64
+import numpy as np
+import pandas as pd
+
+# orjson is optional. It's much faster than json module, serializes numpy arrays without
+# conversion to lists and writes NaN as null. Without it json module is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Frames kept in dcc.Store travel to the browser and back with each callback, so they are
+# sent as column lists instead of {column: {index: value}} of DataFrame.to_dict().
+# With DB_STORE_COMPRESSION=1 (default) the columns are compressed with zlib and sent as
+# base64 text. DB_STORE_COMPRESSION_LEVEL is level of zlib (1 - fast, 9 - small).
+STORE_COMPRESSION = os.environ.get('DB_STORE_COMPRESSION', '1') == '1'
+STORE_COMPRESSION_LEVEL = int(os.environ.get('DB_STORE_COMPRESSION_LEVEL', '1'))
+
+def column_values(values = pd.Series(dtype = object), numpy = False):
+    #Values of the column for json. Missing values are None. Numeric columns are left
+    #as numpy arrays when encoder supports them
+    if values.dtype.kind in 'biu':
+        return values.to_numpy() if numpy else values.tolist()
+    if values.dtype.kind == 'f':
+        if numpy:
+            return values.to_numpy()
+        result = values.to_numpy(dtype = object, copy = True)
+        result[np.isnan(values.to_numpy())] = None
+        return result.tolist()
+    result = values.to_numpy(dtype = object, copy = True)
+    result[pd.isna(values).to_numpy()] = None
+    return result.tolist()
+
+def dumps(obj = None):
+    #Compact json as bytes. NaN is written as null, unknown types as text
+    if orjson is not None:
+        return orjson.dumps(obj, default = str, option = orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default = str, separators = (',', ':')).encode()
+
+def loads(data = b''):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def restore_dtype(values = pd.Series(dtype = object), dtype = 'object'):
+    #Column with the type it had before serialization (categorical, downcasted numbers).
+    #Values which can't be converted are left as they are
+    if dtype == 'object' or str(values.dtype) == dtype:
+        return values
+    try:
+        return values.astype(dtype)
+    except (TypeError, ValueError):
+        return values
+
+def frame_to_store(frame = pd.DataFrame(), compress = None):
+    #Payload of dcc.Store with the frame. Types of the columns are sent too, so the frame
+    #is restored with the same memory efficient types
+    if compress is None:
+        compress = STORE_COMPRESSION
+    columns = [str(x) for x in frame.columns]
+    dtypes = [str(x) for x in frame.dtypes]
+    if not compress:
+        return {'format': 'columns',
+                'columns': columns,
+                'dtypes': dtypes,
+                'data': [column_values(frame[x]) for x in frame.columns]}
+    data = dumps([column_values(frame[x], numpy = orjson is not None) for x in frame.columns])
+    return {'format': 'columns-zlib',
+            'columns': columns,
+            'dtypes': dtypes,
+            'data': base64.b64encode(zlib.compress(data, STORE_COMPRESSION_LEVEL)).decode('ascii')}
+
+def frame_from_store(payload = None):
+    #Frame from payload of dcc.Store. Payloads of DataFrame.to_dict() are also accepted
+    if payload is None:
+        return None
+    if payload.get('format') == 'columns':
+        data = payload['data']
+    elif payload.get('format') == 'columns-zlib':
+        data = loads(zlib.decompress(base64.b64decode(payload['data'])))
+    else:
+        return pd.DataFrame(payload)
+    frame = pd.DataFrame(dict(zip(payload['columns'], data)), columns = payload['columns'])
+    for col, dtype in zip(payload['columns'], payload.get('dtypes', [])):
+        frame[col] = restore_dtype(frame[col], dtype)
+    return frame
@@ -0,0 +1,159 @@
+import os
+import re
+import math
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from DB_cache import get_shared, set_shared
+
+# Issue tables are kept on the server and DataTables receive only the visible page.
+# Frames of one audit are stored under one key, the key is kept in dcc.Store in the browser.
+# Only DB_TABLES_CACHE_SIZE last audits are kept, the oldest ones are evicted.
+# Tables of the Stat tab are kept separately (DB_STAT_TABLES_CACHE_SIZE customers) under keys
+# of stat_tables_key, so selecting customers never evicts tables of the open audit.
+# Subtree tables of the selected nodes are kept separately too (DB_NODE_TABLES_CACHE_SIZE).
+# With shared cache (DB_SHARED_CACHE_DIR) tables are also written to disk, so page
+# requests can be served by any worker process of the server.
+TABLES_CACHE_SIZE = int(os.environ.get('DB_TABLES_CACHE_SIZE', '16'))
+STAT_TABLES_CACHE_SIZE = int(os.environ.get('DB_STAT_TABLES_CACHE_SIZE', '16'))
+NODE_TABLES_CACHE_SIZE = int(os.environ.get('DB_NODE_TABLES_CACHE_SIZE', '64'))
+
+_lock = threading.Lock()
+_tables = {'audit': OrderedDict(), 'stat': OrderedDict(), 'node': OrderedDict()}
+_limits = {'audit': TABLES_CACHE_SIZE, 'stat': STAT_TABLES_CACHE_SIZE, 'node': NODE_TABLES_CACHE_SIZE}
+
+# Operators of DataTable filter query: {column} operator value.
+# Prefix i/s of the operator is case insensitive/sensitive version of it
+_filter_part = re.compile(r'^\{(?P<column>[^}]*)\}\s*(?P<case>[is]?)(?P<operator>contains|datestartswith|eq|ne|lt|le|gt|ge|>=|<=|!=|=|<|>|is blank|is not blank|is nil|is not nil)\s*(?P<value>.*)$')
+_symbols = {'=': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}
+
+def store_tables(tables = {}, key = None, group = 'audit'):
+    #Storing frames {table_id: data frame} of the audit. Returns key of the audit.
+    #New keys of other groups start with the name of the group
+    if key is None:
+        key = uuid.uuid4().hex if group == 'audit' else group + '-' + uuid.uuid4().hex
+    for table_id, frame in tables.items():
+        set_shared(('tables', key, table_id), frame)
+    _remember(key, tables)
+    return key
+
+def stat_tables_key(cache_key = ()):
+    #Key of the Stat tab tables of the customer: the same for the same customer and version of the data
+    return 'stat-' + hashlib.sha1(repr(tuple(cache_key)).encode()).hexdigest()
+
+def _group(key = None):
+    group = key.split('-')[0] if isinstance(key, str) else 'audit'
+    return group if group in _tables else 'audit'
+
+def _remember(key = None, tables = {}):
+    with _lock:
+        cache = _tables[_group(key)]
+        cache.setdefault(key, {}).update(tables)
+        cache.move_to_end(key)
+        while len(cache) > _limits[_group(key)]:
+            cache.popitem(last = False)
+
+def get_table(key = None, table_id = ''):
+    #Frame of the table or None if the audit was evicted from the cache.
+    #Tables stored by other worker processes are taken from the shared cache
+    with _lock:
+        cache = _tables[_group(key)]
+        if key in cache and table_id in cache[key]:
+            cache.move_to_end(key)
+            return cache[key][table_id]
+    frame = get_shared(('tables', key, table_id))
+    if frame is not None:
+        _remember(key, {table_id: frame})
+    return frame
+
+def _filter_value(value):
+    #Value of the filter: quoted string or number
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1]
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def filter_frame(frame = pd.DataFrame(), filter_query = ''):
+    #Translating filter query of DataTable to vectorized pandas mask
+    if not filter_query:
+        return frame
+    mask = np.ones(len(frame), dtype = bool)
+    for part in filter_query.split(' && '):
+        match = _filter_part.match(part.strip())
+        if match is None or match.group('column') not in frame.columns:
+            continue
+        column = frame[match.group('column')]
+        operator = _symbols.get(match.group('operator'), match.group('operator'))
+        value = _filter_value(match.group('value'))
+        #Filters are case sensitive as in DataTable, i prefix makes them case insensitive
+        case = match.group('case') != 'i'
+        if operator in ['is blank', 'is nil']:
+            mask &= column.isna().to_numpy() | (column.astype(str).str.strip() == '').to_numpy()
+            continue
+        if operator in ['is not blank', 'is not nil']:
+            mask &= column.notna().to_numpy() & (column.astype(str).str.strip() != '').to_numpy()
+            continue
+        if operator in ['contains', 'datestartswith']:
+            text = column.astype(str)
+            value = str(value) if not (isinstance(value, float) and value.is_integer()) else str(int(value))
+            if operator == 'contains':
+                mask &= text.str.contains(value, case = case, regex = False).fillna(False).to_numpy(dtype = bool)
+            elif case:
+                mask &= text.str.startswith(value).fillna(False).to_numpy(dtype = bool)
+            else:
+                mask &= text.str.lower().str.startswith(value.lower()).fillna(False).to_numpy(dtype = bool)
+            continue
+        #Comparison is numeric for numbers and text comparison for strings
+        if isinstance(value, float):
+            values = pd.to_numeric(column, errors = 'coerce')
+        else:
+            values = column.astype(str)
+            if not case:
+                values = values.str.lower()
+                value = value.lower()
+        compare = {'eq': values == value, 'ne': values != value, 'lt': values < value,
+                   'le': values <= value, 'gt': values > value, 'ge': values >= value}[operator]
+        mask &= compare.fillna(False).to_numpy(dtype = bool)
+    return frame[mask]
+
+def sort_frame(frame = pd.DataFrame(), sort_by = []):
+    #Sorting by columns selected in DataTable. Columns with mixed types are sorted as text
+    sort_by = [x for x in (sort_by or []) if x['column_id'] in frame.columns]
+    if len(sort_by) == 0:
+        return frame
+    columns = [x['column_id'] for x in sort_by]
+    ascending = [x['direction'] == 'asc' for x in sort_by]
+    try:
+        return frame.sort_values(columns, ascending = ascending, kind = 'stable', na_position = 'last')
+    except TypeError:
+        return frame.sort_values(columns, ascending = ascending, kind = 'stable', na_position = 'last',
+                                 key = lambda x: x.astype(str))
+
+def table_page(frame = pd.DataFrame(), page_current = 0, page_size = 15, sort_by = [], filter_query = ''):
+    #Visible page of the table after filtering and sorting. Returns (records, page_count, page_current).
+    #Page is moved to the last one when the frame became shorter (filter, major issues only)
+    frame = sort_frame(filter_frame(frame, filter_query), sort_by)
+    page_count = max(1, math.ceil(len(frame)/page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    page = frame.iloc[page_current*page_size:(page_current + 1)*page_size]
+    return page.to_dict('records'), page_count, page_current
+
+def page_props(frame = pd.DataFrame(), page_size = 15):
+    #Properties of DataTable with server side paging, filtering and sorting. First page
+    #is sent with the table, next pages are requested by the page callback
+    data, page_count, _ = table_page(frame, page_size = page_size)
+    return {'data': data,
+            'page_count': page_count,
+            'page_current': 0,
+            'page_size': page_size,
+            'page_action': 'custom',
+            'filter_action': 'custom',
+            'filter_query': '',
+            'sort_action': 'custom',
+            'sort_by': []}
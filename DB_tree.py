@@ -0,0 +1,148 @@
+import logging
+import numpy as np
+import pandas as pd
+from DB_logging import names_sample
+
+# Queries on the hierarchy (TREEELEMID/PARENTID relation).
+# Each node gets entry and exit index of depth first traversal (Euler tour), so node B
+# is inside subtree of node A when entry[A] <= entry[B] < exit[A]. Ancestors are found
+# with binary lifting table: up[k][node] is ancestor of the node 2**k levels above.
+# Index is built once in linear time and all the queries work with numpy arrays.
+
+def build_tree_index(treelem = pd.DataFrame(),
+                     logger = ''):
+    # Setting logger
+    log = logging.getLogger(logger)
+
+    ids = treelem.TREEELEMID.to_numpy()
+    n = len(ids)
+    rows = np.arange(n)
+    #Position of each id in the frame. For duplicated ids only first node is used
+    position = pd.Series(rows, index = ids)
+    position = position[~position.index.duplicated()]
+    parent = treelem.PARENTID.map(position).fillna(-1).to_numpy().astype(np.int64)
+    #Nodes without parent in the hierarchy (root, orphans) are roots of the index
+    parent[parent == rows] = -1
+    parent_or_self = np.where(parent >= 0, parent, rows)
+
+    #Depth of the nodes level by level starting from the roots
+    depth = np.full(n, -1, dtype = np.int64)
+    depth[parent < 0] = 0
+    level = 0
+    while True:
+        next_level = (depth < 0) & (depth[parent_or_self] == level)
+        if not next_level.any():
+            break
+        level += 1
+        depth[next_level] = level
+    unreachable = depth < 0
+    if unreachable.any():
+        #Nodes in cycles and their children can't be reached from any root
+        log.warning('%s nodes are not reachable from the root of the hierarchy.', int(unreachable.sum()), extra = {'Node ID': names_sample(list(ids[unreachable]))})
+    max_depth = int(depth.max()) if n > 0 else 0
+
+    #Size of each subtree, accumulated from the deepest level to the roots
+    size = np.where(unreachable, 0, 1).astype(np.int64)
+    for level in range(max_depth, 0, -1):
+        children = np.flatnonzero(depth == level)
+        size += np.bincount(parent[children], weights = size[children], minlength = n).astype(np.int64)
+
+    #Entry index: children of the node are placed one after another after the node itself.
+    #Offset of the child is sum of the sizes of previous children of the same parent
+    entry = np.full(n, -1, dtype = np.int64)
+    roots = np.flatnonzero(depth == 0)
+    entry[roots] = np.cumsum(size[roots]) - size[roots]
+    for level in range(1, max_depth + 1):
+        children = np.flatnonzero(depth == level)
+        children = children[np.argsort(parent[children], kind = 'stable')]
+        before = np.cumsum(size[children]) - size[children]
+        first = np.r_[True, parent[children][1:] != parent[children][:-1]] if len(children) > 0 else np.array([], dtype = bool)
+        group_start = before[np.flatnonzero(first)][np.cumsum(first) - 1]
+        entry[children] = entry[parent[children]] + 1 + before - group_start
+    exit = np.where(unreachable, -1, entry + size)
+
+    #Nodes in the order of traversal. Unreachable nodes are not included
+    order = np.full(int(size[roots].sum()), -1, dtype = np.int64)
+    order[entry[~unreachable]] = rows[~unreachable]
+
+    #Binary lifting table. Roots are ancestors of themselves
+    up = [parent_or_self]
+    for k in range(1, max(max_depth, 1).bit_length()):
+        up.append(up[-1][up[-1]])
+
+    log.info('Tree index is created for %s nodes with depth %s', n, max_depth)
+    return {'ids': ids,
+            'position': position,
+            'parent': parent,
+            'depth': depth,
+            'entry': entry,
+            'exit': exit,
+            'order': order,
+            'up': up}
+
+def node_rows(index = {}, node_ids = []):
+    #Rows of the nodes in the index, -1 for unknown ids
+    return pd.Series(np.asarray(node_ids)).map(index['position']).fillna(-1).to_numpy().astype(np.int64)
+
+def subtree_mask(index = {}, node_id = None):
+    #Boolean mask of all the nodes in the subtree of the node (node itself included)
+    row = node_rows(index, [node_id])[0]
+    if row < 0 or index['entry'][row] < 0:
+        return np.zeros(len(index['ids']), dtype = bool)
+    return (index['entry'] >= index['entry'][row]) & (index['entry'] < index['exit'][row])
+
+def subtree_ids(index = {}, node_id = None):
+    #Ids of all the nodes in the subtree in the order of traversal
+    row = node_rows(index, [node_id])[0]
+    if row < 0 or index['entry'][row] < 0:
+        return []
+    return list(index['ids'][index['order'][index['entry'][row]:index['exit'][row]]])
+
+def in_subtree(index = {}, node_ids = [], root_id = None):
+    #Vectorized check that nodes are inside subtree of root_id
+    row = node_rows(index, [root_id])[0]
+    rows = node_rows(index, node_ids)
+    if row < 0 or index['entry'][row] < 0:
+        return np.zeros(len(rows), dtype = bool)
+    entry = np.where(rows >= 0, index['entry'][rows], -1)
+    return (entry >= index['entry'][row]) & (entry < index['exit'][row])
+
+def kth_ancestor_rows(index = {}, rows = [], k = 1):
+    #Rows of ancestors k levels above the nodes. -1 when node is higher than k levels
+    rows = np.asarray(rows, dtype = np.int64)
+    k = np.broadcast_to(np.asarray(k, dtype = np.int64), rows.shape)
+    valid = (rows >= 0) & (k >= 0)
+    valid[valid] = index['depth'][rows[valid]] >= k[valid]
+    result = np.where(valid, rows, 0)
+    for bit, up in enumerate(index['up']):
+        jump = valid & (((k >> bit) & 1) == 1)
+        result[jump] = up[result[jump]]
+    return np.where(valid, result, -1)
+
+def ancestors(index = {}, node_ids = [], k = 1):
+    #Ids of ancestors k levels above the nodes (k = 1 is parent). None if there is no such ancestor
+    result = kth_ancestor_rows(index, node_rows(index, node_ids), k)
+    values = index['ids'][np.maximum(result, 0)].astype(object)
+    values[result < 0] = None
+    return values
+
+def ancestor_at_depth(index = {}, node_ids = [], depth = 1):
+    #Ids of ancestors located at the depth of the tree (root has depth 0)
+    rows = node_rows(index, node_ids)
+    node_depth = np.where(rows >= 0, index['depth'][np.maximum(rows, 0)], -1)
+    result = kth_ancestor_rows(index, np.where(node_depth >= depth, rows, -1), node_depth - depth)
+    values = index['ids'][np.maximum(result, 0)].astype(object)
+    values[result < 0] = None
+    return values
+
+def subtree_sums(index = {}, values = []):
+    #Sum of the values over subtree of each node (node itself included) in linear time.
+    #Subtree is continuous interval in the order of traversal, so sum is a difference
+    #of two prefix sums. values can be one column or 2D array with column per counter
+    values = np.asarray(values)
+    ordered = values[index['order']]
+    prefix = np.concatenate([np.zeros((1,) + values.shape[1:], dtype = ordered.dtype), np.cumsum(ordered, axis = 0)])
+    reachable = index['entry'] >= 0
+    sums = np.zeros(values.shape, dtype = prefix.dtype)
+    sums[reachable] = prefix[index['exit'][reachable]] - prefix[index['entry'][reachable]]
+    return sums
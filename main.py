@@ -3,9 +3,17 @@ from selenium import webdriver
 import subprocess
 import sys
 import os
-import threading as thr
+import urllib.request
 import chromedriver_autoinstaller
 
+# Address of the dash app and its health route
+URL = "http://127.0.0.1:8080/"
+HEALTH_URL = URL + "health"
+# Seconds to wait for the server to answer the health route
+READY_TIMEOUT = float(os.environ.get('DB_READY_TIMEOUT', '60'))
+# Number of restarts of crashed server before the launcher gives up
+MAX_RESTARTS = int(os.environ.get('DB_MAX_RESTARTS', '3'))
+
 # Kill the server if a dash app is already running
 def kill_server():
     subprocess.run("lsof -t -i tcp:8080 | xargs kill -9", shell=True)
@@ -14,17 +22,42 @@ def start_dash_app_frozen():
     path_dir = str(os.path.dirname(sys.executable))
     path_dir = path_dir.replace(os.sep, '/')
     print(path_dir)
-    subprocess.Popen(path_dir+"/DB_Dashboard_exec/DB_Dashboard_exec.exe", shell=False)
+    return subprocess.Popen(path_dir+"/DB_Dashboard_exec/DB_Dashboard_exec.exe", shell=False)
+# Polling health route until server answers. Returns False on timeout or if server process exited
+def wait_until_ready(process, timeout = READY_TIMEOUT):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            print(f"Server exited with code {process.returncode} before it was ready")
+            return False
+        try:
+            with urllib.request.urlopen(HEALTH_URL, timeout = 1) as response:
+                if response.status == 200:
+                    print(f"Server is ready in {time.perf_counter() - start:.2f} s")
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.1)
+    print(f"Server is not ready after {timeout} s")
+    return False
+# Starting server and waiting until it's ready. Failed start is repeated MAX_RESTARTS times.
+# Started process is kept in server['process'] at once, so it's stopped also on interruption
+def start_server(server):
+    for attempt in range(MAX_RESTARTS + 1):
+        kill_server() # kill open server on port
+        server['process'] = start_dash_app_frozen() # start dash app on port
+        if wait_until_ready(server['process']):
+            return True
+        stop(server['process'], None)
+    server['process'] = None
+    return False
 # Start the driver
 def start_driver():
     chromedriver_autoinstaller.install()
     driver = webdriver.Chrome()
-    time.sleep(3) # give dash app time to start running
-    driver.get("http://127.0.0.1:8080/") # go to the local server
-    save_browser_session(driver) # save the browser identity info for giving future instructions to the browser (for instance opening up a new browser tab). 
-    while True:
-        time.sleep(60)
-        print("Next run for 60 seconds")
+    driver.get(URL) # go to the local server
+    save_browser_session(driver) # save the browser identity info for giving future instructions to the browser (for instance opening up a new browser tab).
+    return driver
 # Function to save browser session info
 def save_browser_session(input_driver):
     driver = input_driver
@@ -37,17 +70,53 @@ def save_browser_session(input_driver):
         f.write("\n")
         f.write(session_id)
     print("DRIVER SAVED IN TEXT FILE browsersession.txt")
-# Infinite while loop to keep server running
-def keep_server_running():
+# Waiting for the server process and restarting it after crash. server['process'] is always
+# the current process. Returns True when server stopped normally or False when restarts are exhausted
+def supervise(server, driver):
+    restarts = 0
     while True:
-        time.sleep(60)
-        print("Next run for 60 seconds")
+        code = server['process'].wait()
+        if code == 0:
+            print("Server stopped")
+            return True
+        if restarts >= MAX_RESTARTS:
+            print(f"Server crashed with code {code}, no restarts left")
+            return False
+        restarts += 1
+        print(f"Server crashed with code {code}, restart {restarts} of {MAX_RESTARTS}")
+        if not start_server(server):
+            return False
+        try:
+            driver.refresh()
+        except Exception:
+            #Browser was closed by the user, the server is still available
+            pass
+# Stopping server and browser
+def stop(process, driver):
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout = 10)
+        except subprocess.TimeoutExpired:
+            process.kill()
 # Putting everything together in a function
 def main():
-    kill_server() # kill open server on port
-    thread = thr.Thread(target=start_dash_app_frozen) 
-    thread.start() # start dash app on port
-    start_driver() # start selenium controled chrome browser and go to port
-    keep_server_running() # keep the main file running with a loop
+    #Process of the server is replaced after restart, so it's kept in the dict shared with supervise
+    server = {'process': None}
+    driver = None
+    try:
+        if not start_server(server):
+            return 1
+        driver = start_driver() # browser is opened only when the server answers
+        return 0 if supervise(server, driver) else 1 # keep the server running while it's needed
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        stop(server['process'], driver)
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
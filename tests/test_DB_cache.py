@@ -0,0 +1,89 @@
+import time
+import threading
+import pytest
+import DB_cache
+from DB_cache import single_flight, compute_heavy
+
+def run_together(count = 5, target = None):
+    #Starting the calls at once and collecting their results
+    results = []
+    errors = []
+    barrier = threading.Barrier(count)
+    def call():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target = call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+def slow(result = None, calls = []):
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return result
+    return compute
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+    results, errors = run_together(5, lambda: single_flight(('customer', 1), slow({'tables': 1}, calls)))
+    assert errors == []
+    assert results == [{'tables': 1}]*5
+    assert len(calls) == 1
+
+def test_none_result_is_shared():
+    calls = []
+    results, errors = run_together(5, lambda: single_flight(('customer', 2), slow(None, calls)))
+    assert errors == []
+    assert results == [None]*5
+    assert len(calls) == 1
+
+def test_different_keys_are_computed_separately():
+    calls = []
+    keys = iter(range(4))
+    lock = threading.Lock()
+    def call():
+        with lock:
+            key = next(keys)
+        return single_flight(('customer', 'other', key), slow(key, calls))
+    results, errors = run_together(4, call)
+    assert sorted(results) == [0, 1, 2, 3]
+    assert len(calls) == 4
+
+def test_failed_computation_is_repeated_by_waiting_calls():
+    calls = []
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        if len(calls) == 1:
+            raise ValueError('Broken audit')
+        return 'done'
+    results, errors = run_together(3, lambda: single_flight(('customer', 3), compute))
+    assert [str(x) for x in errors] == ['Broken audit']
+    assert results == ['done', 'done']
+    assert len(calls) == 2
+    assert DB_cache._flights == {}
+
+def test_heavy_computations_are_limited(monkeypatch):
+    monkeypatch.setattr(DB_cache, '_heavy', threading.BoundedSemaphore(2))
+    running = [0]
+    peak = [0]
+    lock = threading.Lock()
+    def compute():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return True
+    results, errors = run_together(6, lambda: compute_heavy(compute))
+    assert results == [True]*6
+    assert peak[0] == 2
+    with pytest.raises(ValueError):
+        single_flight(('customer', 4), lambda: int('x'), heavy = True)
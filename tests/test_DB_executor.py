@@ -0,0 +1,77 @@
+import sys
+import pickle
+import subprocess
+import pytest
+import numpy as np
+import pandas as pd
+import DB_executor
+from DB_executor import run_checks, start_checks, share_frame, attach_frame, release_frame, SHARED_FRAME
+
+def hierarchy():
+    return pd.DataFrame({'TREEELEMID': np.arange(1, 7, dtype = np.int32),
+                         'PARENTID': np.array([0, 1, 1, 2, 2, 3], dtype = np.int32),
+                         'NAME': pd.Categorical(['Root', 'FL', 'FL', '01HV', '01HA', None]),
+                         'FilterKey': ['*Motor', None, '*Fan', None, None, '*Motor'],
+                         'DANGERHI': np.array([np.nan, 1.5, 2.0, np.nan, 7.1, 0.5], dtype = np.float32)})
+
+def count_motors(treelem = pd.DataFrame(), logger = ''):
+    return int((treelem.FilterKey == '*Motor').sum())
+
+def children_of(treelem = pd.DataFrame(), parent = 0, logger = ''):
+    return treelem.loc[treelem.PARENTID == parent, 'TREEELEMID'].tolist()
+
+def broken_check(treelem = pd.DataFrame(), logger = ''):
+    raise ValueError('Broken check')
+
+def checks():
+    return {'motors': (count_motors, {'treelem': SHARED_FRAME}),
+            'children': (children_of, {'treelem': SHARED_FRAME, 'parent': 1})}
+
+def test_shared_frame_is_the_same_frame():
+    treelem = hierarchy()
+    handle, blocks = share_frame(treelem)
+    try:
+        attached = attach_frame(handle)
+        pd.testing.assert_frame_equal(attached, treelem, check_dtype = False)
+        assert isinstance(attached.NAME.dtype, pd.CategoricalDtype)
+        assert attached.DANGERHI.dtype == np.float32
+        #Workers can't change the shared hierarchy
+        assert not attached.DANGERHI.to_numpy().flags.writeable
+    finally:
+        DB_executor._attached.clear()
+        release_frame(blocks)
+
+def test_workers_give_the_same_results(monkeypatch):
+    treelem = hierarchy()
+    monkeypatch.setattr(DB_executor, 'AUDIT_WORKERS', 0)
+    expected = run_checks(treelem = treelem, checks = checks())
+    monkeypatch.setattr(DB_executor, 'AUDIT_WORKERS', 2)
+    try:
+        finished = []
+        results = run_checks(treelem = treelem, checks = checks(), progress = lambda name, result: finished.append(name))
+    finally:
+        DB_executor.shutdown_pool()
+    assert expected == {'motors': 2, 'children': [2, 3]}
+    assert results == expected
+    assert sorted(finished) == ['children', 'motors']
+
+def test_start_checks_waits_for_selected_checks(monkeypatch):
+    monkeypatch.setattr(DB_executor, 'AUDIT_WORKERS', 0)
+    wait = start_checks(treelem = hierarchy(), checks = checks())
+    assert wait('motors')['motors'] == 2
+    assert wait('motors', 'children') == {'motors': 2, 'children': [2, 3]}
+
+def test_failed_check_is_raised(monkeypatch):
+    monkeypatch.setattr(DB_executor, 'AUDIT_WORKERS', 0)
+    wait = start_checks(treelem = hierarchy(), checks = {'broken': (broken_check, {'treelem': SHARED_FRAME})})
+    with pytest.raises(ValueError, match = 'Broken check'):
+        wait('broken')
+
+def test_checks_are_imported_without_the_dashboard():
+    #Workers unpickle the checks from DB_checks, which must not start the dashboard
+    import DB_checks
+    assert b'DB_checks' in pickle.dumps(DB_checks.check_motors)
+    code = 'import sys, DB_checks; print(sorted(x for x in ["dash", "flask", "DB_general"] if x in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True,
+                            cwd = DB_checks.__file__.rsplit('DB_checks', 1)[0] or '.')
+    assert result.stdout.strip() == '[]'
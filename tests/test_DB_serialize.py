@@ -0,0 +1,37 @@
+import json
+import pytest
+import numpy as np
+import pandas as pd
+import DB_serialize
+from DB_serialize import frame_to_store, frame_from_store
+
+def hierarchy():
+    #Types of load_treelems: categorical text, downcasted ids, flags and float32 thresholds
+    return pd.DataFrame({'TREEELEMID': np.array([1, 2, 3, 4], dtype = np.int16),
+                         'NAME': pd.Categorical(['Root', '01HV', None, '01HV']),
+                         'ELEMENTENABLE': np.array([1, 0, 1, 1], dtype = np.uint8),
+                         'DANGERHI': np.array([np.nan, 7.1, 4.5, np.nan], dtype = np.float32),
+                         'PointLocation': np.array([np.nan, 1, 2, np.nan], dtype = np.float64),
+                         'Path': ['', '/FL', None, '/FL/01HV']})
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip_keeps_values_and_types(compress):
+    treelem = hierarchy()
+    payload = frame_to_store(treelem, compress = compress)
+    #Payload goes through json of the browser
+    restored = frame_from_store(json.loads(json.dumps(payload)))
+    pd.testing.assert_frame_equal(restored, treelem)
+
+def test_round_trip_without_orjson(monkeypatch):
+    monkeypatch.setattr(DB_serialize, 'orjson', None)
+    treelem = hierarchy()
+    pd.testing.assert_frame_equal(frame_from_store(frame_to_store(treelem, compress = True)), treelem)
+
+def test_old_payloads():
+    treelem = pd.DataFrame({'TREEELEMID': [1, 2], 'NAME': ['Root', 'FL']})
+    assert frame_from_store(None) is None
+    pd.testing.assert_frame_equal(frame_from_store(treelem.to_dict()), treelem)
+    #Payload of columns without types is read with the default types
+    payload = frame_to_store(treelem, compress = False)
+    del payload['dtypes']
+    assert frame_from_store(payload).TREEELEMID.tolist() == [1, 2]
@@ -0,0 +1,57 @@
+import pandas as pd
+from DB_tables import filter_frame, sort_frame, table_page, page_props, store_tables, get_table, stat_tables_key
+
+def issues():
+    return pd.DataFrame({'TREEELEMID': [1, 2, 3, 4, 5],
+                         'NAME': ['01HV DE', '01ha de', 'MI SIT', None, '02HV NDE'],
+                         'Count': [5, 12, 1, 7, None]})
+
+def test_filter_operators():
+    frame = issues()
+    assert filter_frame(frame, '').equals(frame)
+    assert filter_frame(frame, '{NAME} contains HV').TREEELEMID.tolist() == [1, 5]
+    assert filter_frame(frame, '{NAME} icontains ha').TREEELEMID.tolist() == [2]
+    assert filter_frame(frame, '{NAME} contains ha').TREEELEMID.tolist() == [2]
+    assert filter_frame(frame, '{NAME} contains HA').TREEELEMID.tolist() == []
+    assert filter_frame(frame, '{NAME} datestartswith 01H').TREEELEMID.tolist() == [1]
+    assert filter_frame(frame, '{NAME} idatestartswith 01H').TREEELEMID.tolist() == [1, 2]
+    assert filter_frame(frame, '{Count} > 5').TREEELEMID.tolist() == [2, 4]
+    assert filter_frame(frame, '{Count} >= 5 && {NAME} contains HV').TREEELEMID.tolist() == [1]
+    assert filter_frame(frame, '{NAME} = "MI SIT"').TREEELEMID.tolist() == [3]
+    assert filter_frame(frame, '{NAME} is blank').TREEELEMID.tolist() == [4]
+    #Unknown columns are ignored as in DataTable
+    assert len(filter_frame(frame, '{Unknown} = 1')) == len(frame)
+
+def test_sort_puts_missing_values_last():
+    frame = issues()
+    assert sort_frame(frame, [{'column_id': 'Count', 'direction': 'desc'}]).TREEELEMID.tolist() == [2, 4, 1, 3, 5]
+    assert sort_frame(frame, [{'column_id': 'NAME', 'direction': 'asc'}]).TREEELEMID.tolist() == [1, 2, 5, 3, 4]
+
+def test_page_is_clamped_to_shorter_frame():
+    frame = pd.DataFrame({'TREEELEMID': range(40)})
+    data, page_count, page_current = table_page(frame, page_current = 2, page_size = 15)
+    assert (page_count, page_current) == (3, 2)
+    assert [x['TREEELEMID'] for x in data] == list(range(30, 40))
+    #Filter leaves one page, the page index is moved to it
+    data, page_count, page_current = table_page(frame, 2, 15, [], '{TREEELEMID} < 10')
+    assert (page_count, page_current, len(data)) == (1, 0, 10)
+    data, page_count, page_current = table_page(frame.iloc[:0], 3, 15)
+    assert (data, page_count, page_current) == ([], 1, 0)
+    assert page_props(frame)['page_count'] == 3
+
+def test_stat_tables_dont_evict_audits():
+    key = store_tables({'names-table': issues()})
+    for i in range(50):
+        store_tables({'names-stat-table': issues()}, key = stat_tables_key((f'customer {i}', 1, 2)))
+    assert get_table(key, 'names-table') is not None
+    assert stat_tables_key(('a', 1, 2)) == stat_tables_key(('a', 1, 2))
+    assert stat_tables_key(('a', 1, 2)) != stat_tables_key(('a', 1, 3))
+
+def test_node_tables_have_own_keys():
+    audit_key = store_tables({'tree-issues': issues()})
+    first = store_tables({'node-issues-table': issues().iloc[:1]}, group = 'node')
+    second = store_tables({'node-issues-table': issues().iloc[1:]}, group = 'node')
+    assert first.startswith('node-') and first != second
+    assert len(get_table(first, 'node-issues-table')) == 1
+    assert len(get_table(second, 'node-issues-table')) == 4
+    assert get_table(audit_key, 'node-issues-table') is None
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from DB_tree import (build_tree_index, node_rows, subtree_mask, subtree_ids, in_subtree,
+                     ancestors, ancestor_at_depth, subtree_sums)
+
+def random_tree(n = 300, seed = 0):
+    #Each node gets a random parent among previous nodes, ids are shuffled
+    rng = np.random.default_rng(seed)
+    parents = [0] + [int(rng.integers(0, i)) for i in range(1, n)]
+    ids = rng.permutation(np.arange(100, 100 + n))
+    return pd.DataFrame({'TREEELEMID': ids,
+                         'PARENTID': [0] + [ids[p] for p in parents[1:]]})
+
+def naive_parent(treelem):
+    parent = dict(zip(treelem.TREEELEMID, treelem.PARENTID))
+    return {x: (y if y in parent and y != x else None) for x, y in parent.items()}
+
+def naive_ancestor(parent, node, k):
+    for _ in range(k):
+        node = parent[node]
+        if node is None:
+            return None
+    return node
+
+def naive_depth(parent, node):
+    depth = 0
+    while parent[node] is not None:
+        node = parent[node]
+        depth += 1
+    return depth
+
+def naive_subtree(parent, root):
+    return {x for x in parent if any(naive_ancestor(parent, x, k) == root for k in range(naive_depth(parent, x) + 1))}
+
+def test_ancestors_as_naive_walk():
+    treelem = random_tree()
+    index = build_tree_index(treelem)
+    parent = naive_parent(treelem)
+    ids = treelem.TREEELEMID.tolist()
+    for k in [0, 1, 2, 3, 5, 8]:
+        assert list(ancestors(index, ids, k)) == [naive_ancestor(parent, x, k) for x in ids]
+    for depth in [0, 1, 3]:
+        expected = [naive_ancestor(parent, x, naive_depth(parent, x) - depth) if naive_depth(parent, x) >= depth else None for x in ids]
+        assert list(ancestor_at_depth(index, ids, depth)) == expected
+
+def test_subtrees_as_naive_walk():
+    treelem = random_tree()
+    index = build_tree_index(treelem)
+    parent = naive_parent(treelem)
+    ids = treelem.TREEELEMID.tolist()
+    for root in ids[::15]:
+        expected = naive_subtree(parent, root)
+        assert set(subtree_ids(index, root)) == expected
+        assert subtree_ids(index, root)[0] == root
+        assert set(treelem.TREEELEMID[subtree_mask(index, root)]) == expected
+        assert [x in expected for x in ids] == list(in_subtree(index, ids, root))
+
+def test_subtree_sums_as_naive_walk():
+    treelem = random_tree(n = 120, seed = 1)
+    index = build_tree_index(treelem)
+    parent = naive_parent(treelem)
+    values = np.arange(len(treelem))
+    position = dict(zip(treelem.TREEELEMID, range(len(treelem))))
+    sums = subtree_sums(index, values)
+    for node in treelem.TREEELEMID:
+        assert sums[position[node]] == sum(values[position[x]] for x in naive_subtree(parent, node))
+    #Several counters are summed at once
+    both = subtree_sums(index, np.column_stack([values, np.ones(len(values), dtype = int)]))
+    assert (both[:, 0] == sums).all()
+    assert both[0, 1] == len(treelem)
+
+def test_cycles_and_unknown_nodes():
+    #Nodes 5 and 6 are parents of each other, node 7 is under the cycle
+    treelem = pd.DataFrame({'TREEELEMID': [1, 2, 3, 5, 6, 7], 'PARENTID': [0, 1, 1, 6, 5, 6]})
+    index = build_tree_index(treelem)
+    assert list(index['entry'][node_rows(index, [5, 6, 7])]) == [-1, -1, -1]
+    assert subtree_ids(index, 5) == []
+    assert set(subtree_ids(index, 1)) == {1, 2, 3}
+    assert list(node_rows(index, [3, 42])) == [2, -1]
+    assert list(ancestors(index, [2, 42], 1)) == [1, None]